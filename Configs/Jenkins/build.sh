@@ -459,19 +459,56 @@ if [ $BUILD_RESULT -eq 0 ]; then
             echo "Created: $(stat -f "%Sm" -t "%Y-%m-%d %H:%M:%S" "$LATEST_BUILD" 2>/dev/null || date)"
             
             # Export build info for Jenkins
-            echo "LATEST_BUILD_FILE=$LATEST_BUILD" > "$WORKSPACE/build_info.properties"
-            echo "BUILD_SIZE=$(stat -f%z "$LATEST_BUILD")" >> "$WORKSPACE/build_info.properties"
-            echo "BUILD_DATE=$(date +%Y%m%d_%H%M%S)" >> "$WORKSPACE/build_info.properties"
-            echo "BUILD_TARGET=$BUILD_TARGET" >> "$WORKSPACE/build_info.properties"
-            echo "BUILD_TYPE=$BUILD_TYPE" >> "$WORKSPACE/build_info.properties"
-            echo "PLATFORM=$PLATFORM" >> "$WORKSPACE/build_info.properties"
-            echo "CONFIG=$CONFIG" >> "$WORKSPACE/build_info.properties"
-            echo "GIT_BRANCH=$GIT_BRANCH" >> "$WORKSPACE/build_info.properties"
-            echo "BUILD_REQUEST_ID=$BUILD_REQUEST_ID" >> "$WORKSPACE/build_info.properties"
-            echo "FILE_EXTENSION=$FILE_EXTENSION" >> "$WORKSPACE/build_info.properties"
+            # Ghi ra file tạm rồi mv (atomic) để bot không bao giờ đọc phải file viết dở
+            PROPS_TMP="$WORKSPACE/build_info.properties.tmp.$$"
+            echo "LATEST_BUILD_FILE=$LATEST_BUILD" > "$PROPS_TMP"
+            echo "BUILD_SIZE=$(stat -f%z "$LATEST_BUILD")" >> "$PROPS_TMP"
+            echo "BUILD_DATE=$(date +%Y%m%d_%H%M%S)" >> "$PROPS_TMP"
+            echo "BUILD_TARGET=$BUILD_TARGET" >> "$PROPS_TMP"
+            echo "BUILD_TYPE=$BUILD_TYPE" >> "$PROPS_TMP"
+            echo "PLATFORM=$PLATFORM" >> "$PROPS_TMP"
+            echo "CONFIG=$CONFIG" >> "$PROPS_TMP"
+            echo "GIT_BRANCH=$GIT_BRANCH" >> "$PROPS_TMP"
+            echo "BUILD_REQUEST_ID=$BUILD_REQUEST_ID" >> "$PROPS_TMP"
+            echo "FILE_EXTENSION=$FILE_EXTENSION" >> "$PROPS_TMP"
+            # Đường dẫn tương đối trong workspace để bot chạy trên máy khác tải file qua Jenkins (/ws/...)
+            echo "WORKSPACE_BUILD_FILE=${LATEST_BUILD#$WORKSPACE/}" >> "$PROPS_TMP"
+            mv -f "$PROPS_TMP" "$WORKSPACE/build_info.properties"
+
+            # Manifest để bot kiểm tra kích thước/SHA-256 trước khi gửi file (phát hiện file bị
+            # build khác ghi đè hoặc chưa ghi xong). Cũng ghi atomic qua file tạm.
+            APP_VERSION=$(grep -m1 'bundleVersion:' "$PROJECT_PATH/ProjectSettings/ProjectSettings.asset" 2>/dev/null | awk '{print $2}')
+            # Lỗi khi băm hoặc ghi manifest chỉ bỏ qua manifest (bot gửi file không kiểm tra),
+            # không làm hỏng build đã thành công (script chạy với set -e)
+            BUILD_SHA256=$(shasum -a 256 "$LATEST_BUILD" 2>/dev/null | awk '{print $1}') || BUILD_SHA256=""
+            if [ -n "$BUILD_SHA256" ]; then
+                MANIFEST_TMP="$WORKSPACE/build_manifest.json.tmp.$$"
+                # Giá trị được truyền qua argv và mã hóa bằng json.dump (đường dẫn/branch có thể chứa " hoặc \)
+                python3 -c '
+import json, sys
+path, workspace_path, size, sha256, target, version, build_number, build_request_id = sys.argv[1:]
+json.dump({
+    "path": path,
+    "workspace_path": workspace_path,
+    "size": int(size),
+    "sha256": sha256,
+    "target": target,
+    "version": version,
+    "build_number": build_number,
+    "build_request_id": build_request_id,
+}, sys.stdout, indent=2)
+' "$LATEST_BUILD" "${LATEST_BUILD#$WORKSPACE/}" "$(stat -f%z "$LATEST_BUILD")" "$BUILD_SHA256" \
+                  "$BUILD_TARGET" "$APP_VERSION" "$BUILD_NUMBER" "$BUILD_REQUEST_ID" > "$MANIFEST_TMP" \
+                    && mv -f "$MANIFEST_TMP" "$WORKSPACE/build_manifest.json" \
+                    || { echo "Warning: could not write build_manifest.json"; rm -f "$MANIFEST_TMP" "$WORKSPACE/build_manifest.json"; }
+            else
+                echo "Warning: could not hash $LATEST_BUILD, skipping build_manifest.json"
+                rm -f "$WORKSPACE/build_manifest.json"
+            fi
             
-            echo "--- Build info exported to build_info.properties ---"
+            echo "--- Build info exported to build_info.properties and build_manifest.json ---"
             cat "$WORKSPACE/build_info.properties"
+            [ -f "$WORKSPACE/build_manifest.json" ] && cat "$WORKSPACE/build_manifest.json" || true
             
             # Platform specific post-build info
             case "$BUILD_TARGET" in
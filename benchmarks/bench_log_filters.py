@@ -0,0 +1,112 @@
+# benchmarks/bench_log_filters.py
+# Đo số record/giây đi qua chuỗi bộ lọc (filter trên logger + filter trên handler)
+# với HTMLErrorFilter cũ và mới.
+# Chạy từ thư mục gốc của repo: python benchmarks/bench_log_filters.py
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_filters import HTMLErrorFilter
+
+
+# Bản sao nguyên văn của HTMLErrorFilter trước khi tối ưu (log_filters.py tại commit b3a90bd^),
+# chỉ đổi tên class, để số liệu so sánh phản ánh đúng cài đặt cũ.
+class LegacyHTMLErrorFilter(logging.Filter):
+    """Bộ lọc để làm sạch các thông báo lỗi HTML trong log."""
+    
+    def filter(self, record):
+        if hasattr(record, 'msg'):
+            # Kiểm tra nếu thông báo là chuỗi
+            if isinstance(record.msg, str):
+                # Kiểm tra các dấu hiệu của HTML
+                html_indicators = ["<html>", "</html>", "<body>", "</body>", "<head>", 
+                                  "<title>", "<!DOCTYPE", "<meta", "<tr>", "<td>", 
+                                  "<table>", "<h1>", "<h2>", "<h3>"]
+                
+                is_html = any(indicator.lower() in record.msg.lower() for indicator in html_indicators)
+                
+                if is_html:
+                    # Cố gắng trích xuất thông tin hữu ích từ HTML
+                    # 1. Thử lấy tiêu đề
+                    title_match = re.search(r'<title>(.*?)</title>', record.msg, re.IGNORECASE | re.DOTALL)
+                    if title_match:
+                        title = title_match.group(1).strip()
+                        record.msg = f"HTML Error: {title}"
+                    else:
+                        # 2. Thử lấy nội dung thẻ h1, h2, h3
+                        h_match = re.search(r'<h[1-3][^>]*>(.*?)</h[1-3]>', record.msg, re.IGNORECASE | re.DOTALL)
+                        if h_match:
+                            heading = h_match.group(1).strip()
+                            record.msg = f"HTML Error: {heading}"
+                        else:
+                            # 3. Thử lấy thông báo lỗi từ thẻ body
+                            body_match = re.search(r'<body[^>]*>(.*?)</body>', record.msg, re.IGNORECASE | re.DOTALL)
+                            if body_match:
+                                # Lấy text từ body và loại bỏ các thẻ HTML
+                                body_text = body_match.group(1)
+                                body_text = re.sub(r'<[^>]+>', ' ', body_text)
+                                body_text = re.sub(r'\s+', ' ', body_text).strip()
+                                if len(body_text) > 100:
+                                    body_text = body_text[:100] + "..."
+                                record.msg = f"HTML Error: {body_text}"
+                            else:
+                                # 4. Fallback: Hiển thị thông báo chung
+                                record.msg = "HTML Error received (content hidden)"
+                
+                # Kiểm tra các chuỗi lỗi HTTP phổ biến
+                http_error_match = re.search(r'HTTP ERROR (\d+)', record.msg, re.IGNORECASE)
+                if http_error_match:
+                    error_code = http_error_match.group(1)
+                    record.msg = f"HTTP Error {error_code} received"
+                
+                # Rút gọn thông báo lỗi quá dài
+                if len(record.msg) > 200:
+                    record.msg = record.msg[:200] + "... (truncated)"
+                    
+            # Nếu thông báo là exception
+            elif isinstance(record.msg, Exception):
+                # Chuyển đổi exception thành chuỗi và kiểm tra HTML
+                msg_str = str(record.msg)
+                if "<html>" in msg_str.lower() or "</html>" in msg_str.lower():
+                    record.msg = "HTML Error in exception (content hidden)"
+                elif len(msg_str) > 200:
+                    record.msg = f"{msg_str[:200]}... (truncated)"
+        
+        return True
+
+
+MESSAGES = [
+    "Received /build command from Alice (ID: 123) in group 'QA' (ID: -100123)",
+    "BACKGROUND TASK: Processing job=MegaRamps/Mobile, build_number=42, status=SUCCESS",
+    "HTTP Request: POST http://localhost:8081/bot123/sendMessage \"HTTP/1.1 200 OK\"",
+    "Jenkins API error: <html><head><title>Error 401 Unauthorized</title></head><body>...</body></html>",
+    "Jenkins returned HTTP ERROR 503 for /job/MegaRamps/api/json",
+]
+
+
+def run(filter_instance: logging.Filter, count: int) -> float:
+    """Cho record đi qua filter hai lần (logger rồi handler) như khi gắn ở cả hai nơi."""
+    records = [
+        logging.LogRecord("bench", logging.INFO, __file__, 0, MESSAGES[i % len(MESSAGES)], None, None)
+        for i in range(count)
+    ]
+    start = time.perf_counter()
+    for record in records:
+        filter_instance.filter(record)
+        filter_instance.filter(record)
+    return count / (time.perf_counter() - start)
+
+
+def main(count: int = 200_000) -> None:
+    legacy = run(LegacyHTMLErrorFilter(), count)
+    current = run(HTMLErrorFilter(), count)
+    print(f"legacy : {legacy:>12,.0f} records/sec")
+    print(f"current: {current:>12,.0f} records/sec ({current / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
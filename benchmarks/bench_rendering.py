@@ -0,0 +1,53 @@
+# benchmarks/bench_rendering.py
+# So sánh tốc độ escape MarkdownV2 cũ (generator join) với cài đặt trong rendering.py.
+# Chạy từ thư mục gốc của repo: python benchmarks/bench_rendering.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rendering
+
+
+def legacy_escape_markdown_v2(text: str) -> str:
+    """Cài đặt cũ trong handlers/build.py, handlers/setup.py và webhook/server.py."""
+    escape_chars = r'_*[]()~`>#+-=|{}.!'
+    return "".join(f"\\{char}" if char in escape_chars else char for char in text)
+
+
+def legacy_build_success(job_name, build_number, build_target, links):
+    return (
+        f"✅ *Build Succeeded\\!*\n\n"
+        f"*Job:* `{legacy_escape_markdown_v2(job_name)}`\n"
+        f"*Build:* `#{build_number}`\n"
+        f"*Target:* `{legacy_escape_markdown_v2(build_target)}`\n\n"
+        f"{links}"
+    )
+
+
+SAMPLES = {
+    "job path": "MegaRamps/Mobile-Build_v2.1",
+    "branch": "origin/feature/new-ui_(test)",
+    "error": "Jenkins returned HTTP 500 while calling /job/MegaRamps/job/Mobile-Build/build! " * 4,
+}
+
+
+def main(number: int = 100_000) -> None:
+    print(f"{'case':<14}{'legacy (us)':>14}{'current (us)':>16}{'speedup':>10}")
+    for name, text in SAMPLES.items():
+        assert legacy_escape_markdown_v2(text) == rendering.escape_markdown_v2(text)
+        legacy = timeit.timeit(lambda: legacy_escape_markdown_v2(text), number=number)
+        current = timeit.timeit(lambda: rendering.escape_markdown_v2(text), number=number)
+        print(f"{name:<14}{legacy / number * 1e6:>14.3f}{current / number * 1e6:>16.3f}{legacy / current:>9.1f}x")
+
+    links = rendering.render_build_links("https://jenkins.example.com/", "MegaRamps/Mobile", 42, "android-apk")
+    args = ("MegaRamps/Mobile-Build", 42, "android-apk", links)
+    assert legacy_build_success(*args) == rendering.render_build_success(*args)
+    legacy = timeit.timeit(lambda: legacy_build_success(*args), number=number)
+    current = timeit.timeit(lambda: rendering.render_build_success(*args), number=number)
+    print(f"{'success msg':<14}{legacy / number * 1e6:>14.3f}{current / number * 1e6:>16.3f}{legacy / current:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/startup_importtime.py
+# Đo thời gian import khi khởi động bot bằng `python -X importtime`.
+# Mỗi lần chạy là một tiến trình mới (không có module nào được cache trong sys.modules),
+# kết quả lấy trung vị của nhiều lần chạy để giảm nhiễu.
+# Chạy từ thư mục gốc của repo (cần có config.py): python benchmarks/startup_importtime.py [--runs 10]
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dòng output của -X importtime: "import time:   self [us] | cumulative | imported package"
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def run_once(module: str):
+    """Import `module` trong một tiến trình mới, trả về (thời gian wall, {package: cumulative us})."""
+    started_at = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started_at
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, package = match.groups()
+        # Chỉ lấy các package cấp cao nhất trong cây import (thụt lề 1 khoảng trắng)
+        if len(indent) == 1:
+            cumulative[package] = int(cumulative_us)
+    return wall, cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--module', default='main', help='Module to import (default: main)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest top-level imports to show')
+    args = parser.parse_args()
+
+    walls = []
+    per_package = defaultdict(list)
+    for _ in range(args.runs):
+        wall, cumulative = run_once(args.module)
+        walls.append(wall)
+        for package, value in cumulative.items():
+            per_package[package].append(value)
+
+    print(f"python -X importtime -c 'import {args.module}' x{args.runs}")
+    print(f"  process wall time: median {statistics.median(walls) * 1000:.1f} ms, "
+          f"min {min(walls) * 1000:.1f} ms, max {max(walls) * 1000:.1f} ms")
+    total_us = sum(statistics.median(values) for values in per_package.values())
+    print(f"  import time (sum of top-level cumulative): {total_us / 1000:.1f} ms")
+    print(f"\n  slowest top-level imports (median cumulative):")
+    slowest = sorted(per_package.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for package, values in slowest[:args.top]:
+        print(f"    {statistics.median(values) / 1000:8.1f} ms  {package}")
+
+    # Kiểm tra các thư viện nặng được nạp lười không bị import sớm
+    probe = subprocess.run(
+        [sys.executable, '-c',
+         f"import sys, {args.module}; "
+         "print(' '.join(n for n in ('jenkins', 'cryptography.fernet') "
+         "if n in sys.modules and type(sys.modules[n]).__name__ != '_LazyModule'))"],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    eager = probe.stdout.strip()
+    print(f"\n  lazily loaded modules imported eagerly: {eager or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
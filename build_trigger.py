@@ -0,0 +1,269 @@
+# build_trigger.py
+import asyncio
+import logging
+import uuid
+import weakref
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import config
+import database
+import metrics
+import rendering
+from lazy_imports import lazy_import
+from log_filters import add_html_filter_to_logger
+
+jenkins = lazy_import('jenkins')
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+# Số lệnh build_job gửi đến Jenkins đồng thời khi trigger nhiều target cùng lúc
+BUILD_TRIGGER_CONCURRENCY = getattr(config, 'BUILD_TRIGGER_CONCURRENCY', 4)
+# Yêu cầu trùng job/branch/target được gộp vào build trước đó nếu build đó vẫn đang chờ
+# trong hàng đợi Jenkins và được yêu cầu trong vòng số giây này
+BUILD_COALESCE_WINDOW = getattr(config, 'BUILD_COALESCE_WINDOW', 1800)
+# Khi không có số queue item để hỏi Jenkins, chỉ gộp các yêu cầu cách nhau ít hơn số giây này
+BUILD_DEBOUNCE_SECONDS = getattr(config, 'BUILD_DEBOUNCE_SECONDS', 30)
+
+# Một lock cho mỗi (job, branch, target) để hai người bấm cùng lúc không cùng trigger.
+# WeakValueDictionary: lock tự được dọn khi không còn ai giữ hoặc chờ.
+_trigger_locks: "weakref.WeakValueDictionary[Tuple[str, str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _lock_for(key: Tuple[str, str, str]) -> asyncio.Lock:
+    lock = _trigger_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _trigger_locks[key] = lock
+    return lock
+
+
+def _build_job_sync(server, job_name: str, params: Dict[str, str]) -> Optional[int]:
+    with metrics.track_jenkins_call('build_job'):
+        queue_item_id = server.build_job(job_name, parameters=params)
+    # python-jenkins >= 1.0 trả về số queue item, các phiên bản cũ trả về None
+    return queue_item_id if isinstance(queue_item_id, int) else None
+
+
+def _is_still_queued(server, queue_item_id: int) -> bool:
+    """True nếu queue item vẫn đang chờ trong hàng đợi Jenkins (chưa chạy, chưa bị hủy)."""
+    try:
+        with metrics.track_jenkins_call('get_queue_item'):
+            item = server.get_queue_item(queue_item_id)
+    except jenkins.JenkinsException:
+        # Item đã rời hàng đợi quá lâu hoặc không truy cập được: không gộp
+        return False
+    return not item.get('cancelled') and not item.get('executable')
+
+
+async def _find_coalescable(server, job_name: str, branch: str, target: str) -> Optional[Dict[str, Any]]:
+    """Tìm build đang chờ có cùng tham số để gộp yêu cầu mới vào (DB trước, rồi hỏi hàng đợi Jenkins)."""
+    pending = database.find_pending_build_request(job_name, branch, target, BUILD_COALESCE_WINDOW)
+    if pending is None:
+        return None
+    if pending['queue_item_id'] is None:
+        return pending if pending['age_seconds'] <= BUILD_DEBOUNCE_SECONDS else None
+    if await asyncio.to_thread(_is_still_queued, server, pending['queue_item_id']):
+        return pending
+    return None
+
+
+async def trigger_builds(creds: Dict[str, str], job_name: str, branch: str, targets: Sequence[str],
+                         group_id: int, user_id: int, batch_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Trigger một build cho mỗi target, các lệnh gọi Jenkins chạy song song trong thread riêng.
+
+    Mỗi build thành công được lưu thành một build request (gắn với `batch_id` nếu có).
+    Nếu đã có build cùng job/branch/target đang chờ trong hàng đợi Jenkins, người yêu cầu
+    được gắn vào build đó (nhận thông báo khi build xong) thay vì trigger thêm một build.
+
+    Trả về danh sách theo thứ tự `targets`, mỗi phần tử là dict
+    {'target', 'build_request_id', 'queue_item_id', 'error', 'coalesced'}
+    (error là exception hoặc None).
+    """
+    semaphore = asyncio.Semaphore(BUILD_TRIGGER_CONCURRENCY)
+
+    async def trigger(target: str) -> Dict[str, Any]:
+        build_request_id = str(uuid.uuid4())
+        params = {
+            'GIT_BRANCH': branch,
+            'BUILD_TARGET': target,
+            'BUILD_REQUEST_ID': build_request_id,
+        }
+        # Mỗi lệnh gọi dùng client riêng (requests.Session không chia sẻ giữa các thread).
+        # Client được tạo ở thread của event loop để module jenkins được nạp trước.
+        server = jenkins.Jenkins(creds['jenkins_url'], username=creds['jenkins_userid'], password=creds['jenkins_token'])
+        async with _lock_for((job_name, branch, target)):
+            try:
+                async with semaphore:
+                    pending = await _find_coalescable(server, job_name, branch, target)
+                    if pending is None:
+                        queue_item_id = await asyncio.to_thread(_build_job_sync, server, job_name, params)
+            except Exception as e:
+                metrics.BUILD_TRIGGERS.inc(result='error')
+                logger.error(f"Failed to trigger {job_name} (branch={branch}, target={target}): {e}")
+                return {'target': target, 'build_request_id': None, 'queue_item_id': None, 'error': e, 'coalesced': False}
+
+            if pending is not None:
+                database.add_build_request_subscriber(pending['build_id'], group_id, user_id, batch_id)
+                metrics.BUILD_TRIGGERS.inc(result='coalesced')
+                logger.info(
+                    f"Coalesced build request for job {job_name} (branch={branch}, target={target}) "
+                    f"into queued request {pending['build_id']}",
+                    extra={'job': job_name, 'target': target, 'chat_id': group_id,
+                           'user_id': user_id, 'build_request_id': pending['build_id']}
+                )
+                return {'target': target, 'build_request_id': pending['build_id'],
+                        'queue_item_id': pending['queue_item_id'], 'error': None, 'coalesced': True}
+
+            # Lưu trong lock để yêu cầu trùng tiếp theo tìm thấy build này
+            database.save_build_request(
+                build_request_id, job_name, group_id, user_id, target,
+                branch=branch, batch_id=batch_id, queue_item_id=queue_item_id
+            )
+        metrics.BUILD_TRIGGERS.inc(result='triggered')
+        logger.info(
+            f"Triggered build for job {job_name} (branch={branch}, target={target})",
+            extra={'job': job_name, 'target': target, 'chat_id': group_id,
+                   'user_id': user_id, 'build_request_id': build_request_id}
+        )
+        return {'target': target, 'build_request_id': build_request_id, 'queue_item_id': queue_item_id,
+                'error': None, 'coalesced': False}
+
+    return list(await asyncio.gather(*(trigger(target) for target in targets)))
+
+
+def _abort_sync(server, job_name: str, queue_item_id: Optional[int], build_number: Optional[int]) -> Tuple[str, Optional[int]]:
+    """
+    Hủy queue item hoặc dừng build đang chạy.
+
+    Trả về ('cancelled', None) nếu build bị hủy khi còn trong hàng đợi, hoặc ('stopped', số build).
+    """
+    def queue_item() -> Dict[str, Any]:
+        try:
+            with metrics.track_jenkins_call('get_queue_item'):
+                return server.get_queue_item(queue_item_id)
+        except jenkins.JenkinsException:
+            return {}
+
+    if build_number is None and queue_item_id is not None:
+        item = queue_item()
+        if item.get('cancelled'):
+            return 'cancelled', None
+        if not item.get('executable') and item:
+            with metrics.track_jenkins_call('cancel_queue'):
+                server.cancel_queue(queue_item_id)
+            # Build có thể vừa rời hàng đợi trước khi lệnh hủy tới Jenkins
+            item = queue_item()
+            if not item.get('executable'):
+                return 'cancelled', None
+        if item.get('executable'):
+            build_number = item['executable'].get('number')
+    if build_number is None:
+        raise ValueError("The build number is not known yet, so the build can only be aborted from Jenkins.")
+    with metrics.track_jenkins_call('stop_build'):
+        server.stop_build(job_name, build_number)
+    return 'stopped', build_number
+
+
+async def abort_build(creds: Dict[str, str], build_request: Dict[str, Any]) -> Tuple[str, Optional[int]]:
+    """
+    Dừng build của một build request bằng tài khoản Jenkins `creds`.
+
+    Build còn trong hàng đợi được hủy (và ghi trạng thái CANCELLED vì Jenkins sẽ không gửi webhook);
+    build đang chạy được dừng, Jenkins sẽ gửi webhook ABORTED như thường lệ.
+    Trả về ('cancelled' | 'stopped', số build). Lỗi từ Jenkins được ném ra cho handler.
+    """
+    server = jenkins.Jenkins(creds['jenkins_url'], username=creds['jenkins_userid'], password=creds['jenkins_token'])
+    build_request_id = build_request['build_id']
+    try:
+        outcome, build_number = await asyncio.to_thread(
+            _abort_sync, server, build_request['jenkins_job_path'],
+            build_request['queue_item_id'], build_request['build_number']
+        )
+    except Exception:
+        metrics.BUILD_ABORTS.inc(result='error')
+        raise
+    metrics.BUILD_ABORTS.inc(result=outcome)
+    if outcome == 'cancelled':
+        database.update_build_request_result(build_request_id, 'CANCELLED', None)
+    elif build_request['build_number'] is None:
+        database.update_build_request_with_build_number(build_request_id, build_number)
+    logger.info(
+        f"Build request {build_request_id} of {build_request['jenkins_job_path']} was {outcome}",
+        extra={'job': build_request['jenkins_job_path'], 'build': build_number, 'build_request_id': build_request_id}
+    )
+    return outcome, build_number
+
+
+def detach_requester(build_request: Dict[str, Any], user_id: int) -> Optional[List[str]]:
+    """
+    Gỡ `user_id` khỏi một build dùng chung thay vì dừng build mà người khác vẫn đang chờ.
+
+    Người yêu cầu gồm người trigger build và những người đã được gộp vào (build_request_subscribers).
+    Nếu người yêu cầu ban đầu rời đi, build được chuyển cho người được gộp vào sớm nhất.
+    Trả về None khi build chỉ có một người yêu cầu (build nên được hủy/dừng thật), ngược lại trả về
+    batch_id của các lô build mà người dùng vừa rời. ValueError nếu người dùng không yêu cầu build này.
+    """
+    build_request_id = build_request['build_id']
+    subscribers = database.get_build_request_subscribers(build_request_id)
+    requesters = {build_request['requested_by_user_id']} | {subscriber['requested_by_user_id'] for subscriber in subscribers}
+    if len(requesters) == 1:
+        # Chỉ một người yêu cầu: dừng build như bình thường
+        return None
+    if user_id not in requesters:
+        raise ValueError("Other users are waiting for this build, only they can abort it.")
+
+    own = [subscriber for subscriber in subscribers if subscriber['requested_by_user_id'] == user_id]
+    others = [subscriber for subscriber in subscribers if subscriber['requested_by_user_id'] != user_id]
+    is_owner = build_request['requested_by_user_id'] == user_id
+
+    left_batches = [subscriber['batch_id'] for subscriber in own]
+    for subscriber in own:
+        database.remove_build_request_subscriber(subscriber['id'])
+    if is_owner:
+        heir = others[0]
+        database.transfer_build_request(build_request_id, heir['telegram_group_id'], heir['requested_by_user_id'], heir['batch_id'])
+        database.remove_build_request_subscriber(heir['id'])
+        left_batches.append(build_request['batch_id'])
+
+    # Lô build của người rời đi vẫn hiển thị target, kèm ghi chú đã rời build
+    target = build_request['build_target'] or 'Unknown'
+    for batch_id in dict.fromkeys(batch_id for batch_id in left_batches if batch_id):
+        batch = database.get_build_batch(batch_id)
+        if batch is not None:
+            database.save_build_batch_failures(
+                batch_id, batch['failed_targets'] + [{'target': target, 'error': 'Left the shared build'}]
+            )
+    metrics.BUILD_ABORTS.inc(result='detached')
+    logger.info(
+        f"User {user_id} left shared build request {build_request_id} of {build_request['jenkins_job_path']}",
+        extra={'job': build_request['jenkins_job_path'], 'user_id': user_id, 'build_request_id': build_request_id}
+    )
+    return [batch_id for batch_id in left_batches if batch_id]
+
+
+def new_batch_id() -> str:
+    return uuid.uuid4().hex
+
+
+def render_batch(batch_id: str, progress: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Đọc trạng thái hiện tại của lô build từ database.
+
+    `progress` ({build_request_id: dòng trạng thái hàng đợi}, từ queue_tracker) thay cho chữ
+    "running" của các build chưa xong. Trả về dict lô build (như database.get_build_batch) kèm
+    khóa 'text' là tin nhắn trạng thái (MarkdownV2), hoặc None nếu không tìm thấy lô.
+    """
+    batch = database.get_build_batch(batch_id)
+    if batch is None:
+        return None
+    progress = progress or {}
+    entries = [
+        {'target': request['build_target'], 'status': request['status'], 'build_number': request['build_number'],
+         'coalesced': bool(request['coalesced']), 'progress': progress.get(request['build_id'])}
+        for request in batch['requests']
+    ]
+    entries += [{'target': failure['target'], 'error': failure['error']} for failure in batch['failed_targets']]
+    batch['text'] = rendering.render_batch_status(batch['jenkins_job_path'], batch['branch'] or '', entries)
+    return batch
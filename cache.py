@@ -0,0 +1,46 @@
+# cache.py
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class ReadThroughCache:
+    """
+    Cache trong bộ nhớ của tiến trình cho các dữ liệu đọc nhiều, ghi ít (groups, settings).
+
+    Giá trị được nạp qua `loader` khi chưa có trong cache. Các hàm ghi tương ứng
+    phải gọi `invalidate` để tránh trả về dữ liệu cũ.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._data: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Trả về giá trị trong cache hoặc nạp từ `loader`. Không lưu kết quả None (lỗi hoặc không tồn tại)."""
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+
+        value = loader()
+        if value is not None:
+            with self._lock:
+                self._data[key] = value
+        return value
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Xóa một key khỏi cache, hoặc toàn bộ cache nếu key là None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Trả về số liệu hit/miss và kích thước hiện tại để theo dõi."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
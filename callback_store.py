@@ -0,0 +1,88 @@
+# callback_store.py
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import config
+
+# Giới hạn của Telegram cho callback_data
+MAX_CALLBACK_DATA_BYTES = 64
+# Thời gian sống mặc định của một session, bằng conversation_timeout của các ConversationHandler
+SESSION_TTL = getattr(config, 'CALLBACK_SESSION_TTL', 300)
+MAX_SESSIONS = 1000
+
+
+class CallbackStore:
+    """
+    Lưu trữ LRU có TTL, ánh xạ token ngắn sang giá trị phía server.
+
+    callback_data chỉ chứa token (ví dụ 'build_select_branch:Xk3a9Q:i:42'), còn dữ liệu thật
+    (danh sách branch, tên job...) nằm ở đây. Mỗi lần truy cập gia hạn TTL, giống như
+    conversation_timeout được đặt lại sau mỗi lần người dùng bấm nút.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = MAX_SESSIONS, token_bytes: int = 4):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.token_bytes = token_bytes
+        # token -> (thời điểm hết hạn, giá trị)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def _evict_expired(self, now: float) -> None:
+        # Các entry được sắp theo thời điểm truy cập nên entry hết hạn nằm ở đầu
+        while self._entries:
+            token, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[token]
+
+    def put(self, value: Any) -> str:
+        """Lưu giá trị và trả về token (base64 url-safe, không chứa ':')."""
+        now = time.monotonic()
+        self._evict_expired(now)
+        token = secrets.token_urlsafe(self.token_bytes)
+        while token in self._entries:
+            token = secrets.token_urlsafe(self.token_bytes)
+        self._entries[token] = (now + self.ttl, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> Optional[Any]:
+        """Trả về giá trị của token (và gia hạn TTL), hoặc None nếu không có hoặc đã hết hạn."""
+        now = time.monotonic()
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[token]
+            return None
+        self._entries[token] = (now + self.ttl, entry[1])
+        self._entries.move_to_end(token)
+        return entry[1]
+
+    def pop(self, token: str) -> Optional[Any]:
+        entry = self._entries.pop(token, None)
+        return entry[1] if entry else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def make_callback_data(*parts) -> str:
+    """Ghép các phần thành callback_data 'a:b:c' và kiểm tra giới hạn 64 byte của Telegram."""
+    data = ':'.join(str(part) for part in parts)
+    if len(data.encode('utf-8')) > MAX_CALLBACK_DATA_BYTES:
+        raise ValueError(f"callback_data exceeds {MAX_CALLBACK_DATA_BYTES} bytes: {data!r}")
+    return data
+
+
+def parse_callback_data(data: str, parts: int) -> list:
+    """
+    Tách callback_data thành đúng `parts` phần; phần cuối giữ nguyên mọi dấu ':' còn lại.
+
+    Trả về danh sách được bổ sung chuỗi rỗng nếu thiếu phần.
+    """
+    values = data.split(':', parts - 1)
+    return values + [''] * (parts - len(values))
@@ -1,15 +1,43 @@
+import json
 import sqlite3
 import config
 import logging
 from typing import Optional, Tuple, List, Dict, Any
 import security # Added missing import
+import metrics
+from cache import ReadThroughCache
 from log_filters import add_html_filter_to_logger
 
-# Cấu hình logging
-logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+# Logging được cấu hình một lần trong main.py (logging_setup.setup_logging)
 logger = logging.getLogger(__name__)
 add_html_filter_to_logger(__name__)
 
+# Cache đọc cho các bảng được truy vấn thường xuyên (mỗi /build, /document)
+_group_config_cache = ReadThroughCache('groups')
+_settings_cache = ReadThroughCache('settings')
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Trả về số liệu hit/miss của các cache để theo dõi."""
+    return {
+        _group_config_cache.name: _group_config_cache.stats(),
+        _settings_cache.name: _settings_cache.stats(),
+    }
+
+for _cache in (_group_config_cache, _settings_cache):
+    metrics.CACHE_HITS.set_function(lambda c=_cache: c.hits, cache=_cache.name)
+    metrics.CACHE_MISSES.set_function(lambda c=_cache: c.misses, cache=_cache.name)
+
+def _timed_query(func):
+    """Decorator đo thời gian truy vấn database (metric jenkinsbot_db_query_seconds)."""
+    return metrics.DB_QUERY_SECONDS.time_function(func, operation=func.__name__)
+
+def _ensure_column(cursor, table: str, column: str, definition: str) -> None:
+    """Thêm cột vào bảng đã tồn tại (database tạo bởi phiên bản cũ) nếu chưa có."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+@_timed_query
 def init_db():
     """Khởi tạo database nếu chưa tồn tại."""
     conn = None
@@ -56,6 +84,62 @@ def init_db():
             FOREIGN KEY (requested_by_user_id) REFERENCES users (telegram_user_id)
         )
         """)
+        # Các cột thêm sau: branch, lô build (nhiều target trong một lần yêu cầu) và kết quả
+        _ensure_column(cursor, 'build_requests', 'branch', 'TEXT')
+        _ensure_column(cursor, 'build_requests', 'batch_id', 'TEXT')
+        _ensure_column(cursor, 'build_requests', 'queue_item_id', 'INTEGER')
+        _ensure_column(cursor, 'build_requests', 'status', 'TEXT')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_build_requests_batch ON build_requests (batch_id)")
+        # /rebuild tìm yêu cầu build gần nhất của nhóm
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_build_requests_group ON build_requests (telegram_group_id, created_at)")
+        
+        # Lô build: nhiều target được trigger cùng lúc, theo dõi bằng một tin nhắn trạng thái chung
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS build_batches (
+            batch_id TEXT PRIMARY KEY,
+            jenkins_job_path TEXT NOT NULL,
+            branch TEXT,
+            telegram_group_id INTEGER NOT NULL,
+            requested_by_user_id INTEGER NOT NULL,
+            status_message_id INTEGER,
+            failed_targets TEXT, -- JSON [{"target", "error"}] của các target không trigger được
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        
+        # Người yêu cầu được gộp vào một build đang chờ có cùng job/branch/target,
+        # cũng được nhận thông báo khi build đó hoàn thành
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS build_request_subscribers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            build_request_id TEXT NOT NULL,
+            telegram_group_id INTEGER NOT NULL,
+            requested_by_user_id INTEGER NOT NULL,
+            batch_id TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (build_request_id) REFERENCES build_requests (build_id)
+        )
+        """)
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_build_request_subscribers_request
+        ON build_request_subscribers (build_request_id)
+        """)
+        
+        # Lịch build định kỳ (/schedule), được nạp vào scheduler khi khởi động
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_group_id INTEGER NOT NULL,
+            jenkins_job_path TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            build_target TEXT NOT NULL,
+            cron TEXT NOT NULL,
+            created_by_user_id INTEGER NOT NULL,
+            last_run_at DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (created_by_user_id) REFERENCES users (telegram_user_id)
+        )
+        """)
         
         # Tạo bảng settings để lưu các cài đặt toàn cục
         cursor.execute("""
@@ -68,6 +152,71 @@ def init_db():
         )
         """)
         
+        # Các bảng thống kê được cập nhật dần khi webhook đến,
+        # để /stats và /history không phải quét toàn bộ build_requests
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS build_stats (
+            jenkins_job_path TEXT NOT NULL,
+            build_target TEXT NOT NULL DEFAULT '',
+            total_count INTEGER NOT NULL DEFAULT 0,
+            total_duration REAL NOT NULL DEFAULT 0,
+            max_duration REAL NOT NULL DEFAULT 0,
+            last_status TEXT,
+            last_build_number INTEGER,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (jenkins_job_path, build_target)
+        )
+        """)
+        
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS build_status_counts (
+            jenkins_job_path TEXT NOT NULL,
+            build_target TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (jenkins_job_path, build_target, status)
+        )
+        """)
+        
+        # Histogram thời gian build theo các bucket cố định (DURATION_BUCKETS)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS build_duration_buckets (
+            jenkins_job_path TEXT NOT NULL,
+            build_target TEXT NOT NULL DEFAULT '',
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (jenkins_job_path, build_target, bucket)
+        )
+        """)
+        
+        # Chỉ giữ HISTORY_SIZE build gần nhất cho mỗi job
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS build_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            jenkins_job_path TEXT NOT NULL,
+            build_number INTEGER NOT NULL,
+            build_target TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL,
+            duration REAL,
+            requested_by_user_id INTEGER,
+            finished_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(jenkins_job_path, build_number)
+        )
+        """)
+        
+        # Thông báo build chưa xử lý xong khi bot tắt, được xử lý lại ở lần khởi động sau
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pending_notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_name TEXT NOT NULL,
+            build_number TEXT NOT NULL,
+            status TEXT NOT NULL,
+            build_target TEXT,
+            build_request_id TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        
         conn.commit()
         logger.info("Database initialized successfully")
     except sqlite3.Error as e:
@@ -76,6 +225,7 @@ def init_db():
         if conn:
             conn.close()
 
+@_timed_query
 def save_user(user_id: int, jenkins_url: str, jenkins_userid: str, encrypted_token: str) -> bool:
     """Lưu hoặc cập nhật thông tin đăng nhập Jenkins của người dùng."""
     conn = None
@@ -110,6 +260,7 @@ def save_user(user_id: int, jenkins_url: str, jenkins_userid: str, encrypted_tok
         if conn:
             conn.close()
 
+@_timed_query
 def get_user_credentials(user_id: int) -> Optional[Dict[str, str]]:
     """Lấy thông tin đăng nhập Jenkins của người dùng dưới dạng dictionary."""
     conn = None
@@ -145,6 +296,7 @@ def get_user_credentials(user_id: int) -> Optional[Dict[str, str]]:
         if conn:
             conn.close()
 
+@_timed_query
 def delete_user(user_id: int) -> bool:
     """Xóa thông tin đăng nhập Jenkins của người dùng."""
     conn = None
@@ -161,6 +313,7 @@ def delete_user(user_id: int) -> bool:
         if conn:
             conn.close()
 
+@_timed_query
 def is_user_logged_in(user_id: int) -> bool:
     """Kiểm tra xem người dùng đã đăng nhập chưa."""
     conn = None
@@ -176,20 +329,23 @@ def is_user_logged_in(user_id: int) -> bool:
         if conn:
             conn.close()
 
+@_timed_query
 def save_group_config(group_id: int, job_path: str, user_id: int) -> bool:
-    """Lưu cấu hình liên kết giữa nhóm Telegram và Jenkins job."""
+    """
+    Liên kết nhóm Telegram với một Jenkins job (đăng ký nhận thông báo).
+
+    Một nhóm có thể liên kết nhiều job và một job có thể được nhiều nhóm đăng ký;
+    liên kết đã tồn tại chỉ được cập nhật người setup và đưa lên làm job mặc định của nhóm.
+    """
     conn = None
     try:
         conn = sqlite3.connect(config.DB_FILE)
         cursor = conn.cursor()
-        
-        # Xóa tất cả cấu hình cũ của nhóm này
+        # Xóa rồi thêm lại để liên kết vừa setup có id lớn nhất (job mặc định của nhóm)
         cursor.execute("""
-            DELETE FROM groups 
-            WHERE telegram_group_id = ?
-        """, (group_id,))
-        
-        # Thêm cấu hình mới
+            DELETE FROM groups
+            WHERE telegram_group_id = ? AND jenkins_job_path = ?
+        """, (group_id, job_path))
         cursor.execute("""
             INSERT INTO groups (telegram_group_id, jenkins_job_path, setup_by_user_id)
             VALUES (?, ?, ?)
@@ -201,11 +357,48 @@ def save_group_config(group_id: int, job_path: str, user_id: int) -> bool:
         logger.error(f"Database error while saving group config: {e}")
         return False
     finally:
+        _group_config_cache.invalidate(group_id)
         if conn:
             conn.close()
 
+@_timed_query
+def unlink_group_job(group_id: int, job_path: str) -> bool:
+    """Hủy liên kết giữa nhóm Telegram và một Jenkins job."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM groups
+            WHERE telegram_group_id = ? AND jenkins_job_path = ?
+        """, (group_id, job_path))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logger.error(f"Database error while unlinking group job: {e}")
+        return False
+    finally:
+        _group_config_cache.invalidate(group_id)
+        if conn:
+            conn.close()
+
+def get_group_jobs(group_id: int) -> List[Tuple[str, int]]:
+    """
+    Lấy các Jenkins job được liên kết với một nhóm (có cache), job setup gần nhất đứng đầu.
+
+    Trả về danh sách (jenkins_job_path, setup_by_user_id).
+    """
+    jobs = _group_config_cache.get(group_id, lambda: _fetch_group_jobs(group_id))
+    return list(jobs) if jobs else []
+
 def get_group_config(group_id: int) -> Optional[Tuple[str, int]]:
-    """Lấy cấu hình Jenkins job của một nhóm Telegram."""
+    """Lấy job mặc định (setup gần nhất) của một nhóm Telegram, hoặc None nếu nhóm chưa setup."""
+    jobs = get_group_jobs(group_id)
+    return jobs[0] if jobs else None
+
+@_timed_query
+def _fetch_group_jobs(group_id: int) -> Optional[Tuple[Tuple[str, int], ...]]:
+    """Đọc các job của một nhóm trực tiếp từ database (None khi lỗi để không bị cache)."""
     conn = None
     try:
         conn = sqlite3.connect(config.DB_FILE)
@@ -214,8 +407,9 @@ def get_group_config(group_id: int) -> Optional[Tuple[str, int]]:
             SELECT jenkins_job_path, setup_by_user_id 
             FROM groups 
             WHERE telegram_group_id = ?
+            ORDER BY id DESC
         """, (group_id,))
-        return cursor.fetchone()
+        return tuple(cursor.fetchall())
     except sqlite3.Error as e:
         logger.error(f"Database error while fetching group config: {e}")
         return None
@@ -223,6 +417,7 @@ def get_group_config(group_id: int) -> Optional[Tuple[str, int]]:
         if conn:
             conn.close()
 
+@_timed_query
 def get_group_by_job_path(job_path: str) -> Optional[Tuple[int, int]]:
     """
     Lấy thông tin nhóm Telegram đã setup một Jenkins job (phiên bản cũ).
@@ -246,10 +441,11 @@ def get_group_by_job_path(job_path: str) -> Optional[Tuple[int, int]]:
         if conn:
             conn.close()
 
+@_timed_query
 def get_groups_by_job_path(job_path: str) -> List[Tuple[int, int]]:
     """
-    Lấy tất cả các nhóm Telegram đã setup một Jenkins job.
-    Chỉ sử dụng cho mục đích tham khảo, không dùng để gửi thông báo.
+    Lấy tất cả các nhóm Telegram đã đăng ký một Jenkins job.
+    Dùng để gửi thông báo build đến mọi nhóm đăng ký (fan-out).
     """
     conn = None
     try:
@@ -268,16 +464,20 @@ def get_groups_by_job_path(job_path: str) -> List[Tuple[int, int]]:
         if conn:
             conn.close()
 
-def save_build_request(build_request_id: str, jenkins_job_path: str, telegram_group_id: int, requested_by_user_id: int, build_target: str) -> bool:
-    """Lưu thông tin về một yêu cầu build, bao gồm cả build target."""
+@_timed_query
+def save_build_request(build_request_id: str, jenkins_job_path: str, telegram_group_id: int, requested_by_user_id: int, build_target: str,
+                       branch: Optional[str] = None, batch_id: Optional[str] = None, queue_item_id: Optional[int] = None) -> bool:
+    """Lưu thông tin về một yêu cầu build, bao gồm cả build target (và lô build nếu có)."""
     conn = None
     try:
         conn = sqlite3.connect(config.DB_FILE)
         cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO build_requests (build_id, jenkins_job_path, telegram_group_id, requested_by_user_id, build_target)
-            VALUES (?, ?, ?, ?, ?)
-        """, (build_request_id, jenkins_job_path, telegram_group_id, requested_by_user_id, build_target))
+            INSERT INTO build_requests (build_id, jenkins_job_path, telegram_group_id, requested_by_user_id, build_target,
+                                        branch, batch_id, queue_item_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (build_request_id, jenkins_job_path, telegram_group_id, requested_by_user_id, build_target,
+              branch, batch_id, queue_item_id))
         conn.commit()
         return True
     except sqlite3.Error as e:
@@ -287,6 +487,7 @@ def save_build_request(build_request_id: str, jenkins_job_path: str, telegram_gr
         if conn:
             conn.close()
 
+@_timed_query
 def get_build_request(build_request_id: str) -> Optional[Dict[str, Any]]:
     """Lấy thông tin của một yêu cầu build cụ thể."""
     conn = None
@@ -306,6 +507,7 @@ def get_build_request(build_request_id: str) -> Optional[Dict[str, Any]]:
         if conn:
             conn.close()
 
+@_timed_query
 def get_latest_build_request(job_path: str, build_number: Optional[int] = None) -> Optional[Dict[str, Any]]:
     """
     Lấy yêu cầu build gần nhất cho một job cụ thể.
@@ -341,6 +543,7 @@ def get_latest_build_request(job_path: str, build_number: Optional[int] = None)
         if conn:
             conn.close()
 
+@_timed_query
 def update_build_request_with_build_number(build_request_id: str, build_number: int) -> bool:
     """Cập nhật số build cho yêu cầu build."""
     conn = None
@@ -361,6 +564,317 @@ def update_build_request_with_build_number(build_request_id: str, build_number:
         if conn:
             conn.close()
 
+@_timed_query
+def update_build_request_result(build_request_id: str, status: str, build_number: int) -> bool:
+    """Ghi kết quả (trạng thái và số build) của một yêu cầu build khi nhận webhook."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE build_requests
+            SET status = ?, build_number = ?
+            WHERE build_id = ?
+        """, (status, build_number, build_request_id))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logger.error(f"Database error while updating build request result: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def save_build_batch(batch_id: str, jenkins_job_path: str, branch: str, telegram_group_id: int,
+                     requested_by_user_id: int, status_message_id: Optional[int] = None) -> bool:
+    """Lưu một lô build (nhiều target trong cùng một yêu cầu) và tin nhắn trạng thái của lô."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO build_batches (batch_id, jenkins_job_path, branch, telegram_group_id, requested_by_user_id, status_message_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (batch_id, jenkins_job_path, branch, telegram_group_id, requested_by_user_id, status_message_id))
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Database error while saving build batch: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def save_build_batch_failures(batch_id: str, failures: List[Dict[str, str]]) -> bool:
+    """Ghi lại các target của lô không trigger được (để hiển thị trong tin nhắn trạng thái)."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE build_batches
+            SET failed_targets = ?
+            WHERE batch_id = ?
+        """, (json.dumps(failures), batch_id))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logger.error(f"Database error while saving build batch failures: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def get_build_batch(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Lấy thông tin một lô build, kèm danh sách yêu cầu build của lô trong khóa 'requests'."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM build_batches WHERE batch_id = ?", (batch_id,))
+        batch = cursor.fetchone()
+        if batch is None:
+            return None
+        # Gồm cả các build có sẵn mà target của lô đã được gộp vào (coalesced = 1)
+        cursor.execute("""
+            SELECT *, 0 AS coalesced FROM build_requests
+            WHERE batch_id = ?
+            UNION ALL
+            SELECT build_requests.*, 1 AS coalesced FROM build_requests
+            JOIN build_request_subscribers ON build_request_subscribers.build_request_id = build_requests.build_id
+            WHERE build_request_subscribers.batch_id = ?
+            ORDER BY created_at
+        """, (batch_id, batch_id))
+        batch = dict(batch)
+        batch['failed_targets'] = json.loads(batch['failed_targets'] or '[]')
+        batch['requests'] = [dict(row) for row in cursor.fetchall()]
+        return batch
+    except sqlite3.Error as e:
+        logger.error(f"Database error while getting build batch: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def get_last_rebuildable_request(group_id: int, build_target: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Yêu cầu build gần nhất của nhóm có đủ tham số để trigger lại (đã lưu branch),
+    chỉ xét target `build_target` nếu được truyền (không phân biệt hoa thường).
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        query = """
+            SELECT * FROM build_requests
+            WHERE telegram_group_id = ? AND branch IS NOT NULL
+        """
+        params = [group_id]
+        if build_target is not None:
+            query += " AND build_target = ? COLLATE NOCASE"
+            params.append(build_target)
+        cursor.execute(query + " ORDER BY created_at DESC, rowid DESC LIMIT 1", params)
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Database error while getting last rebuildable request: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def find_pending_build_request(job_path: str, branch: str, build_target: str, max_age_seconds: float) -> Optional[Dict[str, Any]]:
+    """
+    Tìm yêu cầu build gần nhất chưa có kết quả với cùng job/branch/target, tạo trong vòng
+    `max_age_seconds` giây. Kết quả có thêm khóa 'age_seconds'.
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT *, (julianday('now') - julianday(created_at)) * 86400 AS age_seconds
+            FROM build_requests
+            WHERE jenkins_job_path = ? AND branch = ? AND build_target = ? AND status IS NULL
+              AND created_at >= datetime('now', ?)
+            ORDER BY created_at DESC
+            LIMIT 1
+        """, (job_path, branch, build_target, f"-{int(max_age_seconds)} seconds"))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Database error while looking for a pending build request: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def add_build_request_subscriber(build_request_id: str, telegram_group_id: int, requested_by_user_id: int,
+                                 batch_id: Optional[str] = None) -> bool:
+    """Gắn một người yêu cầu (và nhóm, lô build của họ) vào một build đã được trigger."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO build_request_subscribers (build_request_id, telegram_group_id, requested_by_user_id, batch_id)
+            VALUES (?, ?, ?, ?)
+        """, (build_request_id, telegram_group_id, requested_by_user_id, batch_id))
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Database error while adding build request subscriber: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def get_build_request_subscribers(build_request_id: str) -> List[Dict[str, Any]]:
+    """Lấy những người yêu cầu đã được gộp vào một build."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM build_request_subscribers
+            WHERE build_request_id = ?
+            ORDER BY id
+        """, (build_request_id,))
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Database error while getting build request subscribers: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def remove_build_request_subscriber(subscriber_id: int) -> bool:
+    """Gỡ một người yêu cầu khỏi build họ đã được gộp vào (theo id của dòng subscriber)."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM build_request_subscribers WHERE id = ?", (subscriber_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logger.error(f"Database error while removing build request subscriber: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def transfer_build_request(build_request_id: str, telegram_group_id: int, requested_by_user_id: int,
+                           batch_id: Optional[str]) -> bool:
+    """Chuyển một yêu cầu build sang người yêu cầu khác (khi người yêu cầu ban đầu rời build)."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE build_requests
+            SET telegram_group_id = ?, requested_by_user_id = ?, batch_id = ?
+            WHERE build_id = ?
+        """, (telegram_group_id, requested_by_user_id, batch_id, build_request_id))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logger.error(f"Database error while transferring build request: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def add_schedule(group_id: int, job_path: str, branch: str, build_target: str, cron: str, user_id: int) -> Optional[Dict[str, Any]]:
+    """Lưu một lịch build định kỳ; trả về bản ghi vừa tạo hoặc None nếu lỗi."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO schedules (telegram_group_id, jenkins_job_path, branch, build_target, cron, created_by_user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (group_id, job_path, branch, build_target, cron, user_id))
+        conn.commit()
+        cursor.execute("SELECT * FROM schedules WHERE id = ?", (cursor.lastrowid,))
+        return dict(cursor.fetchone())
+    except sqlite3.Error as e:
+        logger.error(f"Database error while adding schedule: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def get_schedules(group_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Lấy các lịch build định kỳ (của một nhóm, hoặc tất cả nếu group_id là None)."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        if group_id is None:
+            cursor.execute("SELECT * FROM schedules ORDER BY id")
+        else:
+            cursor.execute("SELECT * FROM schedules WHERE telegram_group_id = ? ORDER BY id", (group_id,))
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Database error while getting schedules: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def delete_schedule(schedule_id: int, group_id: int) -> bool:
+    """Xóa một lịch build của nhóm."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM schedules WHERE id = ? AND telegram_group_id = ?", (schedule_id, group_id))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logger.error(f"Database error while deleting schedule: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def update_schedule_last_run(schedule_id: int) -> bool:
+    """Ghi nhận thời điểm lịch vừa chạy (dùng để phát hiện lần chạy bị lỡ khi khởi động lại)."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE schedules SET last_run_at = CURRENT_TIMESTAMP WHERE id = ?", (schedule_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        logger.error(f"Database error while updating schedule: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
 def save_setting(key: str, value: str, user_id: Optional[int] = None) -> bool:
     """Lưu hoặc cập nhật một cài đặt trong bảng settings."""
     conn = None
@@ -405,11 +919,19 @@ def save_setting(key: str, value: str, user_id: Optional[int] = None) -> bool:
         logger.error(f"Database error while saving setting: {e}")
         return False
     finally:
+        _settings_cache.invalidate(key)
         if conn:
             conn.close()
 
 def get_setting(key: str) -> Optional[Dict[str, Any]]:
-    """Lấy giá trị của một cài đặt từ bảng settings."""
+    """Lấy giá trị của một cài đặt từ bảng settings (có cache)."""
+    setting = _settings_cache.get(key, lambda: _fetch_setting(key))
+    # Trả về bản sao để người gọi không làm hỏng dữ liệu trong cache
+    return dict(setting) if setting else None
+
+@_timed_query
+def _fetch_setting(key: str) -> Optional[Dict[str, Any]]:
+    """Đọc một cài đặt trực tiếp từ database."""
     conn = None
     try:
         conn = sqlite3.connect(config.DB_FILE)
@@ -437,4 +959,238 @@ def get_setting_value(key: str, default: Optional[str] = None) -> Optional[str]:
     setting = get_setting(key)
     if setting:
         return setting['value']
-    return default
\ No newline at end of file
+    return default
+
+# --- Thống kê build ---
+
+# Cận trên (giây) của các bucket thời gian build, bucket cuối chứa mọi giá trị lớn hơn
+DURATION_BUCKETS = [60, 120, 300, 600, 900, 1200, 1500, 1800, 2400, 3000, 3600, 5400, 7200]
+
+# Số build gần nhất được lưu cho mỗi job trong build_history
+HISTORY_SIZE = 20
+
+def _duration_bucket(duration: float) -> int:
+    """Trả về chỉ số bucket cho một khoảng thời gian build."""
+    for index, upper in enumerate(DURATION_BUCKETS):
+        if duration <= upper:
+            return index
+    return len(DURATION_BUCKETS)
+
+def _percentile_from_buckets(bucket_counts: Dict[int, int], percentile: float, max_duration: float) -> Optional[float]:
+    """Ước lượng percentile từ histogram bằng nội suy tuyến tính trong bucket."""
+    total = sum(bucket_counts.values())
+    if total == 0:
+        return None
+    
+    rank = percentile * total
+    cumulative = 0
+    for index in range(len(DURATION_BUCKETS) + 1):
+        count = bucket_counts.get(index, 0)
+        if count and cumulative + count >= rank:
+            lower = DURATION_BUCKETS[index - 1] if index > 0 else 0
+            upper = DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else max_duration
+            upper = min(upper, max_duration) if max_duration > lower else upper
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+    return max_duration
+
+@_timed_query
+def record_build_result(job_path: str, build_number: int, status: str, build_target: Optional[str] = None,
+                        duration: Optional[float] = None, requested_by_user_id: Optional[int] = None) -> bool:
+    """
+    Cập nhật các bảng thống kê khi nhận được kết quả build.
+    Webhook gửi lại cho cùng một build sẽ được bỏ qua.
+    """
+    conn = None
+    target = build_target or ''
+    status = status.upper()
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            INSERT OR IGNORE INTO build_history
+                (jenkins_job_path, build_number, build_target, status, duration, requested_by_user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (job_path, build_number, target, status, duration, requested_by_user_id))
+        if cursor.rowcount == 0:
+            logger.info(f"Build result for {job_path} #{build_number} already recorded, skipping stats update")
+            return True
+        
+        cursor.execute("""
+            DELETE FROM build_history
+            WHERE jenkins_job_path = ? AND id NOT IN (
+                SELECT id FROM build_history
+                WHERE jenkins_job_path = ?
+                ORDER BY id DESC
+                LIMIT ?
+            )
+        """, (job_path, job_path, HISTORY_SIZE))
+        
+        cursor.execute("""
+            INSERT INTO build_stats (jenkins_job_path, build_target, total_count, total_duration, max_duration, last_status, last_build_number)
+            VALUES (?, ?, 1, ?, ?, ?, ?)
+            ON CONFLICT (jenkins_job_path, build_target) DO UPDATE SET
+                total_count = total_count + 1,
+                total_duration = total_duration + excluded.total_duration,
+                max_duration = MAX(max_duration, excluded.max_duration),
+                last_status = excluded.last_status,
+                last_build_number = excluded.last_build_number,
+                updated_at = CURRENT_TIMESTAMP
+        """, (job_path, target, duration or 0, duration or 0, status, build_number))
+        
+        cursor.execute("""
+            INSERT INTO build_status_counts (jenkins_job_path, build_target, status, count)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT (jenkins_job_path, build_target, status) DO UPDATE SET count = count + 1
+        """, (job_path, target, status))
+        
+        # Chỉ tính thời gian cho các build thành công để percentile có ý nghĩa
+        if duration is not None and status == 'SUCCESS':
+            cursor.execute("""
+                INSERT INTO build_duration_buckets (jenkins_job_path, build_target, bucket, count)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT (jenkins_job_path, build_target, bucket) DO UPDATE SET count = count + 1
+            """, (job_path, target, _duration_bucket(duration)))
+        
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Database error while recording build result: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def get_build_stats(job_path: str) -> List[Dict[str, Any]]:
+    """
+    Lấy thống kê tổng hợp theo từng build target của một job:
+    số lượng theo trạng thái, tỉ lệ thành công, p50/p95 thời gian build.
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT build_target, total_count, total_duration, max_duration, last_status, last_build_number
+            FROM build_stats
+            WHERE jenkins_job_path = ?
+            ORDER BY build_target
+        """, (job_path,))
+        stats = {row['build_target']: dict(row, status_counts={}, buckets={}) for row in cursor.fetchall()}
+        
+        cursor.execute("""
+            SELECT build_target, status, count FROM build_status_counts
+            WHERE jenkins_job_path = ?
+        """, (job_path,))
+        for row in cursor.fetchall():
+            if row['build_target'] in stats:
+                stats[row['build_target']]['status_counts'][row['status']] = row['count']
+        
+        cursor.execute("""
+            SELECT build_target, bucket, count FROM build_duration_buckets
+            WHERE jenkins_job_path = ?
+        """, (job_path,))
+        for row in cursor.fetchall():
+            if row['build_target'] in stats:
+                stats[row['build_target']]['buckets'][row['bucket']] = row['count']
+        
+        result = []
+        for target_stats in stats.values():
+            buckets = target_stats.pop('buckets')
+            total = target_stats['total_count']
+            success = target_stats['status_counts'].get('SUCCESS', 0)
+            target_stats['success_rate'] = success / total if total else 0.0
+            target_stats['p50_duration'] = _percentile_from_buckets(buckets, 0.5, target_stats['max_duration'])
+            target_stats['p95_duration'] = _percentile_from_buckets(buckets, 0.95, target_stats['max_duration'])
+            result.append(target_stats)
+        return result
+    except sqlite3.Error as e:
+        logger.error(f"Database error while fetching build stats: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def get_build_history(job_path: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """Lấy danh sách các build gần nhất của một job."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT build_number, build_target, status, duration, requested_by_user_id, finished_at
+            FROM build_history
+            WHERE jenkins_job_path = ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (job_path, limit))
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Database error while fetching build history: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def save_pending_notification(job_name: str, build_number_str: str, status: str,
+                              build_target: Optional[str] = None, build_request_id: Optional[str] = None) -> bool:
+    """Lưu một thông báo build chưa xử lý xong (khi bot tắt) để xử lý lại sau."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO pending_notifications (job_name, build_number, status, build_target, build_request_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (job_name, build_number_str, status, build_target, build_request_id))
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Database error while saving pending notification: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+@_timed_query
+def pop_pending_notifications() -> List[Dict[str, Any]]:
+    """Lấy và xóa tất cả thông báo đang chờ xử lý lại (trong cùng một transaction)."""
+    conn = None
+    try:
+        conn = sqlite3.connect(config.DB_FILE)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT job_name, build_number AS build_number_str, status, build_target, build_request_id
+            FROM pending_notifications
+            ORDER BY id
+        """)
+        rows = [dict(row) for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM pending_notifications")
+        conn.commit()
+        return rows
+    except sqlite3.Error as e:
+        logger.error(f"Database error while loading pending notifications: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def ping(timeout: float = 5.0) -> None:
+    """
+    Kiểm tra database còn phản hồi (dùng cho /readyz).
+
+    Khác với các hàm khác, lỗi được ném ra để phía gọi biết database không sẵn sàng.
+    """
+    conn = sqlite3.connect(config.DB_FILE, timeout=timeout)
+    try:
+        conn.execute("SELECT 1").fetchone()
+    finally:
+        conn.close()
@@ -0,0 +1,143 @@
+# folder_index.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import config
+import metrics
+from lazy_imports import lazy_import
+from log_filters import add_html_filter_to_logger
+
+jenkins = lazy_import('jenkins')
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+# Thời gian (giây) giữ danh sách con của một thư mục trong cache
+FOLDER_INDEX_TTL = getattr(config, 'FOLDER_INDEX_TTL', 300)
+# Số lệnh gọi Jenkins chạy nền đồng thời tối đa cho mỗi người dùng khi prefetch
+PREFETCH_CONCURRENCY = getattr(config, 'FOLDER_PREFETCH_CONCURRENCY', 4)
+# Số index (mỗi người dùng/Jenkins một index) được giữ trong bộ nhớ
+MAX_INDEXES = 100
+
+# Các loại item có thể mở ra như thư mục (Folder, Organization Folder, Multibranch Pipeline)
+_CONTAINER_CLASS_MARKERS = ('folder', 'multibranch', 'organization')
+
+
+def _entry_kind(item: Dict) -> str:
+    item_class = item.get('_class', '').lower()
+    return 'folder' if any(marker in item_class for marker in _CONTAINER_CLASS_MARKERS) else 'job'
+
+
+def join_path(path: str, name: str) -> str:
+    return f"{path}/{name}" if path else name
+
+
+def parent_path(path: str) -> str:
+    return path.rsplit('/', 1)[0] if '/' in path else ''
+
+
+class FolderIndex:
+    """
+    Cache cây thư mục Jenkins của một người dùng: path -> danh sách con [{'name', 'kind'}].
+
+    Các lệnh gọi python-jenkins (đồng bộ) chạy trong thread riêng để không chặn event loop.
+    Trong lúc người dùng đọc một cấp, các thư mục con được prefetch ở nền để lần bấm tiếp
+    theo trả về ngay từ cache.
+    """
+
+    def __init__(self, jenkins_url: str, username: str, token: str, ttl: float = FOLDER_INDEX_TTL,
+                 concurrency: int = PREFETCH_CONCURRENCY):
+        # Tạo client ở thread của event loop để module jenkins (nạp lười) được nạp trước khi
+        # được dùng đồng thời từ nhiều thread
+        self._server = jenkins.Jenkins(jenkins_url, username=username, password=token)
+        self.ttl = ttl
+        self._children: Dict[str, Tuple[float, List[Dict[str, str]]]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _fetch_sync(self, path: str) -> List[Dict[str, str]]:
+        if path:
+            with metrics.track_jenkins_call('get_job_info'):
+                items = self._server.get_job_info(path).get('jobs', [])
+        else:
+            with metrics.track_jenkins_call('get_jobs'):
+                items = self._server.get_jobs(folder_depth=0)
+        return [{'name': item['name'], 'kind': _entry_kind(item)} for item in items if item.get('name')]
+
+    async def _fetch(self, path: str, background: bool) -> List[Dict[str, str]]:
+        try:
+            if background:
+                async with self._semaphore:
+                    children = await asyncio.to_thread(self._fetch_sync, path)
+            else:
+                # Thư mục người dùng đang mở không phải xếp hàng sau các lần prefetch
+                children = await asyncio.to_thread(self._fetch_sync, path)
+            self._children[path] = (time.monotonic() + self.ttl, children)
+            return children
+        finally:
+            self._inflight.pop(path, None)
+
+    def cached(self, path: str) -> Optional[List[Dict[str, str]]]:
+        entry = self._children.get(path)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def invalidate(self, path: str) -> None:
+        self._children.pop(path, None)
+
+    def _start_fetch(self, path: str, background: bool = False) -> asyncio.Task:
+        task = self._inflight.get(path)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(path, background))
+            self._inflight[path] = task
+        return task
+
+    async def children(self, path: str = '') -> List[Dict[str, str]]:
+        """Danh sách con của `path` ('' là gốc), từ cache hoặc từ Jenkins (dùng chung lần tải đang chạy)."""
+        cached = self.cached(path)
+        if cached is not None:
+            return cached
+        # shield: người dùng hủy thao tác không làm hủy lần tải mà prefetch khác đang chờ
+        return await asyncio.shield(self._start_fetch(path))
+
+    def prefetch_subfolders(self, path: str) -> None:
+        """Tải trước danh sách con của các thư mục con của `path` ở nền."""
+        children = self.cached(path) or []
+        for child in children:
+            child_path = join_path(path, child['name'])
+            if child['kind'] == 'folder' and self.cached(child_path) is None:
+                task = self._start_fetch(child_path, background=True)
+                task.add_done_callback(self._log_prefetch_error)
+
+    @staticmethod
+    def _log_prefetch_error(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Folder prefetch failed: {task.exception()}")
+
+
+# Khóa gồm cả token: /login lại với token mới cập nhật dòng trong database chứ không gọi
+# forget_user, nên index (và client) giữ token cũ không được dùng lại
+_indexes: "OrderedDict[Tuple[int, str, str, str], FolderIndex]" = OrderedDict()
+
+def get_folder_index(user_id: int, creds: Dict[str, str]) -> FolderIndex:
+    """Trả về FolderIndex của người dùng (tạo mới nếu thông tin đăng nhập thay đổi)."""
+    key = (user_id, creds['jenkins_url'], creds['jenkins_userid'], creds['jenkins_token'])
+    index = _indexes.get(key)
+    if index is None:
+        # Bỏ index tạo bằng thông tin đăng nhập cũ của người dùng
+        forget_user(user_id)
+        index = FolderIndex(creds['jenkins_url'], creds['jenkins_userid'], creds['jenkins_token'])
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    _indexes.move_to_end(key)
+    return index
+
+def forget_user(user_id: int) -> None:
+    """Xóa index của người dùng (ví dụ khi /logout)."""
+    for key in [key for key in _indexes if key[0] == user_id]:
+        del _indexes[key]
@@ -7,3 +7,7 @@ add_html_filter_to_logger('handlers')
 add_html_filter_to_logger('handlers.commands')
 add_html_filter_to_logger('handlers.setup')
 add_html_filter_to_logger('handlers.build')
+add_html_filter_to_logger('handlers.stats')
+add_html_filter_to_logger('handlers.profile')
+add_html_filter_to_logger('handlers.keyboards')
+add_html_filter_to_logger('handlers.schedule')
@@ -1,25 +1,29 @@
 # handlers/build.py
 import logging
-import uuid
 import json
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-import jenkins
 
 import database
 import security
 import config
+import metrics
+import rendering
+import build_trigger
+import queue_tracker
 from timeout_handler import TimeoutConversationHandler
+from lazy_imports import lazy_import
+from handlers import keyboards
+from callback_store import parse_callback_data
 
-logger = logging.getLogger(__name__)
+# python-jenkins chỉ được nạp khi có lệnh gọi Jenkins API đầu tiên
+jenkins = lazy_import('jenkins')
 
-def escape_markdown_v2(text: str) -> str:
-    """Escapes special characters for Telegram's MarkdownV2 parse mode."""
-    escape_chars = r'_*[]()~`>#+-=|{}.!'
-    return "".join(f"\\{char}" if char in escape_chars else char for char in text)
+logger = logging.getLogger(__name__)
 
 # Định nghĩa các trạng thái mới cho quy trình build tuần tự
-SELECT_BRANCH, SELECT_TARGET = range(2)
+SELECT_BRANCH, SELECT_TARGET, SELECT_JOB = range(3)
 
 
 async def build_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -57,28 +61,37 @@ async def build_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context, message.chat_id, message.message_id, "build"
     )
 
-def _build_options_keyboard(items: list, item_type: str, back_callback: str = None) -> InlineKeyboardMarkup:
-    """Tạo bàn phím inline cho các lựa chọn build (branch, target)."""
-    icons = {"branch": "🔀", "target": "🎯"}
-    icon = icons.get(item_type, "")
-    
-    keyboard = [
-        # Sử dụng f-string để tạo callback_data duy nhất
-        [InlineKeyboardButton(f"{icon} {item}", callback_data=f"build_select_{item_type}:{item}")]
-        for item in items
-    ]
-    
-    control_row = []
-    if back_callback:
-        control_row.append(InlineKeyboardButton("⬅️ Back", callback_data=back_callback))
-    control_row.append(InlineKeyboardButton("❌ Cancel", callback_data="build_cancel"))
-    keyboard.append(control_row)
-    
-    return InlineKeyboardMarkup(keyboard)
+def _build_options_keyboard(message, owner_id: int, job_name: str, items: list, item_type: str,
+                            back_callback: str = None, confirm_label: str = None) -> InlineKeyboardMarkup:
+    """Tạo bàn phím phân trang cho các lựa chọn build (branch, target) và gắn vào tin nhắn."""
+    keyboard = keyboards.PaginatedKeyboard(
+        f"build_select_{item_type}", items, item_type, owner_id,
+        recent=keyboards.recent_items(message.chat_id, f"{item_type}:{job_name}"),
+        back_callback=back_callback,
+        confirm_label=confirm_label,
+    )
+    return keyboards.attach(keyboard)
+
+def _job_keyboard(message, owner_id: int, jobs: list) -> InlineKeyboardMarkup:
+    """Bàn phím chọn job khi nhóm được liên kết với nhiều job."""
+    keyboard = keyboards.PaginatedKeyboard(
+        "build_select_job", jobs, "job", owner_id,
+        recent=keyboards.recent_items(message.chat_id, "job"),
+    )
+    return keyboards.attach(keyboard)
+
+def _branch_keyboard(message, context: ContextTypes.DEFAULT_TYPE) -> InlineKeyboardMarkup:
+    """Bàn phím chọn branch của job đang chọn (có nút quay lại chọn job nếu nhóm có nhiều job)."""
+    branches = context.user_data.get('job_params', {}).get('GIT_BRANCH', {}).get('choices', [])
+    back_callback = "build_back_to_job" if len(context.user_data.get('group_jobs', [])) > 1 else None
+    return _build_options_keyboard(
+        message, context.user_data['owner_id'], context.user_data['job_name'], branches, 'branch',
+        back_callback=back_callback
+    )
 
 
 async def build_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Bắt đầu cuộc hội thoại build: lấy tham số và hỏi branch."""
+    """Bắt đầu cuộc hội thoại build: chọn job (nếu nhóm có nhiều job) rồi lấy tham số và hỏi branch."""
     query = update.callback_query
     if not query or not query.message or not query.from_user:
         return ConversationHandler.END
@@ -88,15 +101,62 @@ async def build_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     chat = query.message.chat
     context.user_data['owner_id'] = user.id
 
-    group_config = database.get_group_config(chat.id)
-    if not group_config:
+    group_jobs = [job_path for job_path, _ in database.get_group_jobs(chat.id)]
+    if not group_jobs:
         await query.edit_message_text("This group is not set up. Please use /setup first.")
         return ConversationHandler.END
+    context.user_data['group_jobs'] = group_jobs
+
+    if not database.is_user_logged_in(user.id):
+        await query.message.reply_html(f"You ({user.mention_html()}) need to /login first.")
+        await query.delete_message()
+        return ConversationHandler.END
+
+    if len(group_jobs) > 1:
+        keyboard = _job_keyboard(query.message, user.id, group_jobs)
+        await query.edit_message_text("🔨 This group is linked to several jobs. Please select one to build:", reply_markup=keyboard)
+        TimeoutConversationHandler.set_timeout_metadata(
+            context, chat.id, query.message.message_id, "build"
+        )
+        return SELECT_JOB
+
+    return await _load_job_parameters(query, context, group_jobs[0])
+
+async def select_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Xử lý việc chọn job khi nhóm được liên kết với nhiều job."""
+    query = update.callback_query
+    if not query or not query.message or not context.user_data or not query.from_user:
+        return ConversationHandler.END
+    await query.answer()
+
+    if query.from_user.id != context.user_data.get('owner_id'):
+        await query.answer("You are not the one who initiated this command.", show_alert=True)
+        return SELECT_JOB
 
-    job_name = group_config[0]
+    if query.data == 'build_select_job:cancel':
+        return await cancel_build(update, context)
+
+    job_name = await keyboards.handle_callback(query)
+    if job_name is None:
+        return SELECT_JOB
+    if job_name not in [job_path for job_path, _ in database.get_group_jobs(query.message.chat.id)]:
+        # Job đã bị hủy liên kết trong lúc đang chọn
+        keyboards.discard(query.message)
+        await query.edit_message_text(f"❌ Job '{job_name}' is no longer linked to this group. Please use /build again.")
+        context.user_data.clear()
+        return ConversationHandler.END
+
+    keyboards.discard(query.message)
+    keyboards.remember(query.message.chat.id, "job", job_name)
+    return await _load_job_parameters(query, context, job_name)
+
+async def _load_job_parameters(query, context: ContextTypes.DEFAULT_TYPE, job_name: str) -> int:
+    """Lấy định nghĩa tham số của job từ Jenkins và hiển thị bàn phím chọn branch."""
+    user = query.from_user
+    chat = query.message.chat
     context.user_data['job_name'] = job_name
     
-    await query.edit_message_text(f"🔍 Loading parameters for `{escape_markdown_v2(job_name)}`\\.\\.\\.", parse_mode='MarkdownV2')
+    await query.edit_message_text(rendering.render_loading_parameters(job_name), parse_mode='MarkdownV2')
 
     user_creds = database.get_user_credentials(user.id)
     if not user_creds:
@@ -106,7 +166,8 @@ async def build_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
     try:
         server = jenkins.Jenkins(user_creds['jenkins_url'], username=user_creds['jenkins_userid'], password=user_creds['jenkins_token'])
-        job_info = server.get_job_info(job_name, depth=2)
+        with metrics.track_jenkins_call('get_job_info'):
+            job_info = server.get_job_info(job_name, depth=2)
         
         param_defs = {}
         # Tìm đúng mục chứa định nghĩa tham số trong list 'actions'
@@ -136,7 +197,7 @@ async def build_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
             await query.edit_message_text("❌ Could not find any GIT_BRANCH parameter for this job. Please check Jenkins job configuration and permissions.")
             return ConversationHandler.END
 
-        keyboard = _build_options_keyboard(branches, 'branch')
+        keyboard = _branch_keyboard(query.message, context)
         await query.edit_message_text("🔀 Please select a branch to build:", reply_markup=keyboard)
         
         # Lưu metadata cho timeout handler
@@ -177,8 +238,20 @@ async def select_branch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     # Kiểm tra nếu là nút Cancel
     if query.data == 'build_select_branch:cancel':
         return await cancel_build(update, context)
+
+    # Quay lại bước chọn job
+    if query.data == "build_back_to_job":
+        keyboards.discard(query.message)
+        for key in ('job_name', 'job_params'):
+            context.user_data.pop(key, None)
+        keyboard = _job_keyboard(query.message, query.from_user.id, context.user_data.get('group_jobs', []))
+        await query.edit_message_text("🔨 This group is linked to several jobs. Please select one to build:", reply_markup=keyboard)
+        return SELECT_JOB
         
-    selected_branch = query.data.split(':', 1)[1]
+    selected_branch = await keyboards.handle_callback(query)
+    if selected_branch is None:
+        # Chuyển trang / tìm kiếm: vẫn ở bước chọn branch
+        return SELECT_BRANCH
     context.user_data['selected_branch'] = selected_branch
 
     job_params = context.user_data.get('job_params', {})
@@ -188,14 +261,17 @@ async def select_branch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         await query.edit_message_text("❌ Could not find any BUILD_TARGET parameter for this job.")
         return ConversationHandler.END
         
-    keyboard = _build_options_keyboard(targets, 'target', back_callback="build_back_to_branch")
-    msg = f"🔀 Branch: `{escape_markdown_v2(selected_branch)}`\n\n🎯 Please select a build target:"
+    keyboard = _build_options_keyboard(
+        query.message, query.from_user.id, context.user_data['job_name'], targets, 'target',
+        back_callback="build_back_to_branch", confirm_label="🚀 Build selected"
+    )
+    msg = rendering.render_branch_selected(selected_branch)
     await query.edit_message_text(msg, reply_markup=keyboard, parse_mode='MarkdownV2')
     
     return SELECT_TARGET
 
 async def select_target(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Xử lý việc chọn target, trigger build hoặc quay lại."""
+    """Xử lý việc chọn một hoặc nhiều target, trigger build hoặc quay lại."""
     query = update.callback_query
     if not query or not query.message or not context.user_data or not query.from_user:
         return ConversationHandler.END
@@ -207,9 +283,8 @@ async def select_target(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         
     # Xử lý nút "Back"
     if query.data == "build_back_to_branch":
-        job_params = context.user_data.get('job_params', {})
-        branches = job_params.get('GIT_BRANCH', {}).get('choices', [])
-        keyboard = _build_options_keyboard(branches, 'branch')
+        context.user_data.pop('selected_branch', None)
+        keyboard = _branch_keyboard(query.message, context)
         await query.edit_message_text("🔀 Please select a branch to build:", reply_markup=keyboard)
         return SELECT_BRANCH
         
@@ -217,63 +292,264 @@ async def select_target(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     if query.data == "build_select_target:cancel":
         return await cancel_build(update, context)
 
-    # Xử lý chọn target và trigger build
-    selected_target = query.data.split(':', 1)[1]
+    # Bấm một target là build ngay; ở chế độ chọn nhiều, build được trigger khi bấm nút xác nhận
+    selected_targets = await keyboards.handle_multi_select_callback(query)
+    if selected_targets is None:
+        return SELECT_TARGET
+    keyboards.discard(query.message)
     job_name = context.user_data['job_name']
     selected_branch = context.user_data['selected_branch']
     owner_id = context.user_data['owner_id']
+    chat_id = query.message.chat.id
     user_creds = database.get_user_credentials(owner_id)
 
-    params = {
-        'GIT_BRANCH': selected_branch,
-        'BUILD_TARGET': selected_target,
-        'BUILD_REQUEST_ID': str(uuid.uuid4()) # Sửa tên tham số cho đúng
-    }
-    
     try:
-        server = jenkins.Jenkins(user_creds['jenkins_url'], username=user_creds['jenkins_userid'], password=user_creds['jenkins_token'])
-        server.build_job(job_name, parameters=params)
-        
-        database.save_build_request(
-            params['BUILD_REQUEST_ID'], # Sử dụng đúng key
-            job_name, 
-            query.message.chat.id, 
-            owner_id,
-            selected_target # Thêm lại tham số build_target
-        )
-        
-        job_name_md = escape_markdown_v2(job_name)
-        branch_md = escape_markdown_v2(selected_branch)
-        target_md = escape_markdown_v2(selected_target)
-        
-        message = (
-            f"✅ *Build Triggered\!*\n\n"
-            f"🔨 *Job:* `{job_name_md}`\n"
-            f"🔀 *Branch:* `{branch_md}`\n"
-            f"🎯 *Target:* `{target_md}`\n\n"
-            f"I will notify you when it's complete\\."
-        )
-        await query.edit_message_text(message, parse_mode='MarkdownV2')
-    except jenkins.JenkinsException as e:
-        logger.error(f"Jenkins API error in select_target: {e}")
-        error_message = str(e).lower()
-        if "401" in error_message or "unauthorized" in error_message:
-            await query.edit_message_text("❌ Authentication failed. Your Jenkins credentials may have expired. Please /logout and /login again.")
-        elif "404" in error_message or "not found" in error_message:
-            await query.edit_message_text(f"❌ Job '{job_name}' not found or you don't have permission to access it.")
-        elif "timeout" in error_message:
-            await query.edit_message_text("❌ Connection to Jenkins timed out. Please try again later.")
+        if not user_creds:
+            await query.edit_message_text("Could not find your credentials. Please /login again.")
+        elif len(selected_targets) == 1:
+            await _trigger_single(query, user_creds, job_name, selected_branch, selected_targets[0], owner_id)
         else:
-            await query.edit_message_text("❌ Failed to start the build on Jenkins. Please try again later.")
+            await _trigger_batch(query, user_creds, job_name, selected_branch, selected_targets, owner_id)
     except Exception as e:
         logger.error(f"Error starting build: {e}")
         await query.edit_message_text("❌ Failed to start the build on Jenkins. Please try again later.")
+
+    keyboards.remember(chat_id, f"branch:{job_name}", selected_branch)
+    for target in reversed(selected_targets):
+        keyboards.remember(chat_id, f"target:{job_name}", target)
     
     # Xóa timeout metadata khi hoàn thành
     TimeoutConversationHandler.clear_timeout_metadata(context)    
     context.user_data.clear()
     return ConversationHandler.END
 
+def _trigger_error_reason(e: Exception, job_name: str) -> str:
+    """Lý do (cho người dùng) khi không trigger được build trên Jenkins."""
+    error_message = str(e).lower()
+    if "401" in error_message or "unauthorized" in error_message:
+        return "Authentication failed. Your Jenkins credentials may have expired. Please /logout and /login again."
+    if "404" in error_message or "not found" in error_message:
+        return f"Job '{job_name}' not found or you don't have permission to access it."
+    if "timeout" in error_message:
+        return "Connection to Jenkins timed out. Please try again later."
+    return "Failed to start the build on Jenkins. Please try again later."
+
+def _triggered_text(result: dict, job_name: str, branch: str, target: str) -> str:
+    if result['coalesced']:
+        return rendering.render_build_coalesced(job_name, branch, target)
+    return rendering.render_build_triggered(job_name, branch, target)
+
+def _track_single(message, result: dict, creds: dict, job_name: str, text: str, reply_markup) -> None:
+    """Hiển thị vị trí trong hàng đợi Jenkins và thời gian dự kiến ngay trên tin nhắn trigger."""
+    tracker = queue_tracker.get_tracker()
+    if tracker:
+        tracker.track(
+            message.chat.id, message.message_id, [result], creds, job_name,
+            lambda progress: rendering.render_with_progress(text, progress.get(result['build_request_id'])),
+            reply_markup=reply_markup
+        )
+
+async def _trigger_single(query, creds: dict, job_name: str, branch: str, target: str, owner_id: int) -> None:
+    """Trigger một target, giữ nguyên tin nhắn xác nhận như trước."""
+    [result] = await build_trigger.trigger_builds(creds, job_name, branch, [target], query.message.chat.id, owner_id)
+    if result['error'] is not None:
+        await query.edit_message_text(f"❌ {_trigger_error_reason(result['error'], job_name)}")
+        return
+    message = _triggered_text(result, job_name, branch, target)
+    reply_markup = keyboards.abort_keyboard([result])
+    await query.edit_message_text(message, parse_mode='MarkdownV2', reply_markup=reply_markup)
+    _track_single(query.message, result, creds, job_name, message, reply_markup)
+
+async def _trigger_batch(query, creds: dict, job_name: str, branch: str, targets: list, owner_id: int) -> None:
+    """
+    Trigger nhiều target song song thành một lô build.
+
+    Tin nhắn hiện tại trở thành tin nhắn trạng thái chung của lô, được queue_tracker cập nhật
+    khi các build di chuyển trong hàng đợi và được webhook cập nhật mỗi khi một target hoàn thành.
+    """
+    chat_id = query.message.chat.id
+    batch_id = build_trigger.new_batch_id()
+    # Lưu lô trước khi trigger để webhook của build kết thúc sớm vẫn tìm thấy lô
+    database.save_build_batch(batch_id, job_name, branch, chat_id, owner_id, query.message.message_id)
+    await query.edit_message_text(f"🚀 Triggering {len(targets)} builds of {job_name}...")
+
+    results = await build_trigger.trigger_builds(creds, job_name, branch, targets, chat_id, owner_id, batch_id=batch_id)
+    failures = [
+        {'target': result['target'], 'error': _trigger_error_reason(result['error'], job_name)}
+        for result in results if result['error'] is not None
+    ]
+    if failures:
+        database.save_build_batch_failures(batch_id, failures)
+    if len(failures) == len(results):
+        await query.edit_message_text(f"❌ {_trigger_error_reason(results[0]['error'], job_name)}")
+        return
+
+    reply_markup = keyboards.abort_keyboard(results)
+    batch = build_trigger.render_batch(batch_id)
+    if batch:
+        await query.edit_message_text(batch['text'], parse_mode='MarkdownV2', reply_markup=reply_markup)
+
+    tracker = queue_tracker.get_tracker()
+    if tracker:
+        tracker.track(
+            chat_id, query.message.message_id, results, creds, job_name,
+            lambda progress: (build_trigger.render_batch(batch_id, progress) or {}).get('text'),
+            reply_markup=reply_markup
+        )
+
+async def _rebuild(chat_message, user, build_request) -> Optional[str]:
+    """
+    Trigger lại build với branch/target đã lưu trong build_requests, không tải thông tin job
+    từ Jenkins. Tin nhắn xác nhận được gửi dưới dạng trả lời `chat_message`.
+
+    Trả về lý do (cho người dùng) nếu không trigger được, None nếu thành công.
+    """
+    chat_id = chat_message.chat.id
+    job_name = build_request['jenkins_job_path']
+    if not build_request['branch']:
+        return "This build was started before branches were recorded. Please use /build instead."
+    if job_name not in [job_path for job_path, _ in database.get_group_jobs(chat_id)]:
+        return f"Job '{job_name}' is no longer linked to this group."
+    creds = database.get_user_credentials(user.id)
+    if not creds:
+        return "You must /login in a private chat with me before rebuilding."
+
+    branch, target = build_request['branch'], build_request['build_target'] or ''
+    logger.info(f"User {user.id} rebuilding {job_name} (branch={branch}, target={target}) from request {build_request['build_id']}")
+    [result] = await build_trigger.trigger_builds(creds, job_name, branch, [target], chat_id, user.id)
+    if result['error'] is not None:
+        return f"❌ {_trigger_error_reason(result['error'], job_name)}"
+    message = _triggered_text(result, job_name, branch, target)
+    reply_markup = keyboards.abort_keyboard([result])
+    sent = await chat_message.reply_text(message, parse_mode='MarkdownV2', reply_markup=reply_markup)
+    _track_single(sent, result, creds, job_name, message, reply_markup)
+    return None
+
+async def rebuild_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/rebuild [target]: trigger lại build gần nhất của nhóm (hoặc của target) bằng tham số đã lưu."""
+    user = update.effective_user
+    if not update.message or not user:
+        return
+
+    logger.info(f"Received /rebuild command from {user.first_name} (ID: {user.id}) in chat {update.message.chat.id}")
+
+    if update.message.chat.type == "private":
+        await update.message.reply_text("This command only works in a group chat.")
+        return
+
+    target = " ".join(context.args) if context.args else None
+    build_request = database.get_last_rebuildable_request(update.message.chat.id, target)
+    if not build_request:
+        suffix = f" for target '{target}'" if target else ""
+        await update.message.reply_text(f"No previous build{suffix} to rebuild in this group. Please use /build.")
+        return
+
+    error = await _rebuild(update.message, user, build_request)
+    if error:
+        await update.message.reply_text(error)
+
+async def rebuild_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Nút Rebuild trên thông báo kết quả build."""
+    query = update.callback_query
+    if not query or not query.message or not query.from_user:
+        return
+
+    _, build_request_id = parse_callback_data(query.data, 2)
+    build_request = database.get_build_request(build_request_id)
+    if not build_request:
+        await query.answer("This build request was not found.", show_alert=True)
+        return
+
+    error = await _rebuild(query.message, query.from_user, build_request)
+    if error:
+        await query.answer(error, show_alert=True)
+    else:
+        await query.answer("Rebuild triggered.")
+
+def _abort_error_reason(e: Exception) -> str:
+    """Lý do (cho người dùng) khi không dừng được build trên Jenkins."""
+    if isinstance(e, ValueError):
+        return str(e)
+    error_message = str(e).lower()
+    if "401" in error_message or "unauthorized" in error_message:
+        return "Authentication failed. Your Jenkins credentials may have expired. Please /logout and /login again."
+    if "403" in error_message or "forbidden" in error_message:
+        return "Your Jenkins account is not allowed to abort this build."
+    if "timeout" in error_message:
+        return "Connection to Jenkins timed out. Please try again later."
+    return "Failed to abort the build on Jenkins. Please try again later."
+
+async def abort_build_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Nút Abort trên tin nhắn trigger: hủy build còn trong hàng đợi hoặc dừng build đang chạy.
+
+    Lệnh được gửi bằng tài khoản Jenkins của người bấm, nên quyền hủy/dừng do Jenkins quyết định.
+    Với build dùng chung (yêu cầu trùng đã được gộp), người bấm chỉ rời build; build chỉ bị
+    hủy/dừng khi người yêu cầu cuối cùng bấm Abort.
+    """
+    query = update.callback_query
+    if not query or not query.message or not query.from_user:
+        return
+
+    _, build_request_id = parse_callback_data(query.data, 2)
+    build_request = database.get_build_request(build_request_id)
+    if not build_request:
+        await query.answer("This build request was not found.", show_alert=True)
+        return
+    if build_request['status']:
+        await query.answer(f"This build has already finished ({build_request['status']}).", show_alert=True)
+        return
+
+    job_name = build_request['jenkins_job_path']
+    target = build_request['build_target'] or 'Unknown'
+    user_name = query.from_user.first_name
+    tracker = queue_tracker.get_tracker()
+    # Build được gộp cho nhiều người yêu cầu: người bấm chỉ rời build, build vẫn chạy cho những người còn lại
+    try:
+        left_batches = build_trigger.detach_requester(build_request, query.from_user.id)
+    except ValueError as e:
+        await query.answer(f"❌ {e}", show_alert=True)
+        return
+    if left_batches is not None:
+        await query.answer("You left this build, it keeps running for the other requesters.")
+        chat_id, message_id = query.message.chat.id, query.message.message_id
+        reply_markup = keyboards.remove_abort_button(query.message.reply_markup, build_request_id)
+        if tracker and tracker.is_tracking_message(chat_id, message_id):
+            await tracker.release(chat_id, message_id, build_request_id, rendering.render_left_by(user_name), reply_markup)
+        else:
+            try:
+                await query.edit_message_reply_markup(reply_markup=reply_markup)
+            except Exception as e:
+                logger.debug(f"Could not remove the Abort button of build request {build_request_id}: {e}")
+        await query.message.reply_text(
+            f"👋 {user_name} left the shared {target} build of {job_name}, it keeps running for the other requesters."
+        )
+        return
+
+    creds = database.get_user_credentials(query.from_user.id)
+    if not creds:
+        await query.answer("You must /login in a private chat with me before aborting builds.", show_alert=True)
+        return
+
+    logger.info(f"User {query.from_user.id} requested abort of build request {build_request_id} ({job_name}, target={target})")
+    try:
+        outcome, build_number = await build_trigger.abort_build(creds, build_request)
+    except Exception as e:
+        logger.error(f"Failed to abort build request {build_request_id} of {job_name}: {e}")
+        await query.answer(f"❌ {_abort_error_reason(e)}", show_alert=True)
+        return
+
+    if outcome == 'cancelled':
+        await query.answer("Build cancelled.")
+        if tracker:
+            await tracker.finish(build_request_id, rendering.render_cancelled_by(user_name))
+        await query.message.reply_text(f"🚫 {user_name} cancelled the queued {target} build of {job_name}.")
+    else:
+        await query.answer(f"Stopping build #{build_number}...")
+        if tracker:
+            await tracker.annotate(build_request_id, rendering.render_abort_requested(user_name))
+        await query.message.reply_text(f"⛔ {user_name} aborted {job_name} #{build_number} ({target}).")
+
 async def cancel_build_initial(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Hủy cuộc hội thoại build ở bước đầu tiên."""
     query = update.callback_query
@@ -293,6 +569,7 @@ async def cancel_build(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     await query.answer()
     
     if query.from_user.id == context.user_data.get('owner_id'):
+        keyboards.discard(query.message)
         await query.edit_message_text("Build process canceled.")
         TimeoutConversationHandler.clear_timeout_metadata(context)
         context.user_data.clear()
@@ -303,4 +580,6 @@ async def cancel_build(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         # Xác định trạng thái hiện tại để quay về cho đúng
         if 'selected_branch' in context.user_data:
             return SELECT_TARGET
+        if 'job_name' not in context.user_data:
+            return SELECT_JOB
         return SELECT_BRANCH
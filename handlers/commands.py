@@ -4,12 +4,17 @@ import os
 import re
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
-import jenkins
 
 import database
 import security
 import config
+import metrics
+import folder_index
 from timeout_handler import TimeoutConversationHandler
+from lazy_imports import lazy_import
+
+# python-jenkins chỉ được nạp khi có lệnh gọi Jenkins API đầu tiên
+jenkins = lazy_import('jenkins')
 
 # Cấu hình logger riêng cho module này
 logger = logging.getLogger(__name__)
@@ -27,7 +32,12 @@ def get_help_message(is_logged_in=False, mention_html=None):
             f"Hi {mention_html}! You are already logged in.\n\n"
             "You can use these commands:\n"
             "  /setup - (In a group) Link a group to a Jenkins job\n"
+            "  /jobs - (In a group) List or unlink the group's Jenkins jobs\n"
             "  /build - (In a group) Start a new build\n"
+            "  /rebuild [target] - (In a group) Re-run the last build with the same branch and target\n"
+            "  /schedule - (In a group) Manage recurring builds\n"
+            "  /stats [job] - (In a group) Show build statistics\n"
+            "  /history [job] - (In a group) Show recent builds\n"
             "  /logout - Disconnect your Jenkins account\n"
             "  /document - Show documentation link\n"
             "  /setdocument - Update documentation link (admin only)\n"
@@ -44,7 +54,12 @@ def get_help_message(is_logged_in=False, mention_html=None):
             "/login - Connect your Jenkins account\n"
             "/logout - Disconnect your Jenkins account\n"
             "/setup - (In a group) Link a group to a Jenkins job\n"
+            "/jobs - (In a group) List or unlink the group's Jenkins jobs\n"
             "/build - (In a group) Start a new build\n"
+            "/rebuild [target] - (In a group) Re-run the last build with the same branch and target\n"
+            "/schedule - (In a group) Manage recurring builds\n"
+            "/stats [job] - (In a group) Show build statistics\n"
+            "/history [job] - (In a group) Show recent builds\n"
             "/document - Show documentation link\n"
             "/setdocument - Update documentation link (admin only)\n"
             "/help - Show this help message"
@@ -211,6 +226,7 @@ async def logout_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = update.effective_user.id
     if database.is_user_logged_in(user_id):
         database.delete_user(user_id)
+        folder_index.forget_user(user_id)
         await update.message.reply_text("You have been successfully logged out.")
     else:
         await update.message.reply_text("You are not logged in.")
@@ -254,7 +270,8 @@ async def get_token(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text("Verifying credentials...")
     try:
         server = jenkins.Jenkins(jenkins_url, username=jenkins_userid, password=jenkins_token, timeout=10)
-        user_info = server.get_whoami()
+        with metrics.track_jenkins_call('get_whoami'):
+            user_info = server.get_whoami()
         encrypted_token = security.encrypt_data(jenkins_token)
         database.save_user(update.effective_user.id, jenkins_url, jenkins_userid, encrypted_token)
         await update.message.reply_text(f"✅ Success! Connected as '{user_info.get('fullName', 'Unknown User')}'.")
@@ -0,0 +1,319 @@
+# handlers/keyboards.py
+import logging
+import math
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.ext import ContextTypes
+
+import config
+import metrics
+from callback_store import CallbackStore, make_callback_data, parse_callback_data
+
+logger = logging.getLogger(__name__)
+
+# Số item trên mỗi trang bàn phím
+PAGE_SIZE = getattr(config, 'KEYBOARD_PAGE_SIZE', 8)
+# Số item dùng gần đây được đưa lên đầu danh sách
+RECENT_ITEMS = 5
+
+ICONS = {"folder": "🗂️", "job": "🔨", "branch": "🔀", "target": "🎯"}
+
+
+class PaginatedKeyboard:
+    """
+    Bàn phím inline phân trang, có lọc theo từ khóa.
+
+    Danh sách item được giữ phía server trong CallbackStore; callback_data chỉ chứa token của
+    bàn phím và chỉ số item hoặc lệnh điều hướng (ví dụ 'build_select_branch:Xk3a9Q:i:42'),
+    nên luôn nằm trong giới hạn 64 byte của Telegram dù tên branch/job dài đến đâu.
+
+    Với `confirm_label`, bàn phím có thêm nút "Select multiple": bình thường bấm một item là chọn
+    ngay item đó; sau khi bật chọn nhiều, bấm item để đánh dấu/bỏ đánh dấu rồi bấm nút xác nhận
+    để lấy danh sách đã chọn (xem handle_multi_select_callback).
+    """
+
+    def __init__(self, prefix: str, items: Sequence[str], item_type: str, owner_id: int,
+                 recent: Sequence[str] = (), back_callback: Optional[str] = None, page_size: int = PAGE_SIZE,
+                 item_types: Optional[Dict[str, str]] = None, confirm_label: Optional[str] = None):
+        self.prefix = prefix
+        self.item_type = item_type
+        # Loại riêng cho từng item khi danh sách có nhiều loại (ví dụ thư mục lẫn job)
+        self.item_types = item_types or {}
+        self.owner_id = owner_id
+        self.back_callback = back_callback
+        self.page_size = page_size
+        # Item dùng gần đây (còn tồn tại trong danh sách) được đưa lên đầu
+        available = set(items)
+        self.recent = [item for item in recent if item in available]
+        recent_set = set(self.recent)
+        self.items: List[str] = self.recent + [item for item in items if item not in recent_set]
+        self.search_text = ''
+        self.awaiting_search = False
+        self.page = 0
+        self.confirm_label = confirm_label
+        # Đang ở chế độ chọn nhiều (chỉ bật được khi có confirm_label)
+        self.selecting = False
+        # Chỉ số các item đã đánh dấu (chế độ chọn nhiều)
+        self.selected: Set[int] = set()
+        # Token trong CallbackStore, được gán khi attach()
+        self.token: Optional[str] = None
+
+    def _visible(self) -> List[int]:
+        """Chỉ số các item thỏa bộ lọc hiện tại."""
+        if not self.search_text:
+            return list(range(len(self.items)))
+        needle = self.search_text.lower()
+        return [index for index, item in enumerate(self.items) if needle in item.lower()]
+
+    @property
+    def page_count(self) -> int:
+        return max(1, math.ceil(len(self._visible()) / self.page_size))
+
+    def set_page(self, page: int) -> None:
+        self.page = min(max(page, 0), self.page_count - 1)
+
+    def set_search(self, text: str) -> None:
+        self.search_text = text.strip()
+        self.awaiting_search = False
+        self.page = 0
+
+    def item(self, index: int) -> Optional[str]:
+        if 0 <= index < len(self.items):
+            return self.items[index]
+        return None
+
+    @property
+    def multi_select(self) -> bool:
+        return self.confirm_label is not None and self.selecting
+
+    def toggle_multi_select(self) -> None:
+        """Bật/tắt chế độ chọn nhiều; tắt đi thì bỏ các đánh dấu."""
+        if self.confirm_label is None:
+            return
+        self.selecting = not self.selecting
+        self.selected.clear()
+
+    def toggle(self, index: int) -> None:
+        if 0 <= index < len(self.items):
+            self.selected.symmetric_difference_update({index})
+
+    def selected_items(self) -> List[str]:
+        """Các item đã đánh dấu, theo thứ tự hiển thị."""
+        return [self.items[index] for index in sorted(self.selected)]
+
+    def _data(self, *parts) -> str:
+        return make_callback_data(self.prefix, self.token, *parts)
+
+    def markup(self) -> InlineKeyboardMarkup:
+        icon = ICONS.get(self.item_type, "")
+        visible = self._visible()
+        start = self.page * self.page_size
+        recent_set = set(self.recent)
+
+        keyboard = []
+        for index in visible[start:start + self.page_size]:
+            item = self.items[index]
+            item_icon = ICONS.get(self.item_types.get(item), icon)
+            if item in recent_set and not self.search_text:
+                label = f"🕘 {item}"
+            else:
+                label = f"{item_icon} {item}"
+            if self.multi_select:
+                label = f"{'✅' if index in self.selected else '⬜'} {label}"
+            keyboard.append([InlineKeyboardButton(label, callback_data=self._data('i', index))])
+
+        if self.page_count > 1:
+            nav_row = []
+            if self.page > 0:
+                nav_row.append(InlineKeyboardButton("◀️", callback_data=self._data('p', self.page - 1)))
+            nav_row.append(InlineKeyboardButton(f"{self.page + 1}/{self.page_count}", callback_data=self._data('n')))
+            if self.page < self.page_count - 1:
+                nav_row.append(InlineKeyboardButton("▶️", callback_data=self._data('p', self.page + 1)))
+            keyboard.append(nav_row)
+
+        if self.search_text:
+            label = f"✖️ Clear filter '{self.search_text[:30]}' ({len(visible)})"
+            keyboard.append([InlineKeyboardButton(label, callback_data=self._data('c'))])
+        elif self.awaiting_search:
+            keyboard.append([InlineKeyboardButton("💬 Reply to this message with a search term", callback_data=self._data('n'))])
+        elif len(self.items) > self.page_size:
+            keyboard.append([InlineKeyboardButton("🔎 Search", callback_data=self._data('s'))])
+
+        if self.confirm_label is not None:
+            mode_label = "1️⃣ Select one" if self.selecting else "☑️ Select multiple"
+            mode_row = [InlineKeyboardButton(mode_label, callback_data=self._data('m'))]
+            if self.multi_select and self.selected:
+                label = f"{self.confirm_label} ({len(self.selected)})"
+                mode_row.append(InlineKeyboardButton(label, callback_data=self._data('d')))
+            keyboard.append(mode_row)
+
+        control_row = []
+        if self.back_callback:
+            control_row.append(InlineKeyboardButton("⬅️ Back", callback_data=self.back_callback))
+        control_row.append(InlineKeyboardButton("❌ Cancel", callback_data=f"{self.prefix}:cancel"))
+        keyboard.append(control_row)
+        return InlineKeyboardMarkup(keyboard)
+
+
+def abort_keyboard(results: Sequence[dict]) -> Optional[InlineKeyboardMarkup]:
+    """
+    Nút Abort cho các build vừa trigger (kết quả của build_trigger.trigger_builds).
+
+    callback_data chứa thẳng build_request_id nên nút vẫn dùng được sau khi bot khởi động lại.
+    """
+    results = [result for result in results if result.get('error') is None and result.get('build_request_id')]
+    if not results:
+        return None
+    buttons = [
+        InlineKeyboardButton(
+            "⛔ Abort" if len(results) == 1 else f"⛔ Abort {result['target']}",
+            callback_data=make_callback_data('build_abort', result['build_request_id'])
+        )
+        for result in results
+    ]
+    return InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+def remove_abort_button(markup: Optional[InlineKeyboardMarkup], build_request_id: str) -> Optional[InlineKeyboardMarkup]:
+    """Bỏ nút Abort của một build khỏi bàn phím của tin nhắn trigger (None nếu không còn nút nào)."""
+    if markup is None:
+        return None
+    callback_data = make_callback_data('build_abort', build_request_id)
+    rows = [[button for button in row if button.callback_data != callback_data] for row in markup.inline_keyboard]
+    rows = [row for row in rows if row]
+    return InlineKeyboardMarkup(rows) if rows else None
+
+# --- Lưu trữ bàn phím phía server (TTL bằng thời gian sống của conversation) ---
+
+_store = CallbackStore()
+metrics.CALLBACK_SESSIONS.set_function(lambda: len(_store))
+
+def attach(keyboard: PaginatedKeyboard) -> InlineKeyboardMarkup:
+    """Lưu bàn phím vào store và trả về reply_markup để gửi."""
+    keyboard.token = _store.put(keyboard)
+    return keyboard.markup()
+
+def _token_from_markup(message: Optional[Message]) -> Optional[str]:
+    """Lấy token bàn phím từ callback_data của các nút trên tin nhắn."""
+    markup = message.reply_markup if message else None
+    if not markup:
+        return None
+    for row in markup.inline_keyboard:
+        for button in row:
+            _, token, _ = parse_callback_data(button.callback_data or '', 3)
+            if token and _store.get(token) is not None:
+                return token
+    return None
+
+def get_keyboard_for_message(message: Optional[Message]) -> Optional[PaginatedKeyboard]:
+    token = _token_from_markup(message)
+    return _store.get(token) if token else None
+
+def discard(message: Optional[Message]) -> None:
+    """Xóa bàn phím đang hiển thị trên tin nhắn khi cuộc hội thoại kết thúc."""
+    token = _token_from_markup(message)
+    if token:
+        _store.pop(token)
+
+
+# --- Item dùng gần đây, theo từng chat và loại danh sách ---
+
+_recent: Dict[Tuple[int, str], deque] = {}
+
+def recent_items(chat_id: int, kind: str) -> List[str]:
+    return list(_recent.get((chat_id, kind), ()))
+
+def remember(chat_id: int, kind: str, item: str) -> None:
+    """Đánh dấu item vừa được chọn để lần sau hiển thị ở đầu danh sách."""
+    items = _recent.setdefault((chat_id, kind), deque(maxlen=RECENT_ITEMS))
+    if item in items:
+        items.remove(item)
+    items.appendleft(item)
+
+
+async def _resolve_callback(query) -> Tuple[Optional[PaginatedKeyboard], str, Optional[int]]:
+    """Tách callback_data thành (bàn phím, lệnh, giá trị); báo menu hết hạn nếu không còn bàn phím."""
+    _, token, rest = parse_callback_data(query.data, 3)
+    keyboard = _store.get(token) if token else None
+    if keyboard is None:
+        await query.edit_message_text("⌛ This menu has expired. Please start again.")
+        return None, '', None
+
+    action, _, value = rest.partition(':')
+    return keyboard, action, int(value) if value.isdigit() else None
+
+async def handle_callback(query) -> Optional[str]:
+    """
+    Xử lý callback của bàn phím phân trang gắn với tin nhắn của query.
+
+    Trả về item được chọn. Các callback điều hướng (chuyển trang, tìm kiếm, xóa bộ lọc)
+    được xử lý tại chỗ và trả về None.
+    """
+    keyboard, action, value = await _resolve_callback(query)
+    if keyboard is None:
+        return None
+    if action == 'i' and value is not None:
+        return keyboard.item(value)
+    await _navigate(query, keyboard, action, value)
+    return None
+
+async def handle_multi_select_callback(query) -> Optional[List[str]]:
+    """
+    Xử lý callback của bàn phím có nút "Select multiple".
+
+    Trả về [item] khi bấm một item ở chế độ thường, hoặc danh sách item đã đánh dấu khi bấm
+    nút xác nhận ở chế độ chọn nhiều. Bật/tắt chế độ, đánh dấu/bỏ đánh dấu và các callback
+    điều hướng được xử lý tại chỗ và trả về None.
+    """
+    keyboard, action, value = await _resolve_callback(query)
+    if keyboard is None:
+        return None
+    if action == 'd' and keyboard.multi_select and keyboard.selected:
+        return keyboard.selected_items()
+    if action == 'i' and value is not None:
+        if not keyboard.multi_select:
+            item = keyboard.item(value)
+            return [item] if item is not None else None
+        keyboard.toggle(value)
+        await query.edit_message_reply_markup(reply_markup=keyboard.markup())
+        return None
+    if action == 'm':
+        keyboard.toggle_multi_select()
+        await query.edit_message_reply_markup(reply_markup=keyboard.markup())
+        return None
+    await _navigate(query, keyboard, action, value)
+    return None
+
+async def _navigate(query, keyboard: PaginatedKeyboard, action: str, value: Optional[int]) -> None:
+    """Chuyển trang, bật tìm kiếm hoặc xóa bộ lọc rồi vẽ lại bàn phím."""
+    if action == 'p' and value is not None:
+        keyboard.set_page(value)
+    elif action == 'c':
+        keyboard.set_search('')
+    elif action == 's':
+        keyboard.awaiting_search = True
+    else:
+        # Nút hiển thị số trang: không làm gì
+        return
+    await query.edit_message_reply_markup(reply_markup=keyboard.markup())
+
+
+async def search_reply_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Lọc bàn phím khi người dùng trả lời (reply) tin nhắn chứa bàn phím bằng một từ khóa."""
+    message = update.message
+    if not message or not message.reply_to_message or not message.text:
+        return
+    keyboard = get_keyboard_for_message(message.reply_to_message)
+    if keyboard is None or message.from_user.id != keyboard.owner_id:
+        return
+
+    keyboard.set_search(message.text)
+    try:
+        await message.reply_to_message.edit_reply_markup(reply_markup=keyboard.markup())
+    except Exception as e:
+        logger.warning(f"Could not update keyboard after search: {e}")
+    # Xóa tin nhắn tìm kiếm cho gọn nhóm (cần quyền xóa tin nhắn, bỏ qua nếu không có)
+    try:
+        await message.delete()
+    except Exception:
+        pass
@@ -0,0 +1,51 @@
+# handlers/profile.py
+import io
+import logging
+import time
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import config
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# Thời gian profile mặc định và tối đa (giây)
+DEFAULT_PROFILE_SECONDS = 10
+MAX_PROFILE_SECONDS = 120
+
+async def profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/profile [seconds] - (Admin) Chạy cProfile trên event loop và gửi kết quả dưới dạng file."""
+    user = update.effective_user
+    admin_ids = getattr(config, 'ADMIN_IDS', [])
+    if not admin_ids or user.id not in admin_ids:
+        await update.message.reply_text("❌ You don't have permission to use this command.")
+        return
+
+    seconds = DEFAULT_PROFILE_SECONDS
+    if context.args:
+        try:
+            seconds = max(1, min(int(context.args[0]), MAX_PROFILE_SECONDS))
+        except ValueError:
+            await update.message.reply_text(f"Usage: /profile [seconds] (1-{MAX_PROFILE_SECONDS})")
+            return
+
+    if profiling.is_profile_running():
+        await update.message.reply_text("⏳ A profile is already running. Please wait for it to finish.")
+        return
+
+    logger.info(f"Profiling event loop for {seconds}s, requested by {user.first_name} (ID: {user.id})")
+    await update.message.reply_text(f"🔬 Profiling the bot for {seconds}s...")
+    report, raw_stats = await profiling.run_profile(seconds)
+
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    await update.message.reply_document(
+        document=io.BytesIO(report.encode('utf-8')),
+        filename=f"profile_{timestamp}.txt",
+        caption=f"cProfile report ({seconds}s, sorted by cumulative time)",
+    )
+    await update.message.reply_document(
+        document=io.BytesIO(raw_stats),
+        filename=f"profile_{timestamp}.prof",
+        caption="Raw pstats data (open with snakeviz or python -m pstats)",
+    )
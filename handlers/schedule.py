@@ -0,0 +1,121 @@
+# handlers/schedule.py
+import html
+import logging
+from datetime import datetime, timezone
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import database
+import scheduler
+
+logger = logging.getLogger(__name__)
+
+USAGE = (
+    "<b>Scheduled builds</b>\n"
+    "/schedule - List this group's schedules\n"
+    "/schedule add &lt;cron&gt; &lt;branch&gt; &lt;target&gt; [job] - Add a recurring build\n"
+    "/schedule remove &lt;id&gt; - Remove a schedule\n\n"
+    "&lt;cron&gt; is 5 fields (minute hour day month weekday) or an alias such as @daily, "
+    f"evaluated in {html.escape(str(scheduler.SCHEDULE_TIMEZONE))}.\n"
+    "Example: <code>/schedule add 0 2 * * mon-fri develop Android</code>"
+)
+
+def _split_cron(args: list) -> tuple:
+    """Tách tham số '/schedule add' thành (biểu thức cron, phần còn lại)."""
+    if args and args[0].startswith('@'):
+        return args[0], args[1:]
+    return " ".join(args[:5]), args[5:]
+
+def _format_next_run(schedule_id: int) -> str:
+    build_scheduler = scheduler.get_scheduler()
+    next_run = build_scheduler.next_run(schedule_id) if build_scheduler else None
+    if next_run is None:
+        return "n/a"
+    return next_run.astimezone(scheduler.SCHEDULE_TIMEZONE).strftime("%Y-%m-%d %H:%M %Z")
+
+async def _list_schedules(update: Update) -> None:
+    schedules = database.get_schedules(update.message.chat.id)
+    if not schedules:
+        await update.message.reply_html(f"⏰ No scheduled builds in this group.\n\n{USAGE}")
+        return
+    lines = ["⏰ <b>Scheduled builds</b>\n"]
+    for schedule in schedules:
+        lines.append(
+            f"#{schedule['id']} <code>{html.escape(schedule['cron'])}</code> - "
+            f"{html.escape(schedule['jenkins_job_path'])} / {html.escape(schedule['branch'])} / "
+            f"{html.escape(schedule['build_target'])}\n"
+            f"   Next run: {_format_next_run(schedule['id'])}"
+        )
+    await update.message.reply_html("\n".join(lines))
+
+async def _add_schedule(update: Update, args: list) -> None:
+    user = update.effective_user
+    chat_id = update.message.chat.id
+    if not database.is_user_logged_in(user.id):
+        await update.message.reply_text("You must /login in a private chat with me first. Scheduled builds run with your Jenkins account.")
+        return
+
+    cron, rest = _split_cron(args)
+    if len(rest) not in (2, 3):
+        await update.message.reply_html(USAGE)
+        return
+    try:
+        scheduler.CronExpression(cron).next_after(datetime.now(timezone.utc))
+    except ValueError as e:
+        await update.message.reply_html(f"❌ Invalid cron expression <code>{html.escape(cron)}</code>: {html.escape(str(e))}")
+        return
+
+    group_jobs = [job_path for job_path, _ in database.get_group_jobs(chat_id)]
+    branch, target = rest[0], rest[1]
+    job_path = rest[2].strip('/') if len(rest) == 3 else (group_jobs[0] if group_jobs else None)
+    if job_path not in group_jobs:
+        await update.message.reply_text("This job is not linked to this group. Please use /setup or /jobs first.")
+        return
+
+    schedule = database.add_schedule(chat_id, job_path, branch, target, cron, user.id)
+    build_scheduler = scheduler.get_scheduler()
+    if not schedule or not build_scheduler:
+        await update.message.reply_text("❌ Could not save the schedule. Please try again later.")
+        return
+    build_scheduler.add(schedule)
+    logger.info(f"User {user.id} added schedule {schedule['id']} ({cron}) for {job_path} in chat {chat_id}")
+    await update.message.reply_html(
+        f"✅ Schedule #{schedule['id']} added: {html.escape(job_path)} / {html.escape(branch)} / {html.escape(target)}\n"
+        f"Next run: {_format_next_run(schedule['id'])}"
+    )
+
+async def _remove_schedule(update: Update, args: list) -> None:
+    if len(args) != 1 or not args[0].lstrip('#').isdigit():
+        await update.message.reply_html(USAGE)
+        return
+    schedule_id = int(args[0].lstrip('#'))
+    if not database.delete_schedule(schedule_id, update.message.chat.id):
+        await update.message.reply_text(f"Schedule #{schedule_id} was not found in this group.")
+        return
+    build_scheduler = scheduler.get_scheduler()
+    if build_scheduler:
+        build_scheduler.remove(schedule_id)
+    logger.info(f"User {update.effective_user.id} removed schedule {schedule_id} in chat {update.message.chat.id}")
+    await update.message.reply_text(f"🗑️ Schedule #{schedule_id} removed.")
+
+async def schedule_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Quản lý lịch build định kỳ của nhóm: /schedule [add ... | remove <id>]."""
+    user = update.effective_user
+    if not update.message or not user:
+        return
+
+    logger.info(f"Received /schedule command from {user.first_name} (ID: {user.id}) in chat {update.message.chat.id}")
+
+    if update.message.chat.type == "private":
+        await update.message.reply_text("This command only works in a group chat.")
+        return
+
+    args = context.args or []
+    if not args:
+        await _list_schedules(update)
+    elif args[0].lower() == 'add':
+        await _add_schedule(update, args[1:])
+    elif args[0].lower() in ('remove', 'delete', 'rm'):
+        await _remove_schedule(update, args[1:])
+    else:
+        await update.message.reply_html(USAGE)
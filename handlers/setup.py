@@ -1,21 +1,22 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-import jenkins
 
 import database
 import security
+import rendering
 from timeout_handler import TimeoutConversationHandler
+from lazy_imports import lazy_import
+import folder_index
+from handlers import keyboards
 
-logger = logging.getLogger(__name__)
+# python-jenkins chỉ được nạp khi có lệnh gọi Jenkins API đầu tiên
+jenkins = lazy_import('jenkins')
 
-def escape_markdown_v2(text: str) -> str:
-    """Escapes special characters for Telegram's MarkdownV2 parse mode."""
-    escape_chars = r'_*[]()~`>#+-=|{}.!'
-    return "".join(f"\\{char}" if char in escape_chars else char for char in text)
+logger = logging.getLogger(__name__)
 
 # Định nghĩa các trạng thái
-SELECT_FOLDER, SELECT_JOB_IN_FOLDER = range(2)
+SELECT_FOLDER = 0
 
 async def setup_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gửi tin nhắn với nút bấm để bắt đầu cuộc hội thoại setup."""
@@ -47,17 +48,50 @@ async def setup_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context, message.chat_id, message.message_id, "setup"
     )
 
-def build_keyboard(items: list[str], callback_prefix: str, item_type: str) -> InlineKeyboardMarkup:
-    """Tạo bàn phím inline với icon và callback data có prefix."""
-    icons = {"folder": "🗂️", "job": "🔨"}
-    prefix_icon = icons.get(item_type, "")
-    
-    keyboard = [
-        [InlineKeyboardButton(f"{prefix_icon} {item}", callback_data=f"{callback_prefix}:{item}")]
-        for item in items
-    ]
-    keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data=f"{callback_prefix}:cancel")])
-    return InlineKeyboardMarkup(keyboard)
+# Callback của nút "lên thư mục cha" trong trình duyệt thư mục
+UP_CALLBACK = 'setup_folder:up'
+
+def build_keyboard(message, owner_id: int, path: str, entries: list[dict]) -> InlineKeyboardMarkup:
+    """Tạo bàn phím phân trang cho một cấp thư mục (thư mục con và job) và gắn vào tin nhắn."""
+    keyboard = keyboards.PaginatedKeyboard(
+        'setup_folder', [entry['name'] for entry in entries], "folder", owner_id,
+        recent=keyboards.recent_items(message.chat_id, f"tree:{path}"),
+        back_callback=UP_CALLBACK if path else None,
+        item_types={entry['name']: entry['kind'] for entry in entries},
+    )
+    return keyboards.attach(keyboard)
+
+def _browse_text(path: str, is_empty: bool) -> str:
+    location = f"🗂️ /{path}" if path else "🗂️ Jenkins"
+    if is_empty:
+        return f"{location}\n\nThis folder is empty."
+    return f"{location}\n\nSelect a folder to open, or a 🔨 job to link to this group:"
+
+async def _show_folder(query, context: ContextTypes.DEFAULT_TYPE, index: folder_index.FolderIndex, path: str) -> int:
+    """Hiển thị nội dung một thư mục và prefetch cấp tiếp theo ở nền."""
+    entries = await index.children(path)
+    context.user_data['setup_path'] = path
+    keyboard = build_keyboard(query.message, query.from_user.id, path, entries)
+    await query.edit_message_text(_browse_text(path, not entries), reply_markup=keyboard)
+    # Trong lúc người dùng đọc cấp hiện tại, tải trước các thư mục con
+    index.prefetch_subfolders(path)
+    return SELECT_FOLDER
+
+async def _report_jenkins_error(query, e: Exception, path: str) -> int:
+    logger.error(f"Jenkins API error while browsing '{path or '/'}': {e}")
+    error_message = str(e).lower()
+    if "401" in error_message or "unauthorized" in error_message:
+        await query.edit_message_text("❌ Authentication failed. Your Jenkins credentials may have expired. Please /logout and /login again.")
+    elif "404" in error_message or "not found" in error_message:
+        if path:
+            await query.edit_message_text(f"❌ Folder '{path}' not found or you don't have permission to access it.")
+        else:
+            await query.edit_message_text("❌ Jenkins server or API endpoint not found. Please check your Jenkins URL.")
+    elif "timeout" in error_message:
+        await query.edit_message_text("❌ Connection to Jenkins timed out. Please check if the server is accessible.")
+    else:
+        await query.edit_message_text("❌ An error occurred while connecting to Jenkins. Please try again later.")
+    return ConversationHandler.END
 
 async def setup_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Bắt đầu cuộc hội thoại setup sau khi nhấn nút."""
@@ -90,43 +124,28 @@ async def setup_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         return ConversationHandler.END
 
     try:
-        # Sửa lỗi: Sử dụng key 'jenkins_userid' đã được chuẩn hóa
-        server = jenkins.Jenkins(creds['jenkins_url'], username=creds['jenkins_userid'], password=creds['jenkins_token'])
-        jobs = server.get_jobs(folder_depth=0)
-        folders = [job['name'] for job in jobs if 'folder' in job.get('_class', '').lower()]
-        
-        if not folders:
-            await query.edit_message_text("❌ No project folders found.")
+        index = folder_index.get_folder_index(user_id, creds)
+        if not await index.children(''):
+            await query.edit_message_text("❌ No projects found.")
             return ConversationHandler.END
-            
-        keyboard = build_keyboard(folders, 'setup_folder', "folder")
-        await query.edit_message_text("🗂️ Please select your project folder:", reply_markup=keyboard)
+
+        state = await _show_folder(query, context, index, '')
         
         # Lưu metadata cho timeout handler
         TimeoutConversationHandler.set_timeout_metadata(
             context, chat.id, query.message.message_id, "setup"
         )
         
-        return SELECT_FOLDER
+        return state
     except jenkins.JenkinsException as e:
-        logger.error(f"Jenkins API error in setup_start: {e}")
-        error_message = str(e).lower()
-        if "401" in error_message or "unauthorized" in error_message:
-            await query.edit_message_text("❌ Authentication failed. Your Jenkins credentials may have expired. Please /logout and /login again.")
-        elif "404" in error_message or "not found" in error_message:
-            await query.edit_message_text("❌ Jenkins server or API endpoint not found. Please check your Jenkins URL.")
-        elif "timeout" in error_message:
-            await query.edit_message_text("❌ Connection to Jenkins timed out. Please check if the server is accessible.")
-        else:
-            await query.edit_message_text("❌ An error occurred while connecting to Jenkins. Please try again later.")
-        return ConversationHandler.END
+        return await _report_jenkins_error(query, e, '')
     except Exception as e:
         logger.error(f"Error getting folders: {e}")
         await query.edit_message_text("❌ An error occurred while fetching projects. Please try again later.")
         return ConversationHandler.END
 
 async def select_folder_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Xử lý lựa chọn thư mục."""
+    """Xử lý thao tác trong trình duyệt thư mục: mở thư mục, lên thư mục cha, hoặc chọn job."""
     query = update.callback_query
     if not query or not query.message or not context.user_data:
         return SELECT_FOLDER
@@ -137,93 +156,55 @@ async def select_folder_callback(update: Update, context: ContextTypes.DEFAULT_T
         await query.answer("You are not the one who initiated this command.", show_alert=True)
         return SELECT_FOLDER
 
-    folder_name_data = query.data
-    if not folder_name_data:
+    if not query.data:
         return SELECT_FOLDER
         
     # Kiểm tra nếu là nút Cancel
-    if folder_name_data == 'setup_folder:cancel':
+    if query.data == 'setup_folder:cancel':
         return await cancel_setup(update, context)
-        
-    folder_name = folder_name_data.split(':')[1]
-    context.user_data['selected_folder'] = folder_name
 
     creds = database.get_user_credentials(user_id)
+    if not creds:
+        await query.edit_message_text("Could not find your credentials. Please /login again.")
+        return ConversationHandler.END
+    index = folder_index.get_folder_index(user_id, creds)
+    path = context.user_data.get('setup_path', '')
+
     try:
-        # Sửa lỗi: Sử dụng key 'jenkins_userid' đã được chuẩn hóa
-        server = jenkins.Jenkins(creds['jenkins_url'], username=creds['jenkins_userid'], password=creds['jenkins_token'])
-        folder_info = server.get_job_info(folder_name)
-        jobs = [job['name'] for job in folder_info.get('jobs', [])]
+        if query.data == UP_CALLBACK:
+            return await _show_folder(query, context, index, folder_index.parent_path(path))
 
-        if not jobs:
-            await query.edit_message_text(f"❌ No jobs found in folder '{folder_name}'.")
-            return ConversationHandler.END
+        name = await keyboards.handle_callback(query)
+        if name is None:
+            # Chuyển trang / tìm kiếm: vẫn ở cấp thư mục hiện tại
+            return SELECT_FOLDER
+
+        entries = await index.children(path)
+        entry = next((entry for entry in entries if entry['name'] == name), None)
+        if entry is None:
+            # Danh sách trong cache đã cũ: tải lại cấp hiện tại
+            index.invalidate(path)
+            return await _show_folder(query, context, index, path)
 
-        keyboard = build_keyboard(jobs, 'setup_job', "job")
-        await query.edit_message_text(f"🗂️ Folder '{folder_name}' selected.\n🔨 Please select a build job:", reply_markup=keyboard)
-        return SELECT_JOB_IN_FOLDER
+        keyboards.remember(query.message.chat.id, f"tree:{path}", name)
+        if entry['kind'] == 'folder':
+            return await _show_folder(query, context, index, folder_index.join_path(path, name))
+        return await _complete_setup(query, context, path, name)
     except jenkins.JenkinsException as e:
-        logger.error(f"Jenkins API error in select_folder_callback: {e}")
-        error_message = str(e).lower()
-        if "401" in error_message or "unauthorized" in error_message:
-            await query.edit_message_text("❌ Authentication failed. Your Jenkins credentials may have expired. Please /logout and /login again.")
-        elif "404" in error_message or "not found" in error_message:
-            await query.edit_message_text(f"❌ Folder '{folder_name}' not found or you don't have permission to access it.")
-        elif "timeout" in error_message:
-            await query.edit_message_text("❌ Connection to Jenkins timed out. Please try again later.")
-        else:
-            await query.edit_message_text("❌ An error occurred while accessing the folder. Please try again later.")
-        return ConversationHandler.END
+        return await _report_jenkins_error(query, e, path)
     except Exception as e:
-        logger.error(f"Error getting jobs in folder '{folder_name}': {e}")
+        logger.error(f"Error browsing folder '{path}': {e}")
         await query.edit_message_text("❌ An error occurred while accessing the folder. Please try again later.")
         return ConversationHandler.END
 
-async def select_job_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Xử lý lựa chọn job và hoàn tất setup."""
-    query = update.callback_query
-    if not query or not query.message or not context.user_data:
-        return SELECT_JOB_IN_FOLDER
-    await query.answer()
-    
-    user_id = query.from_user.id
-    if user_id != context.user_data.get('setup_user_id'):
-        await query.answer("You are not the one who initiated this command.", show_alert=True)
-        return SELECT_JOB_IN_FOLDER
-
-    selected_job_data = query.data
-    if not selected_job_data:
-        return SELECT_JOB_IN_FOLDER
-        
-    # Kiểm tra nếu là nút Cancel
-    if selected_job_data == 'setup_job:cancel':
-        return await cancel_setup(update, context)
-        
-    selected_job = selected_job_data.split(':')[1]
-    selected_folder = context.user_data.get('selected_folder')
-    if not selected_folder:
-        # Xử lý trường hợp không tìm thấy folder
-        await query.edit_message_text("Error: Project folder not found in session. Please start over.")
-        context.user_data.clear()
-        return ConversationHandler.END
-
-    job_path = f"{selected_folder}/{selected_job}"
+async def _complete_setup(query, context: ContextTypes.DEFAULT_TYPE, folder: str, job: str) -> int:
+    """Liên kết nhóm với job đã chọn và kết thúc cuộc hội thoại."""
+    keyboards.discard(query.message)
+    job_path = folder_index.join_path(folder, job)
 
     try:
-        database.save_group_config(query.message.chat.id, job_path, user_id)
-        # Sử dụng hàm escape mới
-        folder_md = escape_markdown_v2(selected_folder)
-        job_md = escape_markdown_v2(selected_job)
-        job_path_md = escape_markdown_v2(job_path)
-        
-        message = (
-            f"✅ *Setup Complete\!*\n\n"
-            f"🗂️ *Project:* `{folder_md}`\n"
-            f"🔨 *Job:* `{job_md}`\n\n"
-            f"──────────────\n"
-            f"🔗 Group linked to `{job_path_md}`\n"
-            f"🚀 Ready to use /build command\!"
-        )
+        database.save_group_config(query.message.chat.id, job_path, query.from_user.id)
+        message = rendering.render_setup_complete(folder or '/', job, job_path)
         await query.edit_message_text(message, parse_mode='MarkdownV2')
     except Exception as e:
         logger.error(f"Error saving group config: {e}")
@@ -254,9 +235,73 @@ async def cancel_setup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     await query.answer()
     # Thêm kiểm tra cho context.user_data
     if context.user_data and query.from_user.id == context.user_data.get('setup_user_id'):
+        keyboards.discard(query.message)
         await query.edit_message_text("Setup process canceled.")
         TimeoutConversationHandler.clear_timeout_metadata(context)
         context.user_data.clear()
     else:
         await query.answer("You are not the one who initiated this command.", show_alert=True)
     return ConversationHandler.END
+
+def _jobs_text(jobs: list) -> str:
+    if not jobs:
+        return "This group is not linked to any Jenkins job. Use /setup to link one."
+    lines = ["🔗 Jenkins jobs linked to this group:\n"]
+    for index, job_path in enumerate(jobs):
+        lines.append(f"• {job_path}" + (" (default)" if index == 0 else ""))
+    lines.append("\nBuild results of every linked job are posted here. Tap a job to unlink it, or use /setup to link another.")
+    return "\n".join(lines)
+
+async def jobs_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Liệt kê các job được liên kết với nhóm, kèm bàn phím để hủy liên kết."""
+    user = update.effective_user
+    if not update.message or not user:
+        return
+
+    logger.info(f"Received /jobs command from {user.first_name} (ID: {user.id}) in chat {update.message.chat.id}")
+
+    if update.message.chat.type == "private":
+        await update.message.reply_text("This command only works in a group chat.")
+        return
+
+    jobs = [job_path for job_path, _ in database.get_group_jobs(update.message.chat.id)]
+    if not jobs:
+        await update.message.reply_text(_jobs_text(jobs))
+        return
+    keyboard = keyboards.attach(keyboards.PaginatedKeyboard('jobs_unlink', jobs, "job", user.id))
+    await update.message.reply_text(_jobs_text(jobs), reply_markup=keyboard)
+
+async def unlink_job_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Hủy liên kết job được chọn trên bàn phím của /jobs."""
+    query = update.callback_query
+    if not query or not query.message or not query.from_user:
+        return
+
+    keyboard = keyboards.get_keyboard_for_message(query.message)
+    if keyboard is not None and query.from_user.id != keyboard.owner_id:
+        await query.answer("You are not the one who initiated this command.", show_alert=True)
+        return
+    await query.answer()
+
+    chat_id = query.message.chat.id
+    if query.data == 'jobs_unlink:cancel':
+        keyboards.discard(query.message)
+        await query.edit_message_text(_jobs_text([job_path for job_path, _ in database.get_group_jobs(chat_id)]))
+        return
+
+    job_path = await keyboards.handle_callback(query)
+    if job_path is None:
+        return
+
+    keyboards.discard(query.message)
+    if database.unlink_group_job(chat_id, job_path):
+        logger.info(f"User {query.from_user.id} unlinked job {job_path} from chat {chat_id}")
+        status = f"🗑️ Unlinked {job_path}.\n\n"
+    else:
+        status = f"❌ Could not unlink {job_path}.\n\n"
+
+    jobs = [job for job, _ in database.get_group_jobs(chat_id)]
+    reply_markup = None
+    if jobs:
+        reply_markup = keyboards.attach(keyboards.PaginatedKeyboard('jobs_unlink', jobs, "job", query.from_user.id))
+    await query.edit_message_text(status + _jobs_text(jobs), reply_markup=reply_markup)
@@ -0,0 +1,105 @@
+# handlers/stats.py
+import html
+import logging
+from typing import Optional
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import database
+from rendering import format_duration
+
+logger = logging.getLogger(__name__)
+
+# Số build hiển thị trong /history
+HISTORY_LIMIT = 10
+
+STATUS_ICONS = {"SUCCESS": "✅", "FAILURE": "❌", "ABORTED": "⛔", "UNSTABLE": "⚠️"}
+
+async def _get_group_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+    """
+    Kiểm tra chat là nhóm đã setup và trả về job path, hoặc gửi thông báo lỗi.
+
+    Nhóm liên kết nhiều job có thể chọn job qua tham số lệnh (ví dụ /stats Folder/Job);
+    mặc định là job setup gần nhất.
+    """
+    if update.message.chat.type == "private":
+        await update.message.reply_text("This command only works in a group chat.")
+        return None
+
+    group_jobs = [job_path for job_path, _ in database.get_group_jobs(update.message.chat.id)]
+    if not group_jobs:
+        await update.message.reply_text("This group is not set up. Please use /setup first.")
+        return None
+    if not context.args:
+        return group_jobs[0]
+
+    requested = " ".join(context.args).strip('/')
+    if requested in group_jobs:
+        return requested
+    linked = "\n".join(f"• <code>{html.escape(job_path)}</code>" for job_path in group_jobs)
+    await update.message.reply_html(f"Job <code>{html.escape(requested)}</code> is not linked to this group. Linked jobs:\n{linked}")
+    return None
+
+async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Hiển thị thống kê build (tỉ lệ thành công, p50/p95 thời gian) theo từng target."""
+    user = update.effective_user
+    if not update.message or not user:
+        return
+
+    logger.info(f"Received /stats command from {user.first_name} (ID: {user.id}) in chat {update.message.chat.id}")
+
+    job_path = await _get_group_job(update, context)
+    if not job_path:
+        return
+
+    stats = database.get_build_stats(job_path)
+    if not stats:
+        await update.message.reply_html(f"📊 No builds recorded yet for <code>{html.escape(job_path)}</code>.")
+        return
+
+    lines = [f"📊 <b>Build statistics</b> for <code>{html.escape(job_path)}</code>\n"]
+    for target_stats in stats:
+        target = target_stats['build_target'] or 'Unknown'
+        status_counts = ", ".join(
+            f"{STATUS_ICONS.get(status, '•')} {count}"
+            for status, count in sorted(target_stats['status_counts'].items())
+        )
+        lines.append(
+            f"🎯 <b>{html.escape(target)}</b>\n"
+            f"   Builds: {target_stats['total_count']} ({status_counts})\n"
+            f"   Success rate: {target_stats['success_rate']:.0%}\n"
+            f"   Duration p50: {format_duration(target_stats['p50_duration'])}, "
+            f"p95: {format_duration(target_stats['p95_duration'])}\n"
+            f"   Last: #{target_stats['last_build_number']} {STATUS_ICONS.get(target_stats['last_status'], '')} "
+            f"{html.escape(target_stats['last_status'] or '')}"
+        )
+
+    await update.message.reply_html("\n".join(lines))
+
+async def history_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Hiển thị danh sách các build gần nhất của job được liên kết với nhóm."""
+    user = update.effective_user
+    if not update.message or not user:
+        return
+
+    logger.info(f"Received /history command from {user.first_name} (ID: {user.id}) in chat {update.message.chat.id}")
+
+    job_path = await _get_group_job(update, context)
+    if not job_path:
+        return
+
+    history = database.get_build_history(job_path, HISTORY_LIMIT)
+    if not history:
+        await update.message.reply_html(f"🕘 No builds recorded yet for <code>{html.escape(job_path)}</code>.")
+        return
+
+    lines = [f"🕘 <b>Last {len(history)} builds</b> for <code>{html.escape(job_path)}</code>\n"]
+    for build in history:
+        icon = STATUS_ICONS.get(build['status'], '•')
+        target = html.escape(build['build_target'] or 'Unknown')
+        lines.append(
+            f"{icon} #{build['build_number']} <b>{target}</b> - {html.escape(build['status'])}, "
+            f"{format_duration(build['duration'])} ({build['finished_at']} UTC)"
+        )
+
+    await update.message.reply_html("\n".join(lines))
@@ -0,0 +1,137 @@
+# health.py
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from log_filters import add_html_filter_to_logger
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Đo độ trễ của event loop: một task ngủ `interval` giây và ghi lại phần thời gian
+    thức dậy muộn hơn dự kiến. Độ trễ lớn nghĩa là có code đang chặn loop.
+    """
+
+    def __init__(self, interval: float = 0.5, window: float = 60.0):
+        self.interval = interval
+        # Độ trễ lớn nhất được giữ trong `window` giây để probe thưa vẫn thấy các lần bị chặn ngắn
+        self.window = window
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._max_lag_at = 0.0
+        self.last_tick: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - expected)
+            self.last_tick = time.monotonic()
+            if self.lag >= self.max_lag or self.last_tick - self._max_lag_at > self.window:
+                self.max_lag = self.lag
+                self._max_lag_at = self.last_tick
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Trả về độ trễ hiện tại và lớn nhất trong cửa sổ theo dõi."""
+        # Nếu task không chạy được trong thời gian dài, độ trễ thực tế là khoảng thời gian đó
+        stalled_for = 0.0
+        if self.last_tick is not None:
+            stalled_for = max(0.0, time.monotonic() - self.last_tick - self.interval)
+        return {
+            'lag_seconds': round(max(self.lag, stalled_for), 4),
+            'max_lag_seconds': round(max(self.max_lag, stalled_for), 4),
+            'running': self._task is not None and not self._task.done(),
+        }
+
+
+class CachedCheck:
+    """
+    Một phép kiểm tra phụ thuộc (DB, Bot API) có cache kết quả trong `ttl` giây.
+
+    Nhiều probe đến cùng lúc chỉ chạy một lần kiểm tra: các probe sau chờ kết quả của
+    lần đang chạy thay vì gọi lại dịch vụ phía sau.
+    """
+
+    def __init__(self, name: str, check: Callable[[], Awaitable[None]], ttl: float = 10.0, timeout: float = 5.0):
+        self.name = name
+        self._check = check
+        self.ttl = ttl
+        self.timeout = timeout
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self._result is not None and time.monotonic() - self._checked_at < self.ttl
+
+    async def result(self) -> Dict[str, Any]:
+        if self._is_fresh():
+            return self._result
+        async with self._lock:
+            # Một probe khác có thể đã làm mới kết quả trong lúc chờ lock
+            if self._is_fresh():
+                return self._result
+            started_at = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._check(), timeout=self.timeout)
+                result = {'ok': True}
+            except asyncio.TimeoutError:
+                result = {'ok': False, 'error': f"timed out after {self.timeout}s"}
+            except Exception as e:
+                result = {'ok': False, 'error': str(e)[:200]}
+            result['latency_seconds'] = round(time.perf_counter() - started_at, 4)
+            if not result['ok']:
+                logger.warning(f"Health check '{self.name}' failed: {result['error']}")
+            self._result = result
+            self._checked_at = time.monotonic()
+            return result
+
+
+class HealthChecker:
+    """Tổng hợp trạng thái cho /healthz (tiến trình còn sống) và /readyz (sẵn sàng nhận việc)."""
+
+    def __init__(self, loop_monitor: LoopLagMonitor, max_loop_lag: float = 5.0,
+                 queue_depth: Optional[Callable[[], int]] = None):
+        self.loop_monitor = loop_monitor
+        self.max_loop_lag = max_loop_lag
+        self._queue_depth = queue_depth
+        self.checks: Dict[str, CachedCheck] = {}
+
+    def add_check(self, check: CachedCheck) -> None:
+        self.checks[check.name] = check
+
+    def liveness(self) -> Dict[str, Any]:
+        """Chỉ dùng số liệu có sẵn trong bộ nhớ, không gọi dịch vụ bên ngoài."""
+        loop = self.loop_monitor.snapshot()
+        ok = loop['running'] and loop['lag_seconds'] <= self.max_loop_lag
+        status = {'ok': ok, 'event_loop': loop}
+        if self._queue_depth is not None:
+            status['background_tasks'] = self._queue_depth()
+        return status
+
+    async def readiness(self) -> Dict[str, Any]:
+        status = self.liveness()
+        names = list(self.checks)
+        results = await asyncio.gather(*(self.checks[name].result() for name in names))
+        status['checks'] = dict(zip(names, results))
+        status['ok'] = status['ok'] and all(result['ok'] for result in results)
+        return status
@@ -0,0 +1,27 @@
+# lazy_imports.py
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Trả về module `name` nhưng chỉ thực thi code của nó ở lần truy cập thuộc tính đầu tiên.
+
+    Dùng cho các thư viện nặng chỉ cần khi có thao tác cụ thể (ví dụ `jenkins` khi gọi
+    Jenkins API, `cryptography` khi mã hóa token), để rút ngắn thời gian khởi động bot.
+    Nếu module đã được import trước đó thì trả về module đó.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -1,74 +1,105 @@
 import logging
 import re
 
+# Các mẫu được biên dịch một lần khi import module
+_HTML_INDICATOR_RE = re.compile(
+    r'<(?:/?html>|/?body>|head>|title>|!doctype|meta|tr>|td>|table>|h[1-3]>)', re.IGNORECASE
+)
+_TITLE_RE = re.compile(r'<title>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+_HEADING_RE = re.compile(r'<h[1-3][^>]*>(.*?)</h[1-3]>', re.IGNORECASE | re.DOTALL)
+_BODY_RE = re.compile(r'<body[^>]*>(.*?)</body>', re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r'<[^>]+>')
+_WHITESPACE_RE = re.compile(r'\s+')
+_HTTP_ERROR_RE = re.compile(r'HTTP ERROR (\d+)', re.IGNORECASE)
+
+MAX_MESSAGE_LENGTH = 200
+
+# Thuộc tính đánh dấu record đã được lọc, để mỗi record chỉ được xử lý một lần
+# dù bộ lọc được gắn vào cả logger lẫn handler
+_FILTERED_ATTR = '_html_filtered'
+
+
+def _summarize_html(message: str) -> str:
+    """Trích xuất thông tin hữu ích (title, heading, body) từ một trang lỗi HTML."""
+    # 1. Thử lấy tiêu đề
+    title_match = _TITLE_RE.search(message)
+    if title_match:
+        return f"HTML Error: {title_match.group(1).strip()}"
+
+    # 2. Thử lấy nội dung thẻ h1, h2, h3
+    h_match = _HEADING_RE.search(message)
+    if h_match:
+        return f"HTML Error: {h_match.group(1).strip()}"
+
+    # 3. Thử lấy thông báo lỗi từ thẻ body
+    body_match = _BODY_RE.search(message)
+    if body_match:
+        body_text = _TAG_RE.sub(' ', body_match.group(1))
+        body_text = _WHITESPACE_RE.sub(' ', body_text).strip()
+        if len(body_text) > 100:
+            body_text = body_text[:100] + "..."
+        return f"HTML Error: {body_text}"
+
+    # 4. Fallback: Hiển thị thông báo chung
+    return "HTML Error received (content hidden)"
+
+
 class HTMLErrorFilter(logging.Filter):
     """Bộ lọc để làm sạch các thông báo lỗi HTML trong log."""
-    
+
     def filter(self, record):
-        if hasattr(record, 'msg'):
-            # Kiểm tra nếu thông báo là chuỗi
-            if isinstance(record.msg, str):
-                # Kiểm tra các dấu hiệu của HTML
-                html_indicators = ["<html>", "</html>", "<body>", "</body>", "<head>", 
-                                  "<title>", "<!DOCTYPE", "<meta", "<tr>", "<td>", 
-                                  "<table>", "<h1>", "<h2>", "<h3>"]
-                
-                is_html = any(indicator.lower() in record.msg.lower() for indicator in html_indicators)
-                
-                if is_html:
-                    # Cố gắng trích xuất thông tin hữu ích từ HTML
-                    # 1. Thử lấy tiêu đề
-                    title_match = re.search(r'<title>(.*?)</title>', record.msg, re.IGNORECASE | re.DOTALL)
-                    if title_match:
-                        title = title_match.group(1).strip()
-                        record.msg = f"HTML Error: {title}"
-                    else:
-                        # 2. Thử lấy nội dung thẻ h1, h2, h3
-                        h_match = re.search(r'<h[1-3][^>]*>(.*?)</h[1-3]>', record.msg, re.IGNORECASE | re.DOTALL)
-                        if h_match:
-                            heading = h_match.group(1).strip()
-                            record.msg = f"HTML Error: {heading}"
-                        else:
-                            # 3. Thử lấy thông báo lỗi từ thẻ body
-                            body_match = re.search(r'<body[^>]*>(.*?)</body>', record.msg, re.IGNORECASE | re.DOTALL)
-                            if body_match:
-                                # Lấy text từ body và loại bỏ các thẻ HTML
-                                body_text = body_match.group(1)
-                                body_text = re.sub(r'<[^>]+>', ' ', body_text)
-                                body_text = re.sub(r'\s+', ' ', body_text).strip()
-                                if len(body_text) > 100:
-                                    body_text = body_text[:100] + "..."
-                                record.msg = f"HTML Error: {body_text}"
-                            else:
-                                # 4. Fallback: Hiển thị thông báo chung
-                                record.msg = "HTML Error received (content hidden)"
-                
-                # Kiểm tra các chuỗi lỗi HTTP phổ biến
-                http_error_match = re.search(r'HTTP ERROR (\d+)', record.msg, re.IGNORECASE)
-                if http_error_match:
-                    error_code = http_error_match.group(1)
-                    record.msg = f"HTTP Error {error_code} received"
-                
-                # Rút gọn thông báo lỗi quá dài
-                if len(record.msg) > 200:
-                    record.msg = record.msg[:200] + "... (truncated)"
-                    
-            # Nếu thông báo là exception
-            elif isinstance(record.msg, Exception):
-                # Chuyển đổi exception thành chuỗi và kiểm tra HTML
-                msg_str = str(record.msg)
-                if "<html>" in msg_str.lower() or "</html>" in msg_str.lower():
-                    record.msg = "HTML Error in exception (content hidden)"
-                elif len(msg_str) > 200:
-                    record.msg = f"{msg_str[:200]}... (truncated)"
-        
+        if getattr(record, _FILTERED_ATTR, False):
+            return True
+        setattr(record, _FILTERED_ATTR, True)
+
+        msg = record.msg
+        if isinstance(msg, str) and record.args:
+            # Ghép args trước khi kiểm tra/rút gọn: cắt template trước khi ghép có thể làm mất
+            # placeholder và khiến việc format sau đó lỗi (record bị mất)
+            try:
+                msg = record.getMessage()
+            except Exception:
+                # Để logging tự báo lỗi format như bình thường
+                return True
+            record.args = None
+
+        if isinstance(msg, str):
+            # Kiểm tra nhanh: không có '<' thì không thể là HTML
+            if '<' in msg and _HTML_INDICATOR_RE.search(msg):
+                msg = _summarize_html(msg)
+
+            # Kiểm tra các chuỗi lỗi HTTP phổ biến
+            http_error_match = _HTTP_ERROR_RE.search(msg)
+            if http_error_match:
+                msg = f"HTTP Error {http_error_match.group(1)} received"
+
+            # Rút gọn thông báo lỗi quá dài
+            if len(msg) > MAX_MESSAGE_LENGTH:
+                msg = msg[:MAX_MESSAGE_LENGTH] + "... (truncated)"
+            record.msg = msg
+
+        # Nếu thông báo là exception
+        elif isinstance(msg, Exception):
+            # Chuyển đổi exception thành chuỗi và kiểm tra HTML
+            msg_str = str(msg)
+            if '<' in msg_str and ("<html>" in msg_str.lower() or "</html>" in msg_str.lower()):
+                record.msg = "HTML Error in exception (content hidden)"
+            elif len(msg_str) > MAX_MESSAGE_LENGTH:
+                record.msg = f"{msg_str[:MAX_MESSAGE_LENGTH]}... (truncated)"
+
         return True
 
+# Instance dùng chung: gắn nhiều lần vẫn chỉ là một bộ lọc
+_html_filter = HTMLErrorFilter()
+
+def _has_html_filter(filterer: logging.Filterer) -> bool:
+    return any(isinstance(f, HTMLErrorFilter) for f in filterer.filters)
+
 # Hàm tiện ích để thêm bộ lọc vào logger
 def add_html_filter_to_logger(logger_name=None):
     """
     Thêm HTMLErrorFilter vào logger được chỉ định hoặc root logger.
-    
+
     Args:
         logger_name: Tên của logger cần thêm bộ lọc. Nếu None, sẽ thêm vào root logger.
     """
@@ -76,10 +107,22 @@ def add_html_filter_to_logger(logger_name=None):
         logger = logging.getLogger(logger_name)
     else:
         logger = logging.getLogger()
-    
+
     # Kiểm tra xem bộ lọc đã được thêm vào chưa
-    filter_exists = any(isinstance(f, HTMLErrorFilter) for f in logger.filters)
-    if not filter_exists:
-        logger.addFilter(HTMLErrorFilter())
-    
-    return logger 
\ No newline at end of file
+    if not _has_html_filter(logger):
+        logger.addFilter(_html_filter)
+
+    return logger
+
+def install_html_filter(handlers=None):
+    """
+    Gắn HTMLErrorFilter vào các handler (mặc định là handler của root logger).
+
+    Bộ lọc trên logger chỉ áp dụng cho record được ghi trực tiếp vào logger đó, còn bộ lọc
+    trên handler áp dụng cho mọi record đi qua handler, kể cả từ thư viện bên ngoài.
+    """
+    if handlers is None:
+        handlers = logging.getLogger().handlers
+    for handler in handlers:
+        if not _has_html_filter(handler):
+            handler.addFilter(_html_filter)
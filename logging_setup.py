@@ -0,0 +1,111 @@
+# logging_setup.py
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Optional
+
+from log_filters import install_html_filter
+
+DEFAULT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Các trường ngữ cảnh có thể truyền qua `extra=` khi ghi log, ví dụ:
+# logger.info("...", extra={'job': job_name, 'build': build_number, 'chat_id': group_id})
+CONTEXT_FIELDS = ('job', 'build', 'target', 'chat_id', 'user_id', 'build_request_id')
+
+# Listener hiện tại (chỉ cấu hình một lần cho mỗi tiến trình)
+_listener: Optional[logging.handlers.QueueListener] = None
+# Dùng để render traceback trước khi record đi vào queue
+_traceback_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """Định dạng mỗi record thành một dòng JSON, kèm các trường ngữ cảnh job/build/chat."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Traceback đã được render sẵn bởi ContextQueueHandler
+            payload['exc_info'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler giữ traceback tách riêng khỏi message.
+
+    QueueHandler.prepare mặc định ghép traceback vào msg và bỏ exc_info, nên JsonFormatter
+    phía listener không còn trường exc_info riêng. Ở đây traceback được render sẵn vào
+    exc_text (traceback object không cần đi qua queue), msg chỉ chứa message đã ghép args.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: int = logging.INFO, log_file: Optional[str] = None, json_format: bool = False,
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5) -> logging.handlers.QueueListener:
+    """
+    Cấu hình logging không chặn event loop.
+
+    Root logger chỉ có một QueueHandler: việc ghi ra stderr/file được thực hiện bởi
+    QueueListener trên một thread riêng.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if json_format else logging.Formatter(DEFAULT_FORMAT)
+    output_handlers = [logging.StreamHandler()]
+    if log_file:
+        output_handlers.append(
+            logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        )
+    for handler in output_handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ContextQueueHandler(log_queue)
+    # Lọc HTML trước khi record được đưa vào queue: lúc này message chưa được ghép với
+    # traceback nên phần rút gọn message không cắt mất traceback
+    install_html_filter([queue_handler])
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *output_handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Dừng listener và ghi hết các record còn trong queue."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -1,5 +1,6 @@
 import logging
 import asyncio
+import signal
 import time
 import re
 from aiohttp import web
@@ -10,25 +11,52 @@ from telegram.constants import ParseMode
 
 import config
 import database
-from webhook.server import webhook_handler
-from handlers import commands, setup, build
+import metrics
+from webhook.server import (
+    webhook_handler, metrics_handler, healthz_handler, readyz_handler, pending_notification_count,
+    start_draining, drain_notifications, replay_pending_notifications,
+)
+from webhook.listeners import CLIENT_MAX_SIZE, KEEPALIVE_TIMEOUT, get_listener_configs, create_sites, start_sites
+from health import LoopLagMonitor, CachedCheck, HealthChecker
+from handlers import commands, setup, build, stats, profile, keyboards, schedule
+import profiling
+import scheduler
+import queue_tracker
 from telegram.ext import CommandHandler, ConversationHandler, CallbackQueryHandler, MessageHandler, filters, JobQueue
 from timeout_handler import timeout_messages, register_timeout_job, remove_timeout_job
 from log_filters import add_html_filter_to_logger
+from logging_setup import setup_logging, stop_logging
 
-# Cấu hình logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+# Cấu hình logging qua QueueHandler/QueueListener để việc ghi log không chặn event loop.
+# Bộ lọc HTML được gắn vào QueueHandler nên áp dụng cho cả log của thư viện bên ngoài.
+setup_logging(
+    level=logging.getLevelName(getattr(config, 'LOG_LEVEL', 'INFO')),
+    log_file=getattr(config, 'LOG_FILE', None),
+    json_format=getattr(config, 'LOG_JSON', False),
+    max_bytes=getattr(config, 'LOG_MAX_BYTES', 10 * 1024 * 1024),
+    backup_count=getattr(config, 'LOG_BACKUP_COUNT', 5),
 )
-# Thêm bộ lọc HTML cho root logger
 add_html_filter_to_logger()
 # Đặt mức cảnh báo cho các thư viện bên ngoài
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger("JenkinsBot")
 
+# Thời gian tối đa (giây) chờ các thông báo/upload đang chạy khi tắt bot
+SHUTDOWN_GRACE_SECONDS = getattr(config, 'SHUTDOWN_GRACE_SECONDS', 60)
+
+def _install_signal_handlers(stop_event: asyncio.Event) -> None:
+    """SIGINT/SIGTERM chỉ đặt cờ dừng để main() tự tắt theo đúng thứ tự."""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows không hỗ trợ add_signal_handler: Ctrl+C vẫn dừng bot qua KeyboardInterrupt
+            pass
+
 async def main() -> None:
     """Hàm chính, khởi động bot, các handler, và web server."""
-    database.init_db()
+    startup_started_at = time.perf_counter()
 
     # Thêm JobQueue để hỗ trợ conversation_timeout
     job_queue = JobQueue()
@@ -85,6 +113,7 @@ async def main() -> None:
     
     # Đăng ký hàm check_timeouts với job_queue
     register_timeout_job(job_queue, check_timeouts)
+    metrics.TIMEOUT_QUEUE_SIZE.set_function(lambda: len(timeout_messages))
 
     # --- Đăng ký các handlers ---
 
@@ -93,6 +122,18 @@ async def main() -> None:
     application.add_handler(CommandHandler("help", commands.help_handler))
     application.add_handler(CommandHandler("logout", commands.logout_handler))
     application.add_handler(CommandHandler("document", commands.document_handler))
+    application.add_handler(CommandHandler("stats", stats.stats_handler))
+    application.add_handler(CommandHandler("history", stats.history_handler))
+    application.add_handler(CommandHandler("jobs", setup.jobs_handler))
+    application.add_handler(CommandHandler("schedule", schedule.schedule_handler))
+    application.add_handler(CommandHandler("rebuild", build.rebuild_handler))
+    application.add_handler(CallbackQueryHandler(setup.unlink_job_callback, pattern='^jobs_unlink:'))
+    application.add_handler(CallbackQueryHandler(build.abort_build_callback, pattern='^build_abort:'))
+    application.add_handler(CallbackQueryHandler(build.rebuild_callback, pattern='^build_rebuild:'))
+    if profiling.PROFILING_ENABLED:
+        # block=False: handler chờ trong suốt thời gian profile, các update khác vẫn phải được xử lý
+        # (và được đo) trong lúc đó
+        application.add_handler(CommandHandler("profile", profile.profile_handler, block=False))
     # Các lệnh prompt cho conversation
     application.add_handler(CommandHandler("setup", setup.setup_prompt))
     application.add_handler(CommandHandler("build", build.build_prompt))
@@ -130,11 +171,10 @@ async def main() -> None:
         states={
             # Sử dụng pattern đơn giản hơn để tránh lỗi
             setup.SELECT_FOLDER: [CallbackQueryHandler(setup.select_folder_callback, pattern='^setup_folder:.*')],
-            setup.SELECT_JOB_IN_FOLDER: [CallbackQueryHandler(setup.select_job_callback, pattern='^setup_job:.*')],
         },
         fallbacks=[
             CallbackQueryHandler(setup.cancel_setup_initial, pattern='^cancel_setup_initial$'),
-            CallbackQueryHandler(setup.cancel_setup, pattern='^setup_folder:cancel$|^setup_job:cancel$')
+            CallbackQueryHandler(setup.cancel_setup, pattern='^setup_folder:cancel$')
         ],
         conversation_timeout=300,
         per_message=True,
@@ -145,8 +185,11 @@ async def main() -> None:
     build_conv_handler = ConversationHandler(
         entry_points=[CallbackQueryHandler(build.build_start, pattern='^start_build$')],
         states={
+            build.SELECT_JOB: [
+                CallbackQueryHandler(build.select_job, pattern='^build_select_job:.*')
+            ],
             build.SELECT_BRANCH: [
-                CallbackQueryHandler(build.select_branch, pattern='^build_select_branch:.*')
+                CallbackQueryHandler(build.select_branch, pattern='^build_select_branch:.*|^build_back_to_job$')
             ],
             build.SELECT_TARGET: [
                 CallbackQueryHandler(build.select_target, pattern='^build_select_target:.*|^build_back_to_branch$')
@@ -154,58 +197,112 @@ async def main() -> None:
         },
         fallbacks=[
             CallbackQueryHandler(build.cancel_build_initial, pattern='^cancel_build_initial$'),
-            CallbackQueryHandler(build.cancel_build, pattern='^build_cancel$|^build_select_branch:cancel$|^build_select_target:cancel$')
+            CallbackQueryHandler(build.cancel_build, pattern='^build_cancel$|^build_select_job:cancel$|^build_select_branch:cancel$|^build_select_target:cancel$')
         ],
         conversation_timeout=300,
         per_message=True,
     )
     application.add_handler(build_conv_handler)
 
+    # Lọc bàn phím phân trang khi người dùng reply tin nhắn chứa bàn phím bằng từ khóa tìm kiếm
+    application.add_handler(MessageHandler(
+        filters.TEXT & filters.REPLY & ~filters.COMMAND & filters.ChatType.GROUPS, keyboards.search_reply_handler
+    ))
+
     # Handler cho các lệnh không xác định - thêm cuối cùng để chỉ xử lý khi không có handler nào khác phù hợp
     application.add_handler(MessageHandler(filters.COMMAND, commands.unknown_command_handler))
     
     # Handler cho các tin nhắn thông thường (không phải lệnh) - chỉ áp dụng cho chat riêng tư
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, commands.text_message_handler))
 
+    # Đo thời gian từng handler (chỉ khi bật PROFILING_ENABLED)
+    if profiling.PROFILING_ENABLED:
+        profiling.instrument_application(application)
+
     # Cấu hình Web Server cho webhook
-    webhook_app = web.Application()
+    webhook_app = web.Application(client_max_size=CLIENT_MAX_SIZE)
     # Tạo một dict chứa các instance cần thiết để handler có thể truy cập
     webhook_app['bot_instance'] = {
         'app': application
     }
-    webhook_app.add_routes([web.get('/webhook', webhook_handler)])
+
+    # --- Health check cho load balancer / orchestrator ---
+    loop_monitor = LoopLagMonitor()
+    health_checker = HealthChecker(
+        loop_monitor,
+        max_loop_lag=getattr(config, 'HEALTH_MAX_LOOP_LAG', 5.0),
+        queue_depth=pending_notification_count,
+    )
+    health_ttl = getattr(config, 'HEALTH_CHECK_TTL', 10.0)
+    health_checker.add_check(CachedCheck('database', lambda: asyncio.to_thread(database.ping), ttl=health_ttl))
+    health_checker.add_check(CachedCheck('bot_api', application.bot.get_me, ttl=health_ttl))
+    webhook_app['health'] = health_checker
+    metrics.EVENT_LOOP_LAG.set_function(lambda: loop_monitor.lag)
+    metrics.BACKGROUND_TASKS.set_function(pending_notification_count)
+
+    webhook_app.add_routes([
+        web.get('/webhook', webhook_handler),
+        web.get('/metrics', metrics_handler),
+        web.get('/healthz', healthz_handler),
+        web.get('/readyz', readyz_handler),
+    ])
     
-    runner = web.AppRunner(webhook_app)
+    runner = web.AppRunner(webhook_app, keepalive_timeout=KEEPALIVE_TIMEOUT)
+    # Kiểm tra cấu hình listener trước khi kết nối Telegram để lỗi cấu hình được báo sớm
+    listeners = get_listener_configs()
     
+    # Khởi tạo song song: database (trong thread), kết nối Bot API (initialize() gọi getMe
+    # một lần và lưu lại thông tin bot) và web server
+    await asyncio.gather(
+        asyncio.to_thread(database.init_db),
+        application.initialize(),
+        runner.setup(),
+    )
+
     # --- Chạy đồng thời Bot Polling và Web Server ---
+    # application đã được initialize() ở trên; `async with` đảm bảo shutdown() khi thoát
     async with application:
-        await application.initialize()
         await application.start()
-        # Bắt đầu lắng nghe tin nhắn từ Telegram
-        if application.updater:
-            await application.updater.start_polling()
+        loop_monitor.start()
+        if profiling.PROFILING_ENABLED:
+            profiling.start(loop_monitor)
 
-        # Khởi động web server
-        await runner.setup()
-        site = web.TCPSite(runner, 'localhost', 8088)
-        await site.start()
+        # Bắt đầu lắng nghe tin nhắn từ Telegram và mở các listener webhook cùng lúc
+        startup_tasks = [start_sites(create_sites(runner, listeners))]
+        if application.updater:
+            startup_tasks.append(application.updater.start_polling())
+        await asyncio.gather(*startup_tasks)
 
         # --- Log thông tin khởi động ---
-        bot_info = await application.bot.get_me()
-        if bot_info:
-            logger.info(f"👤 Connected as: {bot_info.first_name} (@{bot_info.username}) (ID: {bot_info.id})")
-        logger.info("🚀 Bot is running...")
-        logger.info(f"👂 Webhook is listening on http://localhost:8088/webhook")
+        bot = application.bot
+        logger.info(f"👤 Connected as: {bot.first_name} (@{bot.username}) (ID: {bot.id})")
+        logger.info(f"🚀 Bot is running... (started in {time.perf_counter() - startup_started_at:.2f}s)")
+        logger.info("📈 Metrics on /metrics, health checks on /healthz and /readyz")
+
+        # Xử lý lại các thông báo chưa xong từ lần tắt trước
+        replay_pending_notifications(application)
+        # Theo dõi hàng đợi Jenkins của các build vừa trigger (tạo trước scheduler vì lịch bị lỡ chạy ngay)
+        queue_tracker.init_tracker(application)
+        # Nạp các lịch build định kỳ (JobQueue đã chạy sau application.start())
+        scheduler.init_scheduler(application)
         
-        # Giữ cho tiến trình chính sống
-        while True:
-            await asyncio.sleep(3600)
+        # Giữ cho tiến trình chính sống cho đến khi nhận SIGINT/SIGTERM
+        stop_event = asyncio.Event()
+        _install_signal_handlers(stop_event)
+        await stop_event.wait()
+
+        # 1. Ngừng nhận webhook mới, 2. chờ các thông báo/upload đang chạy (có thời hạn),
+        # 3. lưu lại phần chưa xong, 4. dừng polling, application và web server
+        logger.info("Shutdown requested, draining in-flight build notifications...")
+        start_draining()
+        await drain_notifications(SHUTDOWN_GRACE_SECONDS)
 
-        # Đoạn code dưới đây sẽ được chạy khi bot tắt (ví dụ: nhấn Ctrl+C)
         logger.info("Stopping bot and webhook server...")
         if application.updater:
             await application.updater.stop()
         await application.stop()
+        profiling.stop()
+        await loop_monitor.stop()
         await runner.cleanup()
         logger.info("Cleanup complete.")
 
@@ -213,4 +310,6 @@ if __name__ == "__main__":
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
-        logger.info("Bot stopped.") 
\ No newline at end of file
+        logger.info("Bot stopped.")
+    finally:
+        stop_logging()
@@ -0,0 +1,237 @@
+# metrics.py
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Bucket mặc định (giây) cho các histogram thời gian
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence, extra: str = '') -> str:
+    parts = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    """Lớp cơ sở cho các metric có nhãn (labels), hiển thị theo định dạng text của Prometheus."""
+
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+        self._functions: Dict[Tuple, Callable[[], float]] = {}
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_function(self, function: Callable[[], float], **labels) -> None:
+        """Lấy giá trị từ một hàm tại thời điểm xuất metric (ví dụ kích thước queue)."""
+        self._functions[self._key(labels)] = function
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, function in self._functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [số lượng theo bucket (không cộng dồn), tổng, số lần quan sát]
+        self._observations: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._observations.get(key)
+            if data is None:
+                data = self._observations[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            data[0][index] += 1
+            data[1] += value
+            data[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Đo thời gian thực thi của một khối lệnh `with`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def time_function(self, function: Callable, **labels) -> Callable:
+        """Bọc một hàm đồng bộ để đo thời gian mỗi lần gọi."""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.time(**labels):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            observations = {key: (list(data[0]), data[1], data[2]) for key, data in self._observations.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(observations.items()):
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(upper)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Tập hợp các metric của tiến trình."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Xuất toàn bộ metric theo định dạng text exposition (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# --- Các metric dùng chung trong ứng dụng ---
+
+WEBHOOK_REQUESTS = Counter(
+    'jenkinsbot_webhook_requests_total', 'Webhook requests received from Jenkins.', ['result'])
+NOTIFICATION_SECONDS = Histogram(
+    'jenkinsbot_notification_processing_seconds', 'Time spent processing a build notification.', ['status'],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+UPLOAD_BYTES = Counter(
+    'jenkinsbot_upload_bytes_total', 'Bytes of build artifacts uploaded to Telegram.')
+ARTIFACT_RESUMES = Counter(
+    'jenkinsbot_artifact_download_resumes_total', 'Artifact downloads from Jenkins resumed with a Range request.')
+UPLOAD_SECONDS = Histogram(
+    'jenkinsbot_upload_seconds', 'Time spent uploading build artifacts to Telegram.', ['result'],
+    buckets=(1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+JENKINS_API_SECONDS = Histogram(
+    'jenkinsbot_jenkins_api_seconds', 'Latency of Jenkins API calls.', ['operation'])
+JENKINS_API_ERRORS = Counter(
+    'jenkinsbot_jenkins_api_errors_total', 'Failed Jenkins API calls.', ['operation'])
+DB_QUERY_SECONDS = Histogram(
+    'jenkinsbot_db_query_seconds', 'Latency of SQLite queries.', ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+TIMEOUT_QUEUE_SIZE = Gauge(
+    'jenkinsbot_timeout_queue_size', 'Conversation messages waiting for a timeout update.')
+EVENT_LOOP_LAG = Gauge(
+    'jenkinsbot_event_loop_lag_seconds', 'Most recent asyncio event loop scheduling delay.')
+BACKGROUND_TASKS = Gauge(
+    'jenkinsbot_background_tasks', 'Build notifications currently being processed in the background.')
+CALLBACK_SESSIONS = Gauge(
+    'jenkinsbot_callback_sessions', 'Inline keyboard sessions held in the callback store.')
+CACHE_HITS = Counter(
+    'jenkinsbot_cache_hits_total', 'Read-through cache hits.', ['cache'])
+CACHE_MISSES = Counter(
+    'jenkinsbot_cache_misses_total', 'Read-through cache misses.', ['cache'])
+BUILD_TRIGGERS = Counter(
+    'jenkinsbot_build_triggers_total', 'Build requests by outcome (triggered, coalesced into a queued build, error).',
+    ['result'])
+BUILD_ABORTS = Counter(
+    'jenkinsbot_build_aborts_total', 'Abort button presses by outcome (cancelled in queue, stopped while running, detached from a shared build, error).',
+    ['result'])
+NOTIFICATION_DELIVERIES = Counter(
+    'jenkinsbot_notification_deliveries_total', 'Telegram sends made while fanning out build notifications.',
+    ['result'])
+
+
+# Giá trị status hợp lệ cho NOTIFICATION_SECONDS; status từ webhook không được xác thực
+# nên mọi giá trị khác được gộp vào OTHER để số series không tăng vô hạn
+BUILD_STATUSES = ('SUCCESS', 'FAILURE', 'ABORTED', 'UNSTABLE')
+
+
+def build_status_label(status) -> str:
+    """Chuẩn hóa status build thành một trong BUILD_STATUSES hoặc 'OTHER'."""
+    status = str(status).upper()
+    return status if status in BUILD_STATUSES else 'OTHER'
+
+
+@contextmanager
+def track_jenkins_call(operation: str):
+    """Đo thời gian và đếm lỗi của một lệnh gọi Jenkins API."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        JENKINS_API_ERRORS.inc(operation=operation)
+        raise
+    finally:
+        JENKINS_API_SECONDS.observe(time.perf_counter() - start, operation=operation)
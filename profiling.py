@@ -0,0 +1,207 @@
+# profiling.py
+import asyncio
+import cProfile
+import functools
+import io
+import logging
+import marshal
+import pstats
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Optional, Tuple
+
+from telegram.ext import ConversationHandler
+
+import config
+import metrics
+from log_filters import add_html_filter_to_logger
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+# Bật lớp đo đạc (mặc định tắt vì có chi phí nhỏ cho mỗi handler)
+PROFILING_ENABLED = getattr(config, 'PROFILING_ENABLED', False)
+# Handler/tác vụ chạy lâu hơn ngưỡng này (giây) sẽ được ghi log kèm stack
+SLOW_HANDLER_THRESHOLD = getattr(config, 'SLOW_HANDLER_THRESHOLD', 1.0)
+# Số frame tối đa trong một stack sample
+STACK_LIMIT = 25
+# Số dòng hiển thị trong báo cáo /profile
+PROFILE_TOP_N = 60
+
+HANDLER_SECONDS = metrics.Histogram(
+    'jenkinsbot_handler_seconds', 'Wall time of instrumented bot handlers and background tasks.', ['handler'])
+
+_watchdog: Optional['StallWatchdog'] = None
+_profile_lock = asyncio.Lock()
+
+
+class StallWatchdog(threading.Thread):
+    """
+    Thread theo dõi event loop từ bên ngoài: khi LoopLagMonitor không "tick" quá `threshold`
+    giây (loop đang bị chặn bởi code đồng bộ), lấy stack hiện tại của thread chạy loop.
+
+    Handler bị chặn không thể tự lấy stack của chính nó, nên stack được chụp ở đây và
+    được gắn vào log của handler chậm sau khi nó kết thúc.
+    """
+
+    def __init__(self, loop_monitor, threshold: float, check_interval: float = 0.1):
+        super().__init__(name='stall-watchdog', daemon=True)
+        self.loop_monitor = loop_monitor
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self._loop_thread_id = threading.get_ident()
+        self._stop_event = threading.Event()
+        self._in_stall = False
+        # (thời điểm chụp theo time.monotonic(), stack)
+        self.last_sample: Optional[Tuple[float, str]] = None
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _capture_loop_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return ''
+        return ''.join(traceback.format_stack(frame, limit=STACK_LIMIT))
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.check_interval):
+            last_tick = self.loop_monitor.last_tick
+            if last_tick is None:
+                continue
+            stalled_for = time.monotonic() - last_tick - self.loop_monitor.interval
+            if stalled_for > self.threshold:
+                if not self._in_stall:
+                    self._in_stall = True
+                    stack = self._capture_loop_stack()
+                    self.last_sample = (time.monotonic(), stack)
+                    # Stack được truyền qua args để HTMLErrorFilter (chỉ rút gọn msg) không cắt mất
+                    logger.warning("Event loop blocked for more than %.2fs, stack:\n%s", stalled_for, stack)
+            else:
+                self._in_stall = False
+
+    def sample_since(self, started_at: float) -> Optional[str]:
+        """Trả về stack được chụp sau thời điểm `started_at` (time.monotonic()), nếu có."""
+        sample = self.last_sample
+        if sample and sample[0] >= started_at:
+            return sample[1]
+        return None
+
+
+def _report(name: str, elapsed: float, started_at: float) -> None:
+    HANDLER_SECONDS.observe(elapsed, handler=name)
+    if elapsed < SLOW_HANDLER_THRESHOLD:
+        return
+    stack = _watchdog.sample_since(started_at) if _watchdog else None
+    if stack:
+        logger.warning("Slow handler %s: %.2fs (event loop was blocked), stack sample:\n%s", name, elapsed, stack)
+    else:
+        logger.warning(f"Slow handler {name}: {elapsed:.2f}s")
+
+
+def _callback_name(callback: Callable) -> str:
+    return f"{getattr(callback, '__module__', '?')}.{getattr(callback, '__qualname__', repr(callback))}"
+
+
+def _wrap_callback(callback: Callable) -> Callable:
+    if getattr(callback, '_profiled', False):
+        return callback
+    name = _callback_name(callback)
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        started_at = time.monotonic()
+        start = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            _report(name, time.perf_counter() - start, started_at)
+
+    wrapper._profiled = True
+    return wrapper
+
+
+def _instrument_handler(handler) -> int:
+    if isinstance(handler, ConversationHandler):
+        count = 0
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for nested_handler in nested:
+            count += _instrument_handler(nested_handler)
+        return count
+    callback = getattr(handler, 'callback', None)
+    if callback is None or not asyncio.iscoroutinefunction(callback):
+        return 0
+    handler.callback = _wrap_callback(callback)
+    return 1
+
+
+def instrument_application(application) -> int:
+    """Bọc callback của mọi handler đã đăng ký (kể cả bên trong ConversationHandler) để đo thời gian."""
+    count = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            count += _instrument_handler(handler)
+    logger.info(f"Profiling: instrumented {count} handler callbacks")
+    return count
+
+
+def timed(name: str):
+    """Decorator đo thời gian cho coroutine chạy nền (ví dụ xử lý webhook) khi profiling được bật."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _watchdog is None:
+                return await func(*args, **kwargs)
+            started_at = time.monotonic()
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _report(name, time.perf_counter() - start, started_at)
+        return wrapper
+    return decorator
+
+
+def start(loop_monitor) -> None:
+    """Khởi động watchdog. Phải được gọi từ thread chạy event loop."""
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = StallWatchdog(loop_monitor, threshold=SLOW_HANDLER_THRESHOLD)
+        _watchdog.start()
+
+
+def stop() -> None:
+    global _watchdog
+    if _watchdog is not None:
+        _watchdog.stop()
+        _watchdog = None
+
+
+def is_profile_running() -> bool:
+    return _profile_lock.locked()
+
+
+async def run_profile(seconds: float) -> Tuple[str, bytes]:
+    """
+    Chạy cProfile trên thread của event loop trong `seconds` giây.
+
+    Trả về báo cáo dạng text (sắp xếp theo thời gian tích lũy) và dữ liệu pstats thô
+    (mở được bằng snakeviz hoặc `python -m pstats`).
+    """
+    async with _profile_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_N)
+    profiler.create_stats()
+    return stream.getvalue(), marshal.dumps(profiler.stats)
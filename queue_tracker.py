@@ -0,0 +1,275 @@
+# queue_tracker.py
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import config
+import database
+import metrics
+import rendering
+from lazy_imports import lazy_import
+from log_filters import add_html_filter_to_logger
+
+jenkins = lazy_import('jenkins')
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+# Chu kỳ (giây) hỏi hàng đợi Jenkins cho tất cả các build đang được theo dõi
+QUEUE_POLL_INTERVAL = getattr(config, 'QUEUE_POLL_INTERVAL', 10)
+# Ngừng theo dõi build sau thời gian này (giây) nếu không nhận được webhook kết thúc
+QUEUE_TRACK_MAX_AGE = getattr(config, 'QUEUE_TRACK_MAX_AGE', 6 * 3600)
+
+MessageKey = Tuple[int, int]
+
+
+def _poll_server_sync(server, builds: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Một lần gọi get_queue_info cho mọi build đang chờ của cùng một Jenkins/tài khoản.
+
+    get_queue_item chỉ được gọi cho các item vừa rời hàng đợi (để lấy số build hoặc biết
+    item đã bị hủy). Trả về {build_request_id: trạng thái mới}.
+    """
+    with metrics.track_jenkins_call('get_queue_info'):
+        queue = server.get_queue_info()
+    items = {item.get('id'): item for item in queue}
+    # Vị trí theo thời điểm vào hàng đợi (item vào sớm hơn được ưu tiên)
+    ordered = sorted(queue, key=lambda item: item.get('inQueueSince', 0))
+    positions = {item.get('id'): index for index, item in enumerate(ordered, start=1)}
+
+    updates = {}
+    for build in builds:
+        if build['state'] != 'queued':
+            continue
+        queue_item_id = build['queue_item_id']
+        item = items.get(queue_item_id)
+        if item is not None:
+            updates[build['build_request_id']] = {
+                'state': 'queued', 'position': positions[queue_item_id], 'queue_length': len(queue),
+                'why': item.get('why'),
+            }
+            continue
+        try:
+            with metrics.track_jenkins_call('get_queue_item'):
+                item = server.get_queue_item(queue_item_id)
+        except jenkins.JenkinsException as e:
+            logger.debug(f"Queue item {queue_item_id} is no longer available: {e}")
+            updates[build['build_request_id']] = {'state': 'lost'}
+            continue
+        if item.get('cancelled'):
+            updates[build['build_request_id']] = {'state': 'cancelled'}
+        elif item.get('executable'):
+            updates[build['build_request_id']] = {'state': 'running', 'build_number': item['executable'].get('number')}
+    return updates
+
+
+class QueueTracker:
+    """
+    Theo dõi các build vừa trigger trong hàng đợi Jenkins và cập nhật tin nhắn trigger.
+
+    Một job lặp duy nhất trên JobQueue hỏi hàng đợi cho mọi build đang theo dõi: mỗi chu kỳ
+    chỉ một lệnh get_queue_info cho mỗi Jenkins/tài khoản, bất kể có bao nhiêu build, nên tải
+    lên Jenkins không tăng theo số build. Job tự dừng khi không còn build nào cần theo dõi.
+    """
+
+    def __init__(self, application, interval: float = QUEUE_POLL_INTERVAL):
+        self.application = application
+        self.interval = interval
+        # build_request_id -> trạng thái build (queued/running) và thông tin kết nối Jenkins
+        self._builds: Dict[str, Dict[str, Any]] = {}
+        # (chat_id, message_id) -> {'render', 'build_request_ids', 'text', 'final'}
+        self._messages: Dict[MessageKey, Dict[str, Any]] = {}
+        # Client python-jenkins theo (url, userid, token): token mới sau /login dùng client mới
+        self._clients: Dict[Tuple[str, str, str], Any] = {}
+        self._job = None
+
+    def track(self, chat_id: int, message_id: int, results: List[Dict[str, Any]], creds: Dict[str, str],
+              job_name: str, render: Callable[[Dict[str, str]], Optional[str]], reply_markup=None) -> None:
+        """
+        Theo dõi các build (kết quả của build_trigger.trigger_builds) hiển thị trên một tin nhắn.
+
+        `render(progress)` trả về nội dung mới của tin nhắn (MarkdownV2) với progress là
+        {build_request_id: dòng trạng thái hàng đợi}. `reply_markup` (nút Abort) được giữ
+        khi sửa tin nhắn và gỡ đi khi mọi build của tin nhắn đã kết thúc.
+        """
+        build_request_ids = []
+        for result in results:
+            if result.get('error') is not None or result.get('queue_item_id') is None:
+                continue
+            build_request_id = result['build_request_id']
+            build_request_ids.append(build_request_id)
+            self._builds.setdefault(build_request_id, {
+                'build_request_id': build_request_id,
+                'queue_item_id': result['queue_item_id'],
+                'job_name': job_name,
+                'target': result['target'],
+                'creds_key': (creds['jenkins_url'], creds['jenkins_userid'], creds['jenkins_token']),
+                'creds': creds,
+                'state': 'queued',
+                'tracked_at': time.monotonic(),
+            })
+        if not build_request_ids:
+            return
+        self._messages[(chat_id, message_id)] = {
+            'render': render, 'build_request_ids': build_request_ids, 'text': None, 'final': {},
+            'reply_markup': reply_markup, 'released': set(),
+        }
+        self._ensure_job()
+
+    def progress(self) -> Dict[str, str]:
+        """Dòng trạng thái hiện tại của các build đang theo dõi, theo build_request_id."""
+        return {build_request_id: build['progress'] for build_request_id, build in self._builds.items() if build.get('progress')}
+
+    def is_tracking_message(self, chat_id: int, message_id: int) -> bool:
+        return (chat_id, message_id) in self._messages
+
+    def get_build(self, build_request_id: str) -> Optional[Dict[str, Any]]:
+        return self._builds.get(build_request_id)
+
+    async def finish(self, build_request_id: str, final_line: Optional[str] = None) -> Set[MessageKey]:
+        """
+        Ngừng theo dõi build đã kết thúc (gọi khi nhận webhook) và vẽ lại các tin nhắn của nó,
+        thay dòng trạng thái hàng đợi bằng `final_line`. Trả về các tin nhắn đã được cập nhật.
+        """
+        if self._builds.pop(build_request_id, None) is None:
+            return set()
+        keys = {key for key, message in self._messages.items() if build_request_id in message['build_request_ids']}
+        if final_line:
+            for key in keys:
+                self._messages[key]['final'][build_request_id] = final_line
+        await self._refresh(keys)
+        return keys
+
+    async def annotate(self, build_request_id: str, line: str) -> None:
+        """Thay dòng trạng thái hàng đợi của build bằng `line` (ví dụ khi đang dừng build)."""
+        keys = {key for key, message in self._messages.items() if build_request_id in message['build_request_ids']}
+        for key in keys:
+            self._messages[key]['final'][build_request_id] = line
+        await self._refresh(keys)
+
+    async def release(self, chat_id: int, message_id: int, build_request_id: str, line: str, reply_markup=None) -> None:
+        """
+        Ngừng hiển thị tiến trình của build trên một tin nhắn (người yêu cầu đã rời build dùng chung),
+        build vẫn được theo dõi cho các tin nhắn khác. `reply_markup` thay cho bàn phím cũ của tin nhắn.
+        """
+        message = self._messages.get((chat_id, message_id))
+        if message is None or build_request_id not in message['build_request_ids']:
+            return
+        message['final'][build_request_id] = line
+        message['released'].add(build_request_id)
+        message['reply_markup'] = reply_markup
+        await self._refresh({(chat_id, message_id)})
+
+    def _ensure_job(self) -> None:
+        if self._job is None:
+            self._job = self.application.job_queue.run_repeating(
+                self._poll, interval=self.interval, first=1, name='queue_tracker'
+            )
+
+    def _client(self, build: Dict[str, Any]):
+        client = self._clients.get(build['creds_key'])
+        if client is None:
+            creds = build['creds']
+            client = jenkins.Jenkins(creds['jenkins_url'], username=creds['jenkins_userid'], password=creds['jenkins_token'])
+            self._clients[build['creds_key']] = client
+        return client
+
+    async def _poll(self, context) -> None:
+        now = time.monotonic()
+        for build_request_id, build in list(self._builds.items()):
+            if now - build['tracked_at'] > QUEUE_TRACK_MAX_AGE:
+                self._builds.pop(build_request_id)
+
+        by_server: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        for build in self._builds.values():
+            by_server.setdefault(build['creds_key'], []).append(build)
+        servers = list(by_server.items())
+        # Bỏ client của các tài khoản không còn build nào được theo dõi
+        for creds_key in set(self._clients) - set(by_server):
+            del self._clients[creds_key]
+        results = await asyncio.gather(
+            *(asyncio.to_thread(_poll_server_sync, self._client(builds[0]), builds) for _, builds in servers),
+            return_exceptions=True,
+        )
+
+        durations: Dict[str, Dict[str, Optional[float]]] = {}
+        for (creds_key, _), updates in zip(servers, results):
+            if isinstance(updates, Exception):
+                logger.warning(f"Could not poll the Jenkins queue at {creds_key[0]}: {updates}")
+                continue
+            for build_request_id, update in updates.items():
+                # Build có thể đã được finish() gỡ ra trong lúc chờ Jenkins trả lời
+                build = self._builds.get(build_request_id)
+                if build is None:
+                    continue
+                self._apply(build, update)
+
+        now = time.monotonic()
+        for build_request_id, build in list(self._builds.items()):
+            if build['job_name'] not in durations:
+                durations[build['job_name']] = {
+                    stats['build_target']: stats['p50_duration'] for stats in database.get_build_stats(build['job_name'])
+                }
+            typical = durations[build['job_name']].get(build['target'] or '')
+            build['progress'] = rendering.render_queue_progress(build, typical, now)
+            if build['state'] in ('cancelled', 'lost'):
+                # Giữ dòng trạng thái cuối trên tin nhắn rồi ngừng theo dõi
+                for message in self._messages.values():
+                    if build_request_id in message['build_request_ids']:
+                        message['final'][build_request_id] = build['progress']
+                del self._builds[build_request_id]
+
+        await self._refresh(set(self._messages))
+        if not self._builds and self._job is not None:
+            self._job.schedule_removal()
+            self._job = None
+
+    def _apply(self, build: Dict[str, Any], update: Dict[str, Any]) -> None:
+        if update['state'] == 'running' and build['state'] != 'running':
+            build['started_at'] = time.monotonic()
+            if update.get('build_number') is not None:
+                # Số build được dùng để dừng build đang chạy và khớp webhook
+                database.update_build_request_with_build_number(build['build_request_id'], update['build_number'])
+        elif update['state'] == 'cancelled':
+            database.update_build_request_result(build['build_request_id'], 'CANCELLED', None)
+        build.update(update)
+
+    async def _refresh(self, keys: Set[MessageKey]) -> None:
+        """Vẽ lại các tin nhắn; chỉ gọi Bot API khi nội dung thay đổi."""
+        progress = self.progress()
+        for key in keys:
+            message = self._messages.get(key)
+            if message is None:
+                continue
+            try:
+                text = message['render']({**progress, **message['final']})
+            except Exception as e:
+                logger.warning(f"Could not render queue status for message {key}: {e}")
+                text = None
+            active = any(
+                build_request_id in self._builds and build_request_id not in message['released']
+                for build_request_id in message['build_request_ids']
+            )
+            if text and text != message['text']:
+                try:
+                    await self.application.bot.edit_message_text(
+                        text=text, chat_id=key[0], message_id=key[1], parse_mode='MarkdownV2',
+                        reply_markup=message['reply_markup'] if active else None
+                    )
+                    message['text'] = text
+                except Exception as e:
+                    logger.debug(f"Could not update queue status message {key}: {e}")
+            if not active:
+                del self._messages[key]
+
+
+_tracker: Optional[QueueTracker] = None
+
+def init_tracker(application) -> QueueTracker:
+    global _tracker
+    _tracker = QueueTracker(application)
+    return _tracker
+
+def get_tracker() -> Optional[QueueTracker]:
+    return _tracker
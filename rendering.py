@@ -0,0 +1,349 @@
+# rendering.py
+from functools import lru_cache
+from typing import Iterable, Optional
+from urllib.parse import urljoin
+
+# Các cặp thay thế ký tự đặc biệt của MarkdownV2, tạo một lần khi import module.
+# Dấu \ phải được escape đầu tiên. Chuỗi str.replace (bỏ qua ký tự không xuất hiện)
+# nhanh hơn str.translate với bảng dict, vốn đi vào nhánh chậm của CPython.
+_MARKDOWN_V2_PAIRS = tuple((char, f"\\{char}") for char in '\\_*[]()~`>#+-=|{}.!')
+# Bên trong khối code/pre chỉ cần escape ` và \
+_MARKDOWN_V2_CODE_PAIRS = (('\\', '\\\\'), ('`', '\\`'))
+# Bên trong phần URL của link chỉ cần escape ) và \
+_MARKDOWN_V2_URL_PAIRS = (('\\', '\\\\'), (')', '\\)'))
+
+# Chỉ cache các chuỗi ngắn (tên job, branch, target) vốn lặp lại rất nhiều
+_CACHEABLE_LENGTH = 128
+
+
+def _replace_all(text: str, pairs) -> str:
+    for char, escaped in pairs:
+        if char in text:
+            text = text.replace(char, escaped)
+    return text
+
+
+@lru_cache(maxsize=2048)
+def _escape_cached(text: str) -> str:
+    return _replace_all(text, _MARKDOWN_V2_PAIRS)
+
+
+def escape_markdown_v2(text) -> str:
+    """Escapes special characters for Telegram's MarkdownV2 parse mode."""
+    if not isinstance(text, str):
+        text = str(text)
+    if len(text) <= _CACHEABLE_LENGTH:
+        return _escape_cached(text)
+    return _replace_all(text, _MARKDOWN_V2_PAIRS)
+
+
+def escape_markdown_v2_code(text: str) -> str:
+    """Escape nội dung bên trong khối code (```) của MarkdownV2."""
+    return _replace_all(text, _MARKDOWN_V2_CODE_PAIRS)
+
+
+def escape_markdown_v2_url(url: str) -> str:
+    """Escape URL dùng trong link [text](url) của MarkdownV2."""
+    return _replace_all(url, _MARKDOWN_V2_URL_PAIRS)
+
+
+def job_url_path(job_name: str) -> str:
+    """Chuyển job path 'Folder/Job' thành đường dẫn URL Jenkins 'job/Folder/job/Job'."""
+    return '/'.join([f"job/{part}" for part in job_name.split('/')])
+
+
+# --- Các mẫu tin nhắn (MarkdownV2), phần tĩnh đã được escape sẵn ---
+
+_LOADING_PARAMETERS = "🔍 Loading parameters for `{job}`\\.\\.\\."
+
+_BRANCH_SELECTED = "🔀 Branch: `{branch}`\n\n🎯 Please select one or more build targets:"
+
+_BUILD_TRIGGERED = (
+    "✅ *Build Triggered\\!*\n\n"
+    "🔨 *Job:* `{job}`\n"
+    "🔀 *Branch:* `{branch}`\n"
+    "🎯 *Target:* `{target}`\n\n"
+    "I will notify you when it's complete\\."
+)
+
+_BUILD_COALESCED = (
+    "🔗 *Already Queued*\n\n"
+    "🔨 *Job:* `{job}`\n"
+    "🔀 *Branch:* `{branch}`\n"
+    "🎯 *Target:* `{target}`\n\n"
+    "An identical build is already waiting in the Jenkins queue, so no new build was started\\. "
+    "I will notify you when it's complete\\."
+)
+
+_SCHEDULED_BUILD_TRIGGERED = (
+    "⏰ *Scheduled Build Triggered* \\(\\#{schedule_id}\\)\n\n"
+    "🔨 *Job:* `{job}`\n"
+    "🔀 *Branch:* `{branch}`\n"
+    "🎯 *Target:* `{target}`"
+)
+
+_BATCH_STATUS = (
+    "🚀 *Batch Build*\n\n"
+    "🔨 *Job:* `{job}`\n"
+    "🔀 *Branch:* `{branch}`\n\n"
+    "{targets}\n\n"
+    "{summary}"
+)
+
+_BATCH_TARGET_ICONS = {"SUCCESS": "✅", "FAILURE": "❌", "ABORTED": "⛔", "UNSTABLE": "⚠️", "CANCELLED": "🚫"}
+
+_SETUP_COMPLETE = (
+    "✅ *Setup Complete\\!*\n\n"
+    "🗂️ *Project:* `{folder}`\n"
+    "🔨 *Job:* `{job}`\n\n"
+    "──────────────\n"
+    "🔗 Group linked to `{job_path}`\n"
+    "📋 See all linked jobs with /jobs\n"
+    "🚀 Ready to use /build command\\!"
+)
+
+_BUILD_SUCCESS = (
+    "✅ *Build Succeeded\\!*\n\n"
+    "*Job:* `{job}`\n"
+    "*Build:* `#{build_number}`\n"
+    "*Target:* `{target}`\n\n"
+    "{links}"
+)
+
+_BUILD_FAILURE = (
+    "❌ *Build Failed\\!*\n\n"
+    "*Job:* `{job}`\n"
+    "*Build:* `#{build_number}`\n"
+    "*Status:* `{status}`\n\n"
+    "{links}"
+)
+
+_ERROR_EXCERPT = "\n\n🔎 *Error excerpt:*\n```\n{excerpt}\n```"
+
+UPLOADING_SUFFIX = "\n\nUploading file\\.\\.\\."
+
+NO_ARTIFACT_MESSAGE = "Build successful, but no artifact file was specified to be sent\\."
+
+_UPLOAD_ERROR = "⚠️ An error occurred while sending the build file: `{error}`"
+
+_ARTIFACT_CAPTION = "📦 {size}\n🔐 SHA\\-256: `{sha256}`"
+
+_ARTIFACT_MISMATCH = (
+    "⚠️ The build file was not sent because it does not match the build manifest: {reason}\\. "
+    "It may have been overwritten by another build\\. Please rebuild\\."
+)
+
+_ARTIFACT_NOT_FOUND = (
+    "⚠️ Error: Build file specified but not found at path: `{path}`\\. "
+    "Please check permissions and path accessibility for the bot\\."
+)
+
+
+def render_loading_parameters(job_name: str) -> str:
+    return _LOADING_PARAMETERS.format(job=escape_markdown_v2(job_name))
+
+
+def render_branch_selected(branch: str) -> str:
+    return _BRANCH_SELECTED.format(branch=escape_markdown_v2(branch))
+
+
+def render_build_triggered(job_name: str, branch: str, target: str) -> str:
+    return _BUILD_TRIGGERED.format(
+        job=escape_markdown_v2(job_name),
+        branch=escape_markdown_v2(branch),
+        target=escape_markdown_v2(target),
+    )
+
+
+def render_build_coalesced(job_name: str, branch: str, target: str) -> str:
+    return _BUILD_COALESCED.format(
+        job=escape_markdown_v2(job_name),
+        branch=escape_markdown_v2(branch),
+        target=escape_markdown_v2(target),
+    )
+
+def render_scheduled_build_triggered(schedule_id: int, job_name: str, branch: str, target: str) -> str:
+    return _SCHEDULED_BUILD_TRIGGERED.format(
+        schedule_id=schedule_id,
+        job=escape_markdown_v2(job_name),
+        branch=escape_markdown_v2(branch),
+        target=escape_markdown_v2(target),
+    )
+
+def render_batch_status(job_name: str, branch: str, entries: Iterable[dict]) -> str:
+    """
+    Tin nhắn trạng thái chung của một lô build.
+
+    Mỗi entry là dict {'target', 'status', 'build_number', 'error', 'progress'}: status None nghĩa là
+    đang chạy, error là lỗi khi trigger (build chưa được tạo), progress là dòng trạng thái
+    hàng đợi (render_queue_progress) nếu build đang được theo dõi.
+    """
+    lines = []
+    finished = 0
+    entries = list(entries)
+    for entry in entries:
+        target = escape_markdown_v2(entry['target'])
+        if entry.get('error'):
+            finished += 1
+            lines.append(f"🚫 `{target}` — failed to start: {escape_markdown_v2(entry['error'])}")
+        elif entry.get('status'):
+            finished += 1
+            icon = _BATCH_TARGET_ICONS.get(entry['status'], "•")
+            build = f"\\#{entry['build_number']} " if entry.get('build_number') is not None else ""
+            lines.append(f"{icon} `{target}` — {build}{escape_markdown_v2(entry['status'])}")
+        elif entry.get('progress'):
+            lines.append(f"`{target}` — {entry['progress']}")
+        elif entry.get('coalesced'):
+            lines.append(f"⏳ `{target}` — joined an identical queued build")
+        else:
+            lines.append(f"⏳ `{target}` — running")
+    if finished == len(entries):
+        summary = "🏁 All targets finished\\."
+    else:
+        summary = f"{finished}/{len(entries)} finished\\. I will update this message as each target completes\\."
+    return _BATCH_STATUS.format(
+        job=escape_markdown_v2(job_name),
+        branch=escape_markdown_v2(branch),
+        targets="\n".join(lines),
+        summary=summary,
+    )
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """Định dạng thời gian (giây) thành chuỗi dễ đọc, ví dụ '12m 30s'."""
+    if seconds is None:
+        return "n/a"
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {secs}s"
+    return f"{secs}s"
+
+
+def render_queue_progress(build: dict, typical_duration: Optional[float], now: float) -> str:
+    """
+    Dòng trạng thái của build trong hàng đợi Jenkins (MarkdownV2).
+
+    `build` là trạng thái do queue_tracker theo dõi, `typical_duration` là thời gian build p50
+    của target (None nếu chưa có lịch sử), `now` cùng đồng hồ với build['started_at'].
+    """
+    state = build['state']
+    if state == 'cancelled':
+        return "🚫 Cancelled in the Jenkins queue"
+    if state == 'lost':
+        return "❔ No longer visible in the Jenkins queue"
+    if state == 'running':
+        # Làm tròn theo phút để tin nhắn chỉ bị sửa khi nội dung thực sự thay đổi
+        elapsed = now - build['started_at']
+        build_number = f" \\#{build['build_number']}" if build.get('build_number') is not None else ""
+        text = f"🏗️ Running{build_number} for {int(elapsed // 60)} min"
+        if typical_duration:
+            remaining = typical_duration - elapsed
+            if remaining > 0:
+                text += f", about {int(-(-remaining // 60))} min left"
+            else:
+                text += ", taking longer than usual"
+        return text
+    if build.get('position'):
+        text = f"🕒 Queued \\({build['position']}/{build['queue_length']}\\)"
+    else:
+        text = "🕒 Queued"
+    if build.get('why'):
+        text += f": _{escape_markdown_v2(build['why'])}_"
+    if typical_duration:
+        text += f"\n⏱️ Usually takes {escape_markdown_v2(format_duration(typical_duration))}"
+    return text
+
+
+def render_queue_finished(status: str, build_number: int) -> str:
+    icon = _BATCH_TARGET_ICONS.get(status, "🏁")
+    return f"{icon} Finished: \\#{build_number} {escape_markdown_v2(status)}"
+
+
+def render_abort_requested(user_name: str) -> str:
+    return f"⛔ Abort requested by {escape_markdown_v2(user_name)}, waiting for Jenkins to stop the build\\.\\.\\."
+
+
+def render_cancelled_by(user_name: str) -> str:
+    return f"🚫 Cancelled in the Jenkins queue by {escape_markdown_v2(user_name)}"
+
+
+def render_left_by(user_name: str) -> str:
+    return f"👋 {escape_markdown_v2(user_name)} left this build, it keeps running for the other requesters"
+
+
+def render_with_progress(text: str, progress: Optional[str]) -> str:
+    """Nối dòng trạng thái hàng đợi vào cuối tin nhắn trigger build (nếu có)."""
+    return f"{text}\n\n{progress}" if progress else text
+
+
+def render_setup_complete(folder: str, job: str, job_path: str) -> str:
+    return _SETUP_COMPLETE.format(
+        folder=escape_markdown_v2(folder),
+        job=escape_markdown_v2(job),
+        job_path=escape_markdown_v2(job_path),
+    )
+
+
+def render_build_links(jenkins_url: str, job_name: str, build_number: int, build_target: Optional[str]) -> str:
+    """Tạo các link tới Unity log (nếu có target) và Console log."""
+    path = job_url_path(job_name)
+    links = []
+    if build_target:
+        unity_log_url = urljoin(jenkins_url, f"{path}/ws/unity_build_{build_target}.log")
+        links.append(f"📜 [View Unity Build Log]({escape_markdown_v2_url(unity_log_url)})")
+    console_log_url = urljoin(jenkins_url, f"{path}/{build_number}/console")
+    links.append(f"📝 [View Console Log]({escape_markdown_v2_url(console_log_url)})")
+    return "\n".join(links)
+
+
+def render_build_success(job_name: str, build_number: int, build_target: Optional[str], links: str) -> str:
+    return _BUILD_SUCCESS.format(
+        job=escape_markdown_v2(job_name),
+        build_number=build_number,
+        target=escape_markdown_v2(build_target or 'Unknown'),
+        links=links,
+    )
+
+
+def render_build_failure(job_name: str, build_number: int, status: str, links: str) -> str:
+    return _BUILD_FAILURE.format(
+        job=escape_markdown_v2(job_name),
+        build_number=build_number,
+        status=escape_markdown_v2(status),
+        links=links,
+    )
+
+
+def render_error_excerpt(lines: Iterable[str]) -> str:
+    """Tạo khối code chứa các dòng lỗi, để nối vào cuối tin nhắn build thất bại."""
+    return _ERROR_EXCERPT.format(excerpt=escape_markdown_v2_code("\n".join(lines)))
+
+
+def render_upload_error(error) -> str:
+    return _UPLOAD_ERROR.format(error=escape_markdown_v2(str(error)))
+
+
+def format_size(size: int) -> str:
+    """Định dạng kích thước (byte) thành chuỗi dễ đọc, ví dụ '48.2 MB'."""
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def render_artifact_caption(size: int, sha256: str) -> str:
+    return _ARTIFACT_CAPTION.format(size=escape_markdown_v2(format_size(size)), sha256=escape_markdown_v2_code(sha256))
+
+
+def render_artifact_mismatch(reason: str) -> str:
+    return _ARTIFACT_MISMATCH.format(reason=escape_markdown_v2(reason))
+
+
+def render_artifact_not_found(path: str) -> str:
+    return _ARTIFACT_NOT_FOUND.format(path=escape_markdown_v2(path))
+
@@ -0,0 +1,289 @@
+# scheduler.py
+import heapq
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import config
+import database
+import rendering
+import build_trigger
+import queue_tracker
+from handlers import keyboards
+from log_filters import add_html_filter_to_logger
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+# Múi giờ dùng để tính biểu thức cron của các lịch build
+SCHEDULE_TIMEZONE = ZoneInfo(getattr(config, 'SCHEDULE_TIMEZONE', 'UTC'))
+# True: các lần chạy bị lỡ khi bot tắt được gộp thành một lần chạy ngay khi khởi động lại.
+# False: bỏ qua các lần bị lỡ, chờ lần chạy kế tiếp.
+SCHEDULE_COALESCE_MISSED = getattr(config, 'SCHEDULE_COALESCE_MISSED', True)
+
+_ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+_MONTH_NAMES = {name: index for index, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), start=1)}
+_WEEKDAY_NAMES = {name: index for index, name in enumerate(('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'))}
+# Biểu thức không bao giờ khớp (ví dụ 30/2) được phát hiện sau số năm này
+_MAX_SEARCH_YEARS = 8
+
+
+def _parse_value(value: str, names: Dict[str, int]) -> int:
+    value = value.lower()
+    if value in names:
+        return names[value]
+    if not value.isdigit():
+        raise ValueError(f"invalid value '{value}'")
+    return int(value)
+
+def _parse_field(field: str, low: int, high: int, names: Optional[Dict[str, int]] = None) -> FrozenSet[int]:
+    """Phân tích một trường cron ('*', '5', '1-5', '*/15', '0-30/10', 'mon,wed') thành tập giá trị."""
+    names = names or {}
+    values = set()
+    for part in field.split(','):
+        part, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if step <= 0:
+            raise ValueError(f"invalid step in '{field}'")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (_parse_value(value, names) for value in part.split('-', 1))
+        else:
+            start = _parse_value(part, names)
+            end = high if step > 1 else start
+        if not (low <= start <= high and low <= end <= high and start <= end):
+            raise ValueError(f"'{field}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronExpression:
+    """
+    Biểu thức cron 5 trường: phút giờ ngày-trong-tháng tháng ngày-trong-tuần.
+
+    Hỗ trợ *, danh sách, khoảng, bước, tên tháng/thứ (jan, mon...) và các alias @daily, @hourly...
+    Giống cron, khi cả ngày-trong-tháng và ngày-trong-tuần đều bị giới hạn thì chỉ cần khớp một trong hai.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        fields = _ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError("a cron expression needs 5 fields: minute hour day month weekday")
+        self.minutes = sorted(_parse_field(fields[0], 0, 59))
+        self.hours = frozenset(_parse_field(fields[1], 0, 23))
+        self.days = frozenset(_parse_field(fields[2], 1, 31))
+        self.months = frozenset(_parse_field(fields[3], 1, 12, _MONTH_NAMES))
+        # 7 cũng là Chủ nhật
+        self.weekdays = frozenset(day % 7 for day in _parse_field(fields[4], 0, 7, _WEEKDAY_NAMES))
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, day: date) -> bool:
+        cron_weekday = (day.weekday() + 1) % 7
+        if self._any_day:
+            return cron_weekday in self.weekdays
+        if self._any_weekday:
+            return day.day in self.days
+        return day.day in self.days or cron_weekday in self.weekdays
+
+    def next_after(self, after: datetime) -> datetime:
+        """
+        Thời điểm chạy đầu tiên sau `after` (datetime có múi giờ).
+
+        Nhảy thẳng qua cả tháng/ngày/giờ không khớp thay vì duyệt từng phút.
+        """
+        tz = after.tzinfo or SCHEDULE_TIMEZONE
+        current = after.astimezone(SCHEDULE_TIMEZONE).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        last_year = current.year + _MAX_SEARCH_YEARS
+        while current.year <= last_year:
+            if current.month not in self.months:
+                year, month = divmod(current.month, 12)
+                current = datetime(current.year + year, month + 1, 1)
+                continue
+            if not self._day_matches(current.date()):
+                current = datetime.combine(current.date() + timedelta(days=1), datetime.min.time())
+                continue
+            if current.hour not in self.hours:
+                current = current.replace(minute=0) + timedelta(hours=1)
+                continue
+            minute = next((minute for minute in self.minutes if minute >= current.minute), None)
+            if minute is None:
+                current = current.replace(minute=0) + timedelta(hours=1)
+                continue
+            return current.replace(minute=minute, tzinfo=SCHEDULE_TIMEZONE).astimezone(tz)
+        raise ValueError(f"cron expression '{self.expression}' never matches")
+
+    def __str__(self) -> str:
+        return self.expression
+
+
+def _parse_db_time(value: Optional[str]) -> Optional[datetime]:
+    # SQLite lưu CURRENT_TIMESTAMP theo UTC dạng 'YYYY-MM-DD HH:MM:SS'
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+
+
+class BuildScheduler:
+    """
+    Chạy các lịch build định kỳ bằng một job duy nhất trên JobQueue.
+
+    Thời điểm chạy kế tiếp của mọi lịch nằm trong một heap; JobQueue chỉ được hẹn giờ
+    (run_once) cho lịch sớm nhất, nên không có vòng kiểm tra mỗi phút. Lịch bị xóa/sửa
+    được loại khỏi heap theo kiểu lazy (so khớp phiên bản khi lấy ra).
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self._schedules: Dict[int, Dict] = {}
+        self._heap: List[Tuple[datetime, int, int]] = []
+        self._versions: Dict[int, int] = {}
+        self._job = None
+        self._armed_at: Optional[datetime] = None
+
+    def load(self) -> int:
+        """Nạp các lịch từ database; lịch bị lỡ khi bot tắt được gộp thành một lần chạy ngay."""
+        now = datetime.now(timezone.utc)
+        missed = 0
+        for schedule in database.get_schedules():
+            try:
+                cron = CronExpression(schedule['cron'])
+            except ValueError as e:
+                logger.error(f"Skipping schedule {schedule['id']} with invalid cron '{schedule['cron']}': {e}")
+                continue
+            reference = _parse_db_time(schedule['last_run_at']) or _parse_db_time(schedule['created_at']) or now
+            next_run = cron.next_after(reference)
+            if next_run <= now:
+                if SCHEDULE_COALESCE_MISSED:
+                    missed += 1
+                    next_run = now
+                else:
+                    next_run = cron.next_after(now)
+            self._push(schedule, cron, next_run)
+        if missed:
+            logger.info(f"Running {missed} scheduled builds missed while the bot was down")
+        self._arm()
+        logger.info(f"Loaded {len(self._schedules)} build schedules")
+        return len(self._schedules)
+
+    def add(self, schedule: Dict) -> datetime:
+        """Thêm (hoặc thay thế) một lịch đã lưu trong database; trả về lần chạy kế tiếp."""
+        cron = CronExpression(schedule['cron'])
+        next_run = cron.next_after(datetime.now(timezone.utc))
+        self._push(schedule, cron, next_run)
+        self._arm()
+        return next_run
+
+    def remove(self, schedule_id: int) -> None:
+        self._schedules.pop(schedule_id, None)
+        self._versions.pop(schedule_id, None)
+
+    def next_run(self, schedule_id: int) -> Optional[datetime]:
+        schedule = self._schedules.get(schedule_id)
+        return schedule['next_run'] if schedule else None
+
+    def _push(self, schedule: Dict, cron: CronExpression, next_run: datetime) -> None:
+        version = self._versions.get(schedule['id'], 0) + 1
+        self._versions[schedule['id']] = version
+        self._schedules[schedule['id']] = {**schedule, 'cron_expression': cron, 'next_run': next_run}
+        heapq.heappush(self._heap, (next_run, schedule['id'], version))
+
+    def _discard_stale(self) -> None:
+        while self._heap and self._versions.get(self._heap[0][1]) != self._heap[0][2]:
+            heapq.heappop(self._heap)
+
+    def _arm(self) -> None:
+        """Hẹn giờ JobQueue cho lịch sớm nhất (chỉ đặt lại khi lịch sớm nhất thay đổi)."""
+        self._discard_stale()
+        if not self._heap:
+            return
+        when = self._heap[0][0]
+        if self._job is not None and self._armed_at is not None and self._armed_at <= when:
+            return
+        if self._job is not None:
+            self._job.schedule_removal()
+        # Lịch đã đến hạn (ví dụ lần chạy bị lỡ được gộp lúc load) được hẹn theo thời điểm hiện tại,
+        # tính ngay trước khi hẹn giờ. misfire_grace_time=None để job không bị APScheduler bỏ qua khi
+        # event loop bị chậm: nếu bị bỏ, sẽ không còn job nào hẹn giờ và mọi lịch ngừng chạy.
+        self._job = self.application.job_queue.run_once(
+            self._run_due, when=max(when, datetime.now(timezone.utc)), name='build_scheduler',
+            job_kwargs={'misfire_grace_time': None}
+        )
+        self._armed_at = when
+
+    async def _run_due(self, context) -> None:
+        self._job = None
+        self._armed_at = None
+        now = datetime.now(timezone.utc)
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, schedule_id, _ = heapq.heappop(self._heap)
+            schedule = self._schedules[schedule_id]
+            # Nhiều lần đến hạn (ví dụ event loop bị chậm) chỉ chạy một lần
+            self._push(schedule, schedule['cron_expression'], schedule['cron_expression'].next_after(now))
+            self.application.create_task(self._fire(schedule))
+        self._arm()
+
+    async def _fire(self, schedule: Dict) -> None:
+        """Trigger build của một lịch và báo vào nhóm."""
+        group_id = schedule['telegram_group_id']
+        database.update_schedule_last_run(schedule['id'])
+        creds = database.get_user_credentials(schedule['created_by_user_id'])
+        bot = self.application.bot
+        if not creds:
+            logger.warning(f"Schedule {schedule['id']}: no Jenkins credentials for user {schedule['created_by_user_id']}")
+            await bot.send_message(
+                group_id,
+                f"⚠️ Scheduled build #{schedule['id']} was skipped: its owner is no longer logged in to Jenkins."
+            )
+            return
+
+        [result] = await build_trigger.trigger_builds(
+            creds, schedule['jenkins_job_path'], schedule['branch'], [schedule['build_target']],
+            group_id, schedule['created_by_user_id']
+        )
+        if result['error'] is not None:
+            await bot.send_message(group_id, f"❌ Scheduled build #{schedule['id']} could not be started: {result['error']}")
+            return
+        if result['coalesced']:
+            message = rendering.render_build_coalesced(schedule['jenkins_job_path'], schedule['branch'], schedule['build_target'])
+        else:
+            message = rendering.render_scheduled_build_triggered(
+                schedule['id'], schedule['jenkins_job_path'], schedule['branch'], schedule['build_target']
+            )
+        reply_markup = keyboards.abort_keyboard([result])
+        sent = await bot.send_message(group_id, message, parse_mode='MarkdownV2', reply_markup=reply_markup)
+        tracker = queue_tracker.get_tracker()
+        if tracker:
+            tracker.track(
+                group_id, sent.message_id, [result], creds, schedule['jenkins_job_path'],
+                lambda progress: rendering.render_with_progress(message, progress.get(result['build_request_id'])),
+                reply_markup=reply_markup
+            )
+
+
+_scheduler: Optional[BuildScheduler] = None
+
+def init_scheduler(application) -> BuildScheduler:
+    """Tạo scheduler dùng chung và nạp các lịch (gọi sau khi application/JobQueue đã start)."""
+    global _scheduler
+    _scheduler = BuildScheduler(application)
+    _scheduler.load()
+    return _scheduler
+
+def get_scheduler() -> Optional[BuildScheduler]:
+    return _scheduler
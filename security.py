@@ -1,11 +1,14 @@
 # security.py
 import base64
 import os
-from cryptography.fernet import Fernet
 import config
 import logging
 from typing import Optional
 from log_filters import add_html_filter_to_logger
+from lazy_imports import lazy_import
+
+# cryptography chỉ được nạp khi mã hóa/giải mã lần đầu
+fernet = lazy_import('cryptography.fernet')
 
 # Cấu hình logging
 logger = logging.getLogger(__name__)
@@ -19,7 +22,7 @@ def encrypt_data(data: str) -> Optional[str]:
     """Mã hóa dữ liệu."""
     try:
         key = get_key()
-        f = Fernet(key)
+        f = fernet.Fernet(key)
         encrypted_data = f.encrypt(data.encode())
         return encrypted_data.decode()
     except Exception as e:
@@ -30,7 +33,7 @@ def decrypt_data(encrypted_data: str) -> Optional[str]:
     """Giải mã dữ liệu."""
     try:
         key = get_key()
-        f = Fernet(key)
+        f = fernet.Fernet(key)
         decrypted_data = f.decrypt(encrypted_data.encode())
         return decrypted_data.decode()
     except Exception as e:
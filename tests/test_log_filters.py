@@ -0,0 +1,38 @@
+import logging
+
+from log_filters import HTMLErrorFilter, MAX_MESSAGE_LENGTH
+
+
+def _record(msg, *args):
+    return logging.LogRecord('telegram.ext.Updater', logging.ERROR, __file__, 0, msg, args, None)
+
+
+def test_long_templated_message_is_formatted_before_truncation():
+    record = _record('x' * 210 + ' failed for %s', 'chat')
+    assert HTMLErrorFilter().filter(record)
+    assert record.args is None
+    assert record.getMessage() == 'x' * MAX_MESSAGE_LENGTH + '... (truncated)'
+
+
+def test_html_in_args_is_summarized():
+    record = _record('Jenkins API error: %s', '<html><head><title>Error 401 Unauthorized</title></head></html>')
+    HTMLErrorFilter().filter(record)
+    assert record.getMessage() == 'HTML Error: Error 401 Unauthorized'
+
+
+def test_short_templated_message_is_unchanged():
+    record = _record('Build %s of %s finished', 42, 'MegaRamps')
+    HTMLErrorFilter().filter(record)
+    assert record.getMessage() == 'Build 42 of MegaRamps finished'
+
+
+def test_long_templated_message_survives_queue_handler():
+    import logging_setup
+    import queue
+
+    handler = logging_setup.ContextQueueHandler(queue.SimpleQueue())
+    handler.addFilter(HTMLErrorFilter())
+    record = _record('x' * 210 + ' failed for %s', 'chat')
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    assert queued.getMessage().endswith('... (truncated)')
@@ -1,10 +1,12 @@
 # webhook package
 import logging
 from log_filters import add_html_filter_to_logger
-from .server import webhook_handler
+from .server import webhook_handler, metrics_handler, healthz_handler, readyz_handler
 
 # Áp dụng bộ lọc HTML cho tất cả các logger trong module webhook
 add_html_filter_to_logger('webhook')
 add_html_filter_to_logger('webhook.server')
+add_html_filter_to_logger('webhook.fanout')
+add_html_filter_to_logger('webhook.artifacts')
 
-__all__ = ['webhook_handler']
+__all__ = ['webhook_handler', 'metrics_handler', 'healthz_handler', 'readyz_handler']
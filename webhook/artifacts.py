@@ -0,0 +1,205 @@
+# webhook/artifacts.py
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import posixpath
+from typing import Any, AsyncIterator, BinaryIO, Dict, Optional, Tuple
+from urllib.parse import quote, urljoin
+
+import aiohttp
+from telegram import Message
+from telegram.error import RetryAfter
+
+import config
+import metrics
+from log_filters import add_html_filter_to_logger
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+# Kích thước mỗi lần đọc artifact từ Jenkins và chuyển tiếp sang Telegram
+ARTIFACT_CHUNK_SIZE = getattr(config, 'ARTIFACT_CHUNK_SIZE', 256 * 1024)
+# Số lần tải tiếp (Range) khi kết nối tới Jenkins bị ngắt giữa chừng
+ARTIFACT_RESUME_ATTEMPTS = getattr(config, 'ARTIFACT_RESUME_ATTEMPTS', 3)
+# Thời gian tối đa không nhận được dữ liệu từ Jenkins trước khi coi là mất kết nối (giây)
+ARTIFACT_READ_TIMEOUT = getattr(config, 'ARTIFACT_READ_TIMEOUT', 60)
+# Kiểm tra file build với build_manifest.json (kích thước, SHA-256) trước khi gửi
+ARTIFACT_VERIFY = getattr(config, 'ARTIFACT_VERIFY', True)
+# File lớn hơn ngưỡng này được băm qua mmap thay vì đọc từng khối vào bộ nhớ
+ARTIFACT_MMAP_THRESHOLD = getattr(config, 'ARTIFACT_MMAP_THRESHOLD', 8 * 1024 * 1024)
+UPLOAD_TIMEOUT = 600
+# Mỗi lần update() băm tối đa chừng này byte của mmap (hashlib nhả GIL khi băm)
+_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class ArtifactDownloadError(Exception):
+    """Không tải được artifact từ Jenkins (kể cả sau khi đã thử tải tiếp)."""
+
+
+class ArtifactMismatchError(Exception):
+    """File build không khớp kích thước/SHA-256 trong build_manifest.json."""
+
+
+async def fetch_manifest(session: aiohttp.ClientSession, jenkins_url: str, job_url_path: str) -> Optional[Dict[str, Any]]:
+    """Đọc build_manifest.json trong workspace của job (do build.sh ghi); None nếu không có."""
+    url = urljoin(jenkins_url, f"{job_url_path}/ws/build_manifest.json")
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+            if response.status != 200:
+                logger.info(f"No build manifest at {url}. Status: {response.status}")
+                return None
+            manifest = await response.json(content_type=None)
+    except Exception as e:
+        logger.warning(f"Could not read build manifest from {url}: {e}")
+        return None
+    if not isinstance(manifest, dict) or not manifest.get('sha256') or manifest.get('size') is None:
+        logger.warning(f"Ignoring incomplete build manifest at {url}")
+        return None
+    return manifest
+
+
+def _sha256_fileobj_sync(f: BinaryIO) -> Tuple[int, str]:
+    """
+    Băm file đã mở (từ đầu file); file lớn được map vào bộ nhớ (mmap) trên cùng fd để không
+    phải copy qua buffer Python. Sau khi băm, vị trí đọc được đưa về đầu file.
+    """
+    digest = hashlib.sha256()
+    size = os.fstat(f.fileno()).st_size
+    if size >= ARTIFACT_MMAP_THRESHOLD:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, _HASH_BLOCK_SIZE):
+                    digest.update(view[offset:offset + _HASH_BLOCK_SIZE])
+            finally:
+                view.release()
+    else:
+        f.seek(0)
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    f.seek(0)
+    return size, digest.hexdigest()
+
+
+async def sha256_fileobj(f: BinaryIO) -> Tuple[int, str]:
+    """
+    (kích thước, SHA-256 hex) của file đã mở, tính trong thread riêng để không chặn event loop.
+
+    Dùng cùng file object để băm rồi upload, nên file được gửi đúng là file đã được kiểm tra
+    (kể cả khi đường dẫn bị build khác thay thế giữa chừng).
+    """
+    return await asyncio.to_thread(_sha256_fileobj_sync, f)
+
+
+def manifest_mismatch(manifest: Dict[str, Any], size: int, sha256: str) -> Optional[str]:
+    """Lý do file không khớp manifest, hoặc None nếu khớp."""
+    if size != int(manifest['size']):
+        return f"size is {size} bytes, the manifest says {manifest['size']}"
+    if sha256.lower() != str(manifest['sha256']).lower():
+        return f"SHA-256 is {sha256}, the manifest says {manifest['sha256']}"
+    return None
+
+
+async def find_archived_artifact(session: aiohttp.ClientSession, jenkins_url: str, job_url_path: str,
+                                 build_number: int, file_name: str) -> Optional[Dict[str, object]]:
+    """
+    Tìm artifact đã archive của build có tên file `file_name`.
+
+    Trả về {'url', 'relative_path'}, hoặc None nếu build không archive file đó.
+    """
+    build_url = urljoin(jenkins_url, f"{job_url_path}/{build_number}/")
+    api_url = urljoin(build_url, "api/json?tree=artifacts[fileName,relativePath]")
+    try:
+        async with session.get(api_url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+            if response.status != 200:
+                logger.warning(f"Could not list artifacts of {job_url_path} #{build_number}. Status: {response.status}")
+                return None
+            artifacts = (await response.json()).get('artifacts', [])
+    except Exception as e:
+        logger.error(f"Could not list artifacts of {job_url_path} #{build_number}: {e}")
+        return None
+
+    artifact = next((artifact for artifact in artifacts if artifact.get('fileName') == file_name), None)
+    if artifact is None:
+        return None
+    url = urljoin(build_url, f"artifact/{quote(artifact['relativePath'])}")
+    return {'url': url, 'relative_path': artifact['relativePath']}
+
+
+def workspace_file_url(jenkins_url: str, job_url_path: str, relative_path: str) -> str:
+    """URL tải một file trong workspace của job (đường dẫn tương đối so với $WORKSPACE)."""
+    return urljoin(jenkins_url, f"{job_url_path}/ws/{quote(relative_path.lstrip('/'))}")
+
+
+async def stream_artifact(session: aiohttp.ClientSession, url: str, progress: Dict[str, int],
+                          chunk_size: int = ARTIFACT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Đọc artifact từ Jenkins theo từng chunk, không ghi ra đĩa.
+
+    Khi kết nối bị ngắt giữa chừng, mở lại với 'Range: bytes=<đã đọc>-' để đọc tiếp; nếu Jenkins
+    bỏ qua Range (trả 200), phần đã gửi được bỏ qua. Số byte đã đọc được ghi vào progress['bytes'],
+    SHA-256 của các byte đã đọc được tính dần vào progress['sha256'].
+    """
+    offset = 0
+    attempt = 0
+    while True:
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            async with session.get(url, headers=headers,
+                                   timeout=aiohttp.ClientTimeout(total=None, sock_read=ARTIFACT_READ_TIMEOUT)) as response:
+                if response.status not in (200, 206):
+                    raise ArtifactDownloadError(f"Jenkins returned HTTP {response.status} for {url}")
+                skip = offset if response.status == 200 else 0
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk, skip = chunk[skip:], 0
+                    offset += len(chunk)
+                    progress['bytes'] = offset
+                    progress['sha256'].update(chunk)
+                    yield chunk
+                if skip:
+                    raise ArtifactDownloadError(f"{url} is shorter than the part already sent")
+                return
+        except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            attempt += 1
+            if attempt > ARTIFACT_RESUME_ATTEMPTS:
+                raise ArtifactDownloadError(f"Download of {url} failed after {offset} bytes: {e}") from e
+            metrics.ARTIFACT_RESUMES.inc()
+            logger.warning(f"Artifact download interrupted at {offset} bytes ({e}), resuming (attempt {attempt})")
+            await asyncio.sleep(min(2 ** attempt, 10))
+
+
+async def send_streamed_document(bot, chat_id: int, session: aiohttp.ClientSession, url: str,
+                                 filename: str, caption: Optional[str] = None) -> Tuple[Message, int, str]:
+    """
+    Gửi artifact từ Jenkins vào Telegram (sendDocument) bằng multipart upload dạng stream:
+    mỗi chunk đọc từ Jenkins được chuyển thẳng sang Bot API, không cần file tạm.
+
+    `session` là session đã xác thực với Jenkins; request tới Bot API dùng session riêng để không
+    gửi thông tin đăng nhập Jenkins đi. `caption` là MarkdownV2.
+    Trả về (tin nhắn đã gửi, số byte đã upload, SHA-256 của các byte đã upload).
+    """
+    progress = {'bytes': 0, 'sha256': hashlib.sha256()}
+    form = aiohttp.FormData()
+    form.add_field('chat_id', str(chat_id))
+    if caption:
+        form.add_field('caption', caption)
+        form.add_field('parse_mode', 'MarkdownV2')
+    form.add_field('document', stream_artifact(session, url, progress),
+                   filename=posixpath.basename(filename), content_type='application/octet-stream')
+
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=UPLOAD_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as telegram_session:
+        async with telegram_session.post(f"{bot.base_url}/sendDocument", data=form) as response:
+            result = await response.json(content_type=None)
+    if not result.get('ok'):
+        retry_after = (result.get('parameters') or {}).get('retry_after')
+        if retry_after:
+            raise RetryAfter(retry_after)
+        raise RuntimeError(f"sendDocument failed: {result.get('description', response.status)}")
+    return Message.de_json(result['result'], bot), progress['bytes'], progress['sha256'].hexdigest()
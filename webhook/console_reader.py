@@ -0,0 +1,169 @@
+# webhook/console_reader.py
+import logging
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import aiohttp
+import rendering
+from log_filters import add_html_filter_to_logger
+from webhook.log_analyzer import CHUNK_SIZE, DEFAULT_TAIL_BYTES, MAX_LINE_BYTES, iter_lines
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+
+class ConsoleState:
+    """Trạng thái đọc console của một build: offset đã đọc và các dòng cuối."""
+
+    def __init__(self, max_lines: int):
+        self.offset = 0
+        self.lines: Deque[str] = deque(maxlen=max_lines)
+        self.partial = b""
+        self.finished = False
+
+
+class ConsoleReader:
+    """
+    Đọc console Jenkins theo kiểu tăng dần qua `logText/progressiveText?start=`.
+
+    Lần đọc đầu tiên của một build chỉ tải phần cuối consoleText (Range) và lấy offset từ
+    Content-Range, không đọc progressiveText từ byte 0. Mỗi build giữ offset riêng nên các lần
+    đọc sau chỉ tải phần byte mới. Chỉ `max_lines` dòng cuối được giữ lại, vì vậy lấy K dòng
+    cuối của một build đã kết thúc không cần gọi lại Jenkins.
+    """
+
+    def __init__(self, max_lines: int = 200, max_builds: int = 64, tail_bytes: int = DEFAULT_TAIL_BYTES):
+        self.max_lines = max_lines
+        self.max_builds = max_builds
+        self.tail_bytes = tail_bytes
+        self._states: "OrderedDict[Tuple[str, str, int], ConsoleState]" = OrderedDict()
+
+    def _get_state(self, key: Tuple[str, str, int]) -> ConsoleState:
+        state = self._states.get(key)
+        if state is None:
+            state = ConsoleState(self.max_lines)
+            self._states[key] = state
+            # Loại bỏ build ít được truy cập nhất khi vượt quá giới hạn
+            while len(self._states) > self.max_builds:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+        return state
+
+    @staticmethod
+    def progressive_text_url(jenkins_url: str, job_path: str, build_number: int, start: int) -> str:
+        return urljoin(jenkins_url, f"{rendering.job_url_path(job_path)}/{build_number}/logText/progressiveText?start={start}")
+
+    @staticmethod
+    def console_text_url(jenkins_url: str, job_path: str, build_number: int) -> str:
+        return urljoin(jenkins_url, f"{rendering.job_url_path(job_path)}/{build_number}/consoleText")
+
+    async def _seed(self, session: aiohttp.ClientSession, state: ConsoleState, jenkins_url: str, job_path: str,
+                    build_number: int, on_line: Optional[Callable[[str], None]], timeout: int) -> None:
+        """
+        Đọc phần cuối consoleText (Range) cho build chưa từng đọc và đặt offset bằng tổng kích thước
+        trong Content-Range. consoleText đã bỏ các console note nên không dài hơn log gốc mà
+        progressiveText dùng: offset này có thể làm đọc lại vài dòng, nhưng không bỏ sót dòng nào.
+        Nếu Jenkins không hỗ trợ Range, offset giữ nguyên 0.
+        """
+        url = self.console_text_url(jenkins_url, job_path, build_number)
+        async with session.get(url, headers={"Range": f"bytes=-{self.tail_bytes}"},
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            content_range = response.headers.get("Content-Range", "")
+            total = content_range.rpartition("/")[2]
+            if response.status != 206 or not total.isdigit():
+                logger.debug(f"No ranged console for {job_path} #{build_number} (status {response.status}), reading from the start")
+                return
+            # Dòng đầu của Range thường bị cắt giữa chừng (trừ khi Range bắt đầu từ byte 0)
+            async for line in iter_lines(response, skip_first=not content_range.startswith("bytes 0-")):
+                self._append_line(state, line.rstrip("\r"), on_line)
+            state.offset = int(total)
+
+    def _push_line(self, state: ConsoleState, raw_line: bytes, on_line: Optional[Callable[[str], None]]) -> None:
+        self._append_line(state, raw_line[:MAX_LINE_BYTES].decode("utf-8", errors="replace").rstrip("\r"), on_line)
+
+    @staticmethod
+    def _append_line(state: ConsoleState, line: str, on_line: Optional[Callable[[str], None]]) -> None:
+        state.lines.append(line)
+        if on_line:
+            on_line(line)
+
+    async def poll(self, session: aiohttp.ClientSession, jenkins_url: str, job_path: str, build_number: int,
+                   on_line: Optional[Callable[[str], None]] = None, timeout: int = 60) -> int:
+        """
+        Tải phần console mới kể từ lần đọc trước. Mỗi dòng mới được đưa vào `on_line` (nếu có).
+        Trả về số byte mới đọc được.
+        """
+        key = (jenkins_url, job_path, build_number)
+        state = self._get_state(key)
+        if state.finished:
+            return 0
+
+        if state.offset == 0 and not state.lines:
+            try:
+                await self._seed(session, state, jenkins_url, job_path, build_number, on_line, timeout)
+            except Exception as e:
+                logger.warning(f"Could not read the console tail of {job_path} #{build_number}: {e}")
+
+        url = self.progressive_text_url(jenkins_url, job_path, build_number, state.offset)
+        received = 0
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status != 200:
+                    logger.warning(f"Could not fetch progressive console {url}. Status: {response.status}")
+                    return 0
+
+                start = state.offset
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    received += len(chunk)
+                    buffer = state.partial + chunk
+                    *lines, partial = buffer.split(b"\n")
+                    # Ghi nhận offset trước khi đưa dòng ra ngoài: nếu stream lỗi giữa chừng,
+                    # lần đọc sau bắt đầu sau các dòng này thay vì trả lại chúng lần nữa
+                    state.offset = start + received
+                    state.partial = partial[-MAX_LINE_BYTES:]
+                    for raw_line in lines:
+                        self._push_line(state, raw_line, on_line)
+
+                # X-Text-Size là offset cho lần đọc tiếp theo; X-More-Data cho biết build còn chạy
+                text_size = response.headers.get("X-Text-Size")
+                if text_size and text_size.isdigit():
+                    state.offset = int(text_size)
+                if response.headers.get("X-More-Data", "").lower() != "true":
+                    state.finished = True
+                    if state.partial:
+                        self._push_line(state, state.partial, on_line)
+                        state.partial = b""
+        except Exception as e:
+            logger.error(f"Error reading progressive console for {job_path} #{build_number}: {e}")
+        return received
+
+    async def tail(self, session: aiohttp.ClientSession, jenkins_url: str, job_path: str, build_number: int,
+                   lines: int = 50) -> List[str]:
+        """Trả về `lines` dòng cuối của console, chỉ tải phần mới nếu build chưa kết thúc."""
+        await self.poll(session, jenkins_url, job_path, build_number)
+        state = self._states.get((jenkins_url, job_path, build_number))
+        if not state:
+            return []
+        return list(state.lines)[-lines:]
+
+    def cached_lines(self, jenkins_url: str, job_path: str, build_number: int) -> List[str]:
+        """Trả về các dòng cuối đã đọc trước đó mà không gọi Jenkins."""
+        state = self._states.get((jenkins_url, job_path, build_number))
+        return list(state.lines) if state else []
+
+    def is_finished(self, jenkins_url: str, job_path: str, build_number: int) -> bool:
+        state = self._states.get((jenkins_url, job_path, build_number))
+        return bool(state and state.finished)
+
+    def forget(self, jenkins_url: str, job_path: str, build_number: int) -> None:
+        """Xóa trạng thái đọc của một build."""
+        self._states.pop((jenkins_url, job_path, build_number), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'tracked_builds': len(self._states)}
+
+
+# Instance dùng chung cho toàn bộ ứng dụng
+console_reader = ConsoleReader()
@@ -0,0 +1,92 @@
+# webhook/fanout.py
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from telegram.error import RetryAfter
+
+import config
+import database
+import metrics
+from log_filters import add_html_filter_to_logger
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+# Số lệnh gọi Bot API chạy đồng thời tối đa khi gửi thông báo build đến nhiều nhóm
+NOTIFY_CONCURRENCY = getattr(config, 'NOTIFY_CONCURRENCY', 5)
+# Số lần thử lại khi Telegram từ chối vì gửi quá nhanh (flood control, lỗi 429)
+NOTIFY_MAX_RETRIES = getattr(config, 'NOTIFY_MAX_RETRIES', 3)
+
+# Dùng chung cho mọi thông báo đang xử lý để tổng số lệnh gọi đồng thời luôn bị giới hạn.
+# Tạo khi dùng lần đầu để gắn với event loop đang chạy.
+_semaphore: Optional[asyncio.Semaphore] = None
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+    return _semaphore
+
+def notification_recipients(group_id: int, job_name: str, extra_group_ids: Iterable[int] = ()) -> List[int]:
+    """
+    Nhóm yêu cầu build đứng đầu, tiếp theo là `extra_group_ids` (nhóm của những người được gộp
+    vào build) và các nhóm đã đăng ký job, không trùng lặp.
+    """
+    recipients = [group_id]
+    subscribed = [subscriber_id for subscriber_id, _ in database.get_groups_by_job_path(job_name)]
+    for chat_id in [*extra_group_ids, *subscribed]:
+        if chat_id not in recipients:
+            recipients.append(chat_id)
+    return recipients
+
+def _retry_delay(error: RetryAfter) -> float:
+    # retry_after là số giây (int) hoặc timedelta tùy phiên bản python-telegram-bot
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+async def call_with_retry(send: Callable[[int], Awaitable[Any]], chat_id: int) -> Any:
+    """Gọi `send(chat_id)` dưới giới hạn đồng thời, chờ rồi thử lại khi bị flood control."""
+    for attempt in range(NOTIFY_MAX_RETRIES + 1):
+        async with _get_semaphore():
+            try:
+                return await send(chat_id)
+            except RetryAfter as e:
+                if attempt == NOTIFY_MAX_RETRIES:
+                    raise
+                delay = _retry_delay(e)
+        # Chờ ngoài semaphore để các nhóm khác vẫn được gửi trong lúc này
+        metrics.NOTIFICATION_DELIVERIES.inc(result='retry')
+        logger.warning(f"Flood control for chat {chat_id}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+async def send_to_all(chat_ids: Iterable[int], send: Callable[[int], Awaitable[Any]]) -> Dict[int, Any]:
+    """
+    Gọi `send(chat_id)` cho tất cả các nhóm đồng thời; lỗi ở một nhóm không ảnh hưởng các nhóm khác.
+
+    Trả về {chat_id: kết quả} của các lần gửi thành công, theo thứ tự của `chat_ids`.
+    """
+    async def deliver(chat_id: int):
+        try:
+            result = await call_with_retry(send, chat_id)
+        except Exception as e:
+            metrics.NOTIFICATION_DELIVERIES.inc(result='error')
+            logger.warning(f"Could not deliver build notification to chat {chat_id}: {e}")
+            return chat_id, None
+        metrics.NOTIFICATION_DELIVERIES.inc(result='sent')
+        return chat_id, result
+
+    results = await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids))
+    return {chat_id: result for chat_id, result in results if result is not None}
+
+async def edit_all(bot, messages: Dict[int, Any], text: str, **kwargs) -> Dict[int, Any]:
+    """Sửa nội dung các tin nhắn thông báo đã gửi ({chat_id: Message}) thành `text`."""
+    return await send_to_all(
+        list(messages),
+        lambda chat_id: bot.edit_message_text(
+            text=text, chat_id=chat_id, message_id=messages[chat_id].message_id, **kwargs
+        ),
+    )
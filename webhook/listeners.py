@@ -0,0 +1,84 @@
+# webhook/listeners.py
+import logging
+import os
+import ssl
+import stat
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+import config
+from log_filters import add_html_filter_to_logger
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+# Mặc định giữ hành vi cũ: chỉ lắng nghe trên localhost:8088
+DEFAULT_LISTENERS = [{'host': 'localhost', 'port': 8088}]
+
+# Giới hạn của aiohttp cho webhook server
+CLIENT_MAX_SIZE = getattr(config, 'WEBHOOK_CLIENT_MAX_SIZE', 1024 ** 2)
+KEEPALIVE_TIMEOUT = getattr(config, 'WEBHOOK_KEEPALIVE_TIMEOUT', 75.0)
+DEFAULT_BACKLOG = getattr(config, 'WEBHOOK_BACKLOG', 128)
+
+_KNOWN_KEYS = {'host', 'port', 'path', 'ssl_cert', 'ssl_key', 'reuse_port', 'reuse_address', 'backlog'}
+
+
+def get_listener_configs() -> List[Dict[str, Any]]:
+    """Đọc WEBHOOK_LISTENERS từ config và kiểm tra các khóa hợp lệ."""
+    listeners = getattr(config, 'WEBHOOK_LISTENERS', None) or DEFAULT_LISTENERS
+    for listener in listeners:
+        unknown = set(listener) - _KNOWN_KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys in WEBHOOK_LISTENERS entry {listener}: {sorted(unknown)}")
+        if 'path' not in listener and 'port' not in listener:
+            raise ValueError(f"WEBHOOK_LISTENERS entry needs either 'port' or 'path': {listener}")
+        if bool(listener.get('ssl_cert')) != bool(listener.get('ssl_key')):
+            raise ValueError(f"WEBHOOK_LISTENERS entry needs both 'ssl_cert' and 'ssl_key': {listener}")
+    return listeners
+
+
+def _ssl_context(listener: Dict[str, Any]) -> Optional[ssl.SSLContext]:
+    if not listener.get('ssl_cert'):
+        return None
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(listener['ssl_cert'], listener['ssl_key'])
+    return context
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Xóa file socket còn sót lại từ lần chạy trước (nếu không, bind sẽ lỗi 'Address already in use')."""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def create_sites(runner: web.AppRunner, listeners: List[Dict[str, Any]]) -> List[web.BaseSite]:
+    """Tạo các site (TCP hoặc Unix socket) cho runner theo cấu hình."""
+    sites = []
+    for listener in listeners:
+        ssl_context = _ssl_context(listener)
+        backlog = listener.get('backlog', DEFAULT_BACKLOG)
+        if 'path' in listener:
+            _remove_stale_socket(listener['path'])
+            site = web.UnixSite(runner, listener['path'], ssl_context=ssl_context, backlog=backlog)
+        else:
+            site = web.TCPSite(
+                runner,
+                listener.get('host'),
+                listener['port'],
+                ssl_context=ssl_context,
+                backlog=backlog,
+                reuse_address=listener.get('reuse_address'),
+                reuse_port=listener.get('reuse_port'),
+            )
+        sites.append(site)
+    return sites
+
+
+async def start_sites(sites: List[web.BaseSite]) -> None:
+    for site in sites:
+        await site.start()
+        logger.info(f"👂 Webhook is listening on {site.name}/webhook")
@@ -0,0 +1,109 @@
+# webhook/log_analyzer.py
+import logging
+import re
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import aiohttp
+from log_filters import add_html_filter_to_logger
+
+logger = logging.getLogger(__name__)
+add_html_filter_to_logger(__name__)
+
+# Các mẫu lỗi thường gặp trong console Jenkins, log Unity (BuildScript.cs), Gradle và Xcode
+ERROR_PATTERNS = [
+    re.compile(r'error CS\d{4}'),                                   # Lỗi biên dịch C#
+    re.compile(r'Scripts have compiler errors'),
+    re.compile(r'Error building Player'),
+    re.compile(r'Build completed with a result of \'Failed\''),
+    re.compile(r'BuildFailedException|BuildMethodException'),
+    re.compile(r'build failed', re.IGNORECASE),                     # "❌ Android APK build failed: ..." từ BuildScript.cs
+    re.compile(r'^\s*(?:[\w.]+\.)?\w*Exception: '),                 # System.Exception: ..., NullReferenceException: ...
+    re.compile(r'^\s*(?:❌\s*)?ERROR:'),                            # Lỗi từ build.sh
+    re.compile(r'What went wrong'),                                 # Gradle
+    re.compile(r'\*\* (?:ARCHIVE|EXPORT|BUILD) FAILED \*\*'),       # xcodebuild
+]
+
+# Kích thước mỗi lần đọc từ HTTP stream
+CHUNK_SIZE = 64 * 1024
+# Độ dài tối đa của một dòng được giữ lại (tránh dòng không có ký tự xuống dòng làm đầy bộ nhớ)
+MAX_LINE_BYTES = 4096
+# Mặc định chỉ đọc phần cuối của log, nơi thường chứa lỗi
+DEFAULT_TAIL_BYTES = 2 * 1024 * 1024
+# Giới hạn số byte quét khi server không hỗ trợ Range
+MAX_SCAN_BYTES = 64 * 1024 * 1024
+
+
+class LogScanner:
+    """Quét từng dòng log và giữ lại tối đa `max_lines` dòng lỗi khác nhau gần nhất."""
+
+    def __init__(self, max_lines: int = 10, max_line_length: int = 200):
+        self.max_lines = max_lines
+        self.max_line_length = max_line_length
+        self._matches: "OrderedDict[str, None]" = OrderedDict()
+
+    def feed(self, line: str) -> None:
+        """Kiểm tra một dòng log với các mẫu lỗi."""
+        if not any(pattern.search(line) for pattern in ERROR_PATTERNS):
+            return
+        line = line.strip()
+        if len(line) > self.max_line_length:
+            line = line[:self.max_line_length] + "..."
+        if line in self._matches:
+            return
+        self._matches[line] = None
+        if len(self._matches) > self.max_lines:
+            self._matches.popitem(last=False)
+
+    def feed_lines(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.feed(line)
+
+    def results(self) -> List[str]:
+        return list(self._matches)
+
+
+async def iter_lines(response: aiohttp.ClientResponse, max_bytes: int = MAX_SCAN_BYTES, skip_first: bool = False):
+    """Đọc response theo từng chunk và trả về từng dòng mà không tải toàn bộ nội dung vào bộ nhớ."""
+    buffer = b""
+    total = 0
+    first = skip_first
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        total += len(chunk)
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw_line in lines:
+            if first:
+                # Dòng đầu tiên của một Range thường bị cắt giữa chừng
+                first = False
+                continue
+            yield raw_line[:MAX_LINE_BYTES].decode("utf-8", errors="replace")
+        if len(buffer) > MAX_LINE_BYTES:
+            buffer = buffer[-MAX_LINE_BYTES:]
+        if total >= max_bytes:
+            logger.info(f"Stopped scanning {response.url} after {total} bytes")
+            return
+    if buffer and not first:
+        yield buffer.decode("utf-8", errors="replace")
+
+
+async def scan_log_url(session: aiohttp.ClientSession, url: str, scanner: LogScanner,
+                       tail_bytes: Optional[int] = DEFAULT_TAIL_BYTES, timeout: int = 60) -> bool:
+    """
+    Tải log qua HTTP (chỉ phần cuối nếu server hỗ trợ Range) và đưa từng dòng vào scanner.
+    Trả về True nếu đọc được log.
+    """
+    headers = {"Range": f"bytes=-{tail_bytes}"} if tail_bytes else {}
+    try:
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status not in (200, 206):
+                logger.warning(f"Could not fetch log {url}. Status: {response.status}")
+                return False
+            # Bỏ dòng đầu nếu Range không bắt đầu từ byte 0
+            partial = response.status == 206 and not response.headers.get("Content-Range", "").startswith("bytes 0-")
+            async for line in iter_lines(response, skip_first=partial):
+                scanner.feed(line)
+            return True
+    except Exception as e:
+        logger.error(f"Error scanning log {url}: {e}")
+        return False
@@ -1,30 +1,92 @@
 # webhook/server.py
+import asyncio
 import logging
 from aiohttp import web
 import os
+import time
 import aiohttp
+from datetime import datetime
+from typing import Any, Dict, Set, Tuple
 from urllib.parse import urljoin
 from log_filters import add_html_filter_to_logger
 
+import config
 import database
 import security
+import rendering
+import metrics
+import profiling
+import build_trigger
+import queue_tracker
+from webhook.log_analyzer import LogScanner, scan_log_url
+from webhook.console_reader import console_reader
+from webhook import fanout, artifacts
+from callback_store import make_callback_data
 from telegram.constants import ParseMode
 from telegram import InputFile, InlineKeyboardButton, InlineKeyboardMarkup
 
 logger = logging.getLogger(__name__)
 add_html_filter_to_logger(__name__)
 
-def escape_markdown_v2(text: str) -> str:
-    """Escapes special characters for Telegram's MarkdownV2 parse mode."""
-    if not isinstance(text, str):
-        text = str(text)
-    escape_chars = r'_*[]()~`>#+-=|{}.!'
-    return "".join(f"\\{char}" if char in escape_chars else char for char in text)
+# Các tác vụ nền xử lý thông báo build đang chạy, kèm tham số để có thể lưu lại khi tắt bot
+_background_tasks: Dict[asyncio.Task, Dict[str, Any]] = {}
+# Khi đang tắt, webhook mới bị từ chối (503) để Jenkins/load balancer gửi lại sau
+_draining = False
+
+def pending_notification_count() -> int:
+    """Số thông báo build đang được xử lý nền."""
+    return len(_background_tasks)
+
+def is_draining() -> bool:
+    return _draining
+
+def start_draining() -> None:
+    """Ngừng nhận webhook mới (bước đầu tiên khi tắt bot)."""
+    global _draining
+    _draining = True
+
+def schedule_notification(app, notification: Dict[str, Any]) -> asyncio.Task:
+    """Chạy process_build_notification trong nền và theo dõi tác vụ cho đến khi xong."""
+    task = app.create_task(process_build_notification(bot=app.bot, **notification))
+    _background_tasks[task] = notification
+    task.add_done_callback(lambda t: _background_tasks.pop(t, None))
+    return task
+
+async def drain_notifications(timeout: float) -> int:
+    """
+    Chờ các thông báo đang xử lý (kể cả upload) tối đa `timeout` giây.
+
+    Các tác vụ chưa xong sau thời hạn được lưu vào database rồi hủy, để xử lý lại ở lần
+    khởi động sau. Trả về số thông báo đã được lưu lại.
+    """
+    if _background_tasks:
+        logger.info(f"Waiting up to {timeout}s for {len(_background_tasks)} in-flight build notifications")
+        await asyncio.wait(list(_background_tasks), timeout=timeout)
+
+    unfinished = dict(_background_tasks)
+    for task, notification in unfinished.items():
+        database.save_pending_notification(**notification)
+        task.cancel()
+    if unfinished:
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        logger.warning(f"Persisted {len(unfinished)} unfinished build notifications for the next start")
+    return len(unfinished)
+
+def replay_pending_notifications(app) -> int:
+    """Xử lý lại các thông báo đã được lưu khi bot tắt lần trước."""
+    notifications = database.pop_pending_notifications()
+    for notification in notifications:
+        schedule_notification(app, notification)
+    if notifications:
+        logger.info(f"Replaying {len(notifications)} build notifications persisted at last shutdown")
+    return len(notifications)
 
 async def webhook_handler(request: web.Request) -> web.Response:
     """Xử lý các request đến từ webhook của Jenkins."""
     app = request.app['bot_instance']['app']
-    bot = app.bot
+    if _draining:
+        metrics.WEBHOOK_REQUESTS.inc(result='draining')
+        return web.Response(text="Shutting down, please retry later.", status=503, headers={'Retry-After': '30'})
     try:
         data = request.query
         job_name = data.get('job_name')
@@ -35,33 +97,129 @@ async def webhook_handler(request: web.Request) -> web.Response:
 
         if not all([job_name, build_number_str, status]):
             logger.warning(f"Webhook received with missing data: {data}")
+            metrics.WEBHOOK_REQUESTS.inc(result='missing_data')
             return web.Response(text="Missing data", status=400)
         
         # Chạy tác vụ nền để không block Jenkins
-        app.create_task(
-            process_build_notification(
-                bot=bot,
-                job_name=job_name,
-                build_number_str=build_number_str,
-                status=status,
-                build_target=build_target,
-                build_request_id=build_request_id
-            )
-        )
+        schedule_notification(app, {
+            'job_name': job_name,
+            'build_number_str': build_number_str,
+            'status': status,
+            'build_target': build_target,
+            'build_request_id': build_request_id,
+        })
         
+        metrics.WEBHOOK_REQUESTS.inc(result='accepted')
         return web.Response(text="OK, job is being processed.", status=200)
 
     except Exception as e:
         logger.error(f"Error processing webhook initial request: {e}", exc_info=True)
+        metrics.WEBHOOK_REQUESTS.inc(result='error')
         return web.Response(text=f"Internal Server Error: {str(e)}", status=500)
 
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Xuất các metric theo định dạng text của Prometheus."""
+    return web.Response(body=metrics.REGISTRY.render().encode('utf-8'), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+async def healthz_handler(request: web.Request) -> web.Response:
+    """Liveness: event loop còn chạy và không bị chặn quá lâu. Không gọi dịch vụ bên ngoài."""
+    status = request.app['health'].liveness()
+    return web.json_response(status, status=200 if status['ok'] else 503)
+
+async def readyz_handler(request: web.Request) -> web.Response:
+    """Readiness: thêm kiểm tra SQLite và Bot API (kết quả được cache để probe luôn rẻ)."""
+    status = await request.app['health'].readiness()
+    if _draining:
+        status['ok'] = False
+        status['draining'] = True
+    return web.json_response(status, status=200 if status['ok'] else 503)
+
+# Số dòng lỗi tối đa được đính kèm vào tin nhắn build thất bại
+FAILURE_EXCERPT_LINES = getattr(config, 'FAILURE_EXCERPT_LINES', 10)
+
+async def _collect_failure_excerpt(creds, jenkins_url, job_name, build_number, build_target):
+    """
+    Quét phần cuối log Unity và console Jenkins để lấy các dòng lỗi tiêu biểu.
+
+    Mỗi log có scanner riêng để dòng của console không đẩy mất các dòng lỗi Unity (chi tiết hơn):
+    console được giữ tối đa một nửa số dòng (hoặc nhiều hơn nếu log Unity không dùng hết phần
+    của nó), phần còn lại dành cho log Unity.
+    """
+    unity_scanner = LogScanner(max_lines=FAILURE_EXCERPT_LINES)
+    console_scanner = LogScanner(max_lines=FAILURE_EXCERPT_LINES)
+    job_url_path = rendering.job_url_path(job_name)
+    auth = aiohttp.BasicAuth(creds['jenkins_userid'], creds['jenkins_token'])
+    async with aiohttp.ClientSession(auth=auth) as session:
+        if build_target:
+            unity_log_url = urljoin(jenkins_url, f"{job_url_path}/ws/unity_build_{build_target}.log")
+            await scan_log_url(session, unity_log_url, unity_scanner)
+        # Console được đọc qua ConsoleReader: các dòng đã đọc trước đó (nếu có) lấy từ bộ nhớ;
+        # build chưa từng đọc chỉ tải phần cuối consoleText, sau đó chỉ phần byte mới
+        console_scanner.feed_lines(console_reader.cached_lines(jenkins_url, job_name, build_number))
+        await console_reader.poll(session, jenkins_url, job_name, build_number, on_line=console_scanner.feed)
+
+    unity_lines = unity_scanner.results()
+    console_lines = [line for line in console_scanner.results() if line not in unity_lines]
+    console_quota = min(len(console_lines), max(FAILURE_EXCERPT_LINES - len(unity_lines), FAILURE_EXCERPT_LINES // 2))
+    unity_quota = FAILURE_EXCERPT_LINES - console_quota
+    return (unity_lines[max(0, len(unity_lines) - unity_quota):]
+            + console_lines[len(console_lines) - console_quota:])
+
+def _build_duration_seconds(build_request):
+    """Tính thời gian từ lúc yêu cầu build được tạo đến khi nhận webhook (giây)."""
+    try:
+        created_at = datetime.strptime(build_request['created_at'], "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError, IndexError, KeyError):
+        return None
+    # created_at được SQLite lưu theo giờ UTC (CURRENT_TIMESTAMP)
+    duration = (datetime.utcnow() - created_at).total_seconds()
+    return duration if duration >= 0 else None
+
+# Các webhook của cùng một lô có thể đến cùng lúc: sửa tin nhắn trạng thái lần lượt
+# để bản sửa sau luôn phản ánh trạng thái mới nhất trong database
+_batch_message_lock = asyncio.Lock()
+
+async def _update_batch_message(bot, batch_id: str, refreshed: Set[Tuple[int, int]] = frozenset()) -> None:
+    """
+    Cập nhật tin nhắn trạng thái chung của lô build sau khi một target hoàn thành.
+
+    Bỏ qua nếu tin nhắn nằm trong `refreshed` (queue_tracker vừa vẽ lại nó).
+    """
+    async with _batch_message_lock:
+        tracker = queue_tracker.get_tracker()
+        batch = build_trigger.render_batch(batch_id, tracker.progress() if tracker else None)
+        if not batch or not batch['status_message_id']:
+            return
+        if (batch['telegram_group_id'], batch['status_message_id']) in refreshed:
+            return
+        try:
+            await bot.edit_message_text(
+                text=batch['text'],
+                chat_id=batch['telegram_group_id'],
+                message_id=batch['status_message_id'],
+                parse_mode=ParseMode.MARKDOWN_V2
+            )
+        except Exception as e:
+            logger.warning(f"Could not update status message of build batch {batch_id}: {e}")
+
+@profiling.timed('webhook.process_build_notification')
 async def process_build_notification(bot, job_name, build_number_str, status, build_target, build_request_id):
-    """Tác vụ chạy nền để xử lý thông báo và gửi file."""
+    """
+    Tác vụ chạy nền để xử lý thông báo và gửi file.
+
+    Tin nhắn được render một lần rồi gửi đồng thời đến nhóm yêu cầu build và mọi nhóm đã
+    đăng ký job. File build chỉ upload một lần; các nhóm còn lại nhận lại file_id của Telegram.
+    """
+    started_at = time.perf_counter()
     try:
         build_number = int(build_number_str)
-        logger.info(f"BACKGROUND TASK: Processing job={job_name}, build_number={build_number}, status={status}")
+        logger.info(
+            f"BACKGROUND TASK: Processing job={job_name}, build_number={build_number}, status={status}",
+            extra={'job': job_name, 'build': build_number, 'target': build_target, 'build_request_id': build_request_id}
+        )
 
         build_request = database.get_build_request(build_request_id) if build_request_id else None
+        matched_by_id = build_request is not None
         if not build_request:
             logger.warning(f"Build request ID {build_request_id} not found, falling back to latest.")
             build_request = database.get_latest_build_request(job_name)
@@ -73,53 +231,77 @@ async def process_build_notification(bot, job_name, build_number_str, status, bu
         group_id = build_request['telegram_group_id']
         user_id = build_request['requested_by_user_id']
         
+        # Cập nhật bảng thống kê cho /stats và /history
+        database.record_build_result(
+            job_name, build_number, status,
+            build_target=build_target,
+            duration=_build_duration_seconds(build_request) if matched_by_id else None,
+            requested_by_user_id=user_id
+        )
+        # Những người yêu cầu đã được gộp vào build này (yêu cầu trùng khi build còn trong hàng đợi)
+        subscribers = database.get_build_request_subscribers(build_request_id) if matched_by_id else []
+        if matched_by_id:
+            database.update_build_request_result(build_request_id, status, build_number)
+            # Ngừng theo dõi hàng đợi và chốt trạng thái cuối trên các tin nhắn trigger
+            tracker = queue_tracker.get_tracker()
+            refreshed = await tracker.finish(
+                build_request_id, rendering.render_queue_finished(status, build_number)
+            ) if tracker else set()
+            batch_ids = [build_request['batch_id']] + [subscriber['batch_id'] for subscriber in subscribers]
+            for batch_id in dict.fromkeys(batch_id for batch_id in batch_ids if batch_id):
+                await _update_batch_message(bot, batch_id, refreshed)
+        
         creds = database.get_user_credentials(user_id)
         if not creds:
             await bot.send_message(group_id, f"System Error: Could not find credentials for user {user_id}.")
             return
 
-        jenkins_url = creds['jenkins_url']
-        job_url_path = '/'.join([f"job/{part}" for part in job_name.split('/')])
-        
-        # Escape các biến trước khi sử dụng trong MarkdownV2
-        job_name_md = escape_markdown_v2(job_name)
-        build_target_md = escape_markdown_v2(build_target or 'Unknown')
-        status_md = escape_markdown_v2(status)
-        
-        # --- Xây dựng link và tin nhắn cho cả hai trường hợp ---
-        links_text = []
-
-        # 1. Thêm link Unity Log nếu có build_target
-        if build_target:
-            unity_log_url = urljoin(jenkins_url, f"{job_url_path}/ws/unity_build_{build_target}.log").replace(')', r'\)')
-            links_text.append(f"📜 [View Unity Build Log]({unity_log_url})")
-
-        # 2. Luôn thêm link Console Log
-        console_log_url = urljoin(jenkins_url, f"{job_url_path}/{build_number}/console").replace(')', r'\)')
-        links_text.append(f"📝 [View Console Log]({console_log_url})")
+        recipients = fanout.notification_recipients(
+            group_id, job_name, [subscriber['telegram_group_id'] for subscriber in subscribers]
+        )
+        if len(recipients) > 1:
+            logger.info(f"Fanning out build notification for {job_name} #{build_number} to {len(recipients)} groups")
 
-        links_md = chr(10).join(links_text)
+        jenkins_url = creds['jenkins_url']
+        job_url_path = rendering.job_url_path(job_name)
+        links_md = rendering.render_build_links(jenkins_url, job_name, build_number, build_target)
+        # Nút Rebuild dùng lại branch/target đã lưu của yêu cầu build (không cần hỏi lại Jenkins)
+        reply_markup = None
+        if matched_by_id and build_request['branch']:
+            reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(
+                "🔁 Rebuild", callback_data=make_callback_data('build_rebuild', build_request_id)
+            )]])
         
         if status.upper() == 'SUCCESS':
             # --- Gửi tin nhắn thành công ---
-            message_text = (
-                f"✅ *Build Succeeded\!*\n\n"
-                f"*Job:* `{job_name_md}`\n"
-                f"*Build:* `#{build_number}`\n"
-                f"*Target:* `{build_target_md}`\n\n"
-                f"{links_md}"
-            )
+            message_text = rendering.render_build_success(job_name, build_number, build_target, links_md)
             
-            sent_message = await bot.send_message(
-                group_id, 
+            sent_messages = await fanout.send_to_all(recipients, lambda chat_id: bot.send_message(
+                chat_id, 
                 message_text, 
                 parse_mode=ParseMode.MARKDOWN_V2, 
-                disable_web_page_preview=True
-            )
+                disable_web_page_preview=True,
+                reply_markup=reply_markup
+            ))
+
+            async def notify_file_problem(text, uploading=False):
+                # Báo cho mọi nhóm nhận thông báo (không chỉ nhóm đầu tiên); nếu đang upload thì
+                # gỡ trạng thái Uploading để các nhóm không chờ file mãi
+                if uploading:
+                    await fanout.edit_all(
+                        bot, sent_messages, message_text,
+                        parse_mode=ParseMode.MARKDOWN_V2,
+                        disable_web_page_preview=True,
+                        reply_markup=reply_markup
+                    )
+                await fanout.send_to_all(recipients, lambda chat_id: bot.send_message(
+                    chat_id, text, parse_mode=ParseMode.MARKDOWN_V2
+                ))
 
             # --- Gửi tệp build bằng cách đọc file cục bộ ---
             async with aiohttp.ClientSession(auth=aiohttp.BasicAuth(creds['jenkins_userid'], creds['jenkins_token'])) as session:
                 local_build_file_path = None
+                workspace_build_file = None
                 
                 # 1. Lấy đường dẫn file cục bộ từ properties trong workspace của Jenkins
                 # Phải truy cập vào workspace (ws) thay vì artifact và không có build number trong URL
@@ -131,79 +313,166 @@ async def process_build_notification(bot, job_name, build_number_str, status, bu
                             text = await response.text()
                             properties = {k.strip(): v.strip() for k, v in (line.split('=', 1) for line in text.splitlines() if '=' in line)}
                             local_build_file_path = properties.get('LATEST_BUILD_FILE')
+                            workspace_build_file = properties.get('WORKSPACE_BUILD_FILE')
                             logger.info(f"Found local build file path from properties: {local_build_file_path}")
                         else:
                             logger.warning(f"Could not fetch build_info.properties from workspace. Status: {response.status}")
                 except Exception as e:
                     logger.error(f"Could not get build file path from properties: {e}")
 
-                # 2. Nếu có đường dẫn, đọc file từ máy chủ và gửi
-                if local_build_file_path and os.path.exists(local_build_file_path):
-                    # Sửa tin nhắn đã gửi để thêm trạng thái Uploading
-                    try:
-                        uploading_message = message_text + "\n\nUploading file\\.\\.\\."
-                        await bot.edit_message_text(
-                            text=uploading_message,
-                            chat_id=group_id,
-                            message_id=sent_message.message_id,
-                            parse_mode=ParseMode.MARKDOWN_V2,
-                            disable_web_page_preview=True
-                        )
-                    except Exception as e:
-                        logger.warning(f"Could not edit message to add 'Uploading...' text: {e}")
-
-                    # Sửa tên file để chứa build_target
-                    original_file_name = os.path.basename(local_build_file_path)
-                    name, ext = os.path.splitext(original_file_name)
-                    new_file_name = f"{name}_{build_target}{ext}" if build_target else original_file_name
+                # Manifest do build.sh ghi (atomic) kèm kích thước/SHA-256 để kiểm tra file trước khi gửi
+                mismatch = None
+                manifest = await artifacts.fetch_manifest(session, jenkins_url, job_url_path) if artifacts.ARTIFACT_VERIFY else None
+                if manifest and matched_by_id and manifest.get('build_request_id') not in (None, '', build_request_id):
+                    # Workspace đã bị một build khác của job ghi đè
+                    mismatch = f"the workspace now holds the file of another build (#{manifest.get('build_number')})"
+                elif manifest:
+                    local_build_file_path = manifest.get('path') or local_build_file_path
+                    workspace_build_file = manifest.get('workspace_path') or workspace_build_file
 
-                    try:
+                # 2. Đọc file trên máy chủ nếu bot chạy cùng máy với agent, nếu không thì
+                #    stream artifact đã archive từ Jenkins thẳng vào Telegram
+                upload = None
+                file_name = os.path.basename(local_build_file_path) if local_build_file_path else None
+                if not mismatch and local_build_file_path and os.path.exists(local_build_file_path):
+                    async def upload(chat_id, filename):
+                        # File chỉ được mở một lần: băm trong thread (mmap với file lớn) từ fd này,
+                        # đối chiếu manifest rồi upload từ đầu chính fd đó
                         with open(local_build_file_path, 'rb') as f:
-                            await bot.send_document(
-                                chat_id=group_id,
+                            file_size, sha256 = await artifacts.sha256_fileobj(f)
+                            problem = artifacts.manifest_mismatch(manifest, file_size, sha256) if manifest else None
+                            if problem:
+                                raise artifacts.ArtifactMismatchError(problem)
+                            caption = rendering.render_artifact_caption(file_size, sha256)
+                            document_message = await bot.send_document(
+                                chat_id=chat_id,
                                 document=f,
-                                filename=new_file_name,
+                                filename=filename,
+                                caption=caption,
+                                parse_mode=ParseMode.MARKDOWN_V2,
                                 read_timeout=600,
                                 write_timeout=600,
                                 connect_timeout=30
                             )
-                        logger.info(f"Successfully sent file from local path: {local_build_file_path}")
+                        return document_message, file_size, caption
+                    source = local_build_file_path
+                elif not mismatch and local_build_file_path:
+                    # Ưu tiên artifact đã archive của đúng build này, sau đó mới đến file trong workspace
+                    artifact = await artifacts.find_archived_artifact(session, jenkins_url, job_url_path, build_number, file_name)
+                    if artifact is not None:
+                        source = artifact['url']
+                    elif workspace_build_file:
+                        source = artifacts.workspace_file_url(jenkins_url, job_url_path, workspace_build_file)
+                    if artifact is not None or workspace_build_file:
+                        async def upload(chat_id, filename):
+                            # Với stream, SHA-256 được tính trong lúc upload và đối chiếu sau khi gửi xong
+                            caption = rendering.render_artifact_caption(manifest['size'], manifest['sha256']) if manifest else None
+                            document_message, file_size, sha256 = await artifacts.send_streamed_document(
+                                bot, chat_id, session, source, filename, caption=caption
+                            )
+                            problem = artifacts.manifest_mismatch(manifest, file_size, sha256) if manifest else None
+                            if problem:
+                                await bot.delete_message(chat_id, document_message.message_id)
+                                raise artifacts.ArtifactMismatchError(problem)
+                            if caption is None:
+                                caption = rendering.render_artifact_caption(file_size, sha256)
+                                await bot.edit_message_caption(
+                                    chat_id=chat_id, message_id=document_message.message_id,
+                                    caption=caption, parse_mode=ParseMode.MARKDOWN_V2
+                                )
+                            return document_message, file_size, caption
+
+                if upload is not None:
+                    # Sửa các tin nhắn đã gửi để thêm trạng thái Uploading
+                    await fanout.edit_all(
+                        bot, sent_messages, message_text + rendering.UPLOADING_SUFFIX,
+                        parse_mode=ParseMode.MARKDOWN_V2,
+                        disable_web_page_preview=True,
+                        reply_markup=reply_markup
+                    )
+
+                    # Sửa tên file để chứa build_target
+                    name, ext = os.path.splitext(file_name)
+                    new_file_name = f"{name}_{build_target}{ext}" if build_target else file_name
+
+                    # Upload vào nhóm đầu tiên đã nhận được tin nhắn (ưu tiên nhóm yêu cầu build)
+                    upload_chat_id = next(iter(sent_messages), group_id)
+                    upload_started_at = time.perf_counter()
+                    try:
+                        document_message, file_size, caption = await upload(upload_chat_id, new_file_name)
+                        metrics.UPLOAD_BYTES.inc(file_size)
+                        metrics.UPLOAD_SECONDS.observe(time.perf_counter() - upload_started_at, result='success')
+                        logger.info(
+                            f"Successfully sent build file from {source}",
+                            extra={'job': job_name, 'build': build_number, 'chat_id': upload_chat_id}
+                        )
+                        # Các nhóm còn lại nhận file qua file_id, không phải upload lại
+                        other_chat_ids = [chat_id for chat_id in recipients if chat_id != upload_chat_id]
+                        if other_chat_ids and document_message.document:
+                            file_id = document_message.document.file_id
+                            await fanout.send_to_all(
+                                other_chat_ids, lambda chat_id: bot.send_document(
+                                    chat_id=chat_id, document=file_id, caption=caption, parse_mode=ParseMode.MARKDOWN_V2
+                                )
+                            )
+                    except artifacts.ArtifactMismatchError as e:
+                        metrics.UPLOAD_SECONDS.observe(time.perf_counter() - upload_started_at, result='error')
+                        logger.error(
+                            f"Build file {source} for job {job_name} build {build_number} does not match its manifest: {e}",
+                            extra={'job': job_name, 'build': build_number, 'chat_id': upload_chat_id}
+                        )
+                        await notify_file_problem(rendering.render_artifact_mismatch(str(e)), uploading=True)
                     except Exception as e:
-                        error_msg = f"⚠️ An error occurred while sending the build file: `{escape_markdown_v2(str(e))}`"
-                        logger.error(f"Error sending local artifact for job {job_name} build {build_number}: {e}", exc_info=True)
-                        await bot.send_message(group_id, error_msg, parse_mode=ParseMode.MARKDOWN_V2)
+                        metrics.UPLOAD_SECONDS.observe(time.perf_counter() - upload_started_at, result='error')
+                        error_msg = rendering.render_upload_error(e)
+                        logger.error(
+                            f"Error sending build file {source} for job {job_name} build {build_number}: {e}", exc_info=True,
+                            extra={'job': job_name, 'build': build_number, 'chat_id': upload_chat_id}
+                        )
+                        await notify_file_problem(error_msg, uploading=True)
 
+                elif mismatch:
+                    logger.error(f"Not sending build file for {job_name} #{build_number}: {mismatch}")
+                    await notify_file_problem(rendering.render_artifact_mismatch(mismatch))
                 elif local_build_file_path:
-                    # File path was in properties but not found on disk
-                    error_msg = f"⚠️ Error: Build file specified but not found at path: `{escape_markdown_v2(local_build_file_path)}`\\. Please check permissions and path accessibility for the bot\\."
-                    logger.error(f"File path from properties not found on disk: {local_build_file_path}")
-                    await bot.send_message(group_id, error_msg, parse_mode=ParseMode.MARKDOWN_V2)
+                    # Không có trên đĩa của bot và cũng không được archive trên Jenkins
+                    error_msg = rendering.render_artifact_not_found(local_build_file_path)
+                    logger.error(f"Build file {local_build_file_path} is neither on disk nor archived for {job_name} #{build_number}")
+                    await notify_file_problem(error_msg)
                 else:
                     # LATEST_BUILD_FILE was not in properties file
                     logger.info(f"No 'LATEST_BUILD_FILE' property found for job {job_name}, build {build_number}. Skipping file sending.")
-                    await bot.send_message(group_id, "Build successful, but no artifact file was specified to be sent\\.", parse_mode=ParseMode.MARKDOWN_V2)
+                    await notify_file_problem(rendering.NO_ARTIFACT_MESSAGE)
 
         else:
             # --- Gửi tin nhắn thất bại ---
-            message_text = (
-                f"❌ *Build Failed\!*\n\n"
-                f"*Job:* `{job_name_md}`\n"
-                f"*Build:* `#{build_number}`\n"
-                f"*Status:* `{status_md}`\n\n"
-                f"{links_md}"
-            )
-            await bot.send_message(
-                group_id, 
+            message_text = rendering.render_build_failure(job_name, build_number, status, links_md)
+            sent_messages = await fanout.send_to_all(recipients, lambda chat_id: bot.send_message(
+                chat_id, 
                 message_text, 
                 parse_mode=ParseMode.MARKDOWN_V2, 
-                disable_web_page_preview=True
-            )
+                disable_web_page_preview=True,
+                reply_markup=reply_markup
+            ))
+
+            # --- Đính kèm các dòng lỗi trích từ log (gửi tin nhắn trước để không phải chờ tải log) ---
+            if FAILURE_EXCERPT_LINES > 0:
+                error_lines = await _collect_failure_excerpt(creds, jenkins_url, job_name, build_number, build_target)
+                if error_lines:
+                    await fanout.edit_all(
+                        bot, sent_messages, message_text + rendering.render_error_excerpt(error_lines),
+                        parse_mode=ParseMode.MARKDOWN_V2,
+                        disable_web_page_preview=True,
+                        reply_markup=reply_markup
+                    )
 
     except Exception as e:
-        logger.error(f"BACKGROUND TASK: Failed for job {job_name}: {e}", exc_info=True)
+        logger.error(f"BACKGROUND TASK: Failed for job {job_name}: {e}", exc_info=True, extra={'job': job_name})
         # Attempt to notify group about the error
         try:
             if 'group_id' in locals():
                 await bot.send_message(locals()['group_id'], f"An internal error occurred while processing the build result.")
         except Exception as notify_e:
             logger.error(f"Failed to even notify the group about the error: {notify_e}")
+    finally:
+        metrics.NOTIFICATION_SECONDS.observe(time.perf_counter() - started_at, status=metrics.build_status_label(status))